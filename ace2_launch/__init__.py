@@ -0,0 +1,16 @@
+"""Shared launcher for the beaker experiments defined under experiments/.
+
+Install it from the repository root with `pip install -e .`, then submit the
+experiments of a launcher script with e.g.
+
+    ace2-launch submit experiments/evaluator-era5-main --only 'era5-co2-10yr-*'
+
+or equivalently with `python -m ace2_launch` or by running the script itself.
+
+Only the standard library and yaml are imported up front. beaker, dacite and
+fme are imported when configs are validated or experiments are submitted.
+"""
+
+from .config import Experiment, JobConfig, experiments_from_overlays, merge_configs
+from .matrix import ExperimentMatrix, Variant
+from .script import LaunchScript, load_script
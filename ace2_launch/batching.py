@@ -0,0 +1,341 @@
+"""Coalescing of experiments which differ only in their initial conditions.
+
+The fme evaluator and inference entrypoints run every start time listed under
+start_indices.times as one batch, so experiments whose configs are otherwise
+identical can share a single job, loading the checkpoint and reading forcing
+data once. The batched job writes its outputs with a "sample" dimension in the
+order of its start times, and a record of which sample belongs to which of the
+original experiments is kept locally so the outputs can be split back apart.
+
+Outputs with a sample dimension are split into per-IC result directories
+named after the original experiments by split_batch_results, which is run by
+`python -m ace2_launch split` once the batch's results are downloaded. The
+batched job logs a single wandb run named after the batch (e.g. "run-IC0_1_2"),
+not one per initial condition, and metrics which it aggregates over samples
+(e.g. time-mean RMSE) are means over the batch and cannot be split per initial
+condition, so batching is opt-in.
+
+Experiments which set their own wandb name or ID, or continue an earlier run,
+are never batched, as one job cannot keep these per initial condition.
+
+Experiments whose configs differ only in their forcing perturbations, e.g. the
+amplitudes of a uniform SST offset, can instead be coalesced by
+batch_perturbations into one job running each as a concurrent process with its
+own perturbations, wandb run and output directory.
+"""
+
+import copy
+import dataclasses
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import yaml
+
+from .cache import config_hash, get_cache_dir, write_atomic
+from .config import Experiment, PerturbationMember
+from .script import LaunchScript
+
+if TYPE_CHECKING:
+    import xarray as xr
+
+# evaluator and inference configs respectively
+START_TIMES_PATHS = (
+    ("loader", "start_indices", "times"),
+    ("initial_condition", "start_indices", "times"),
+)
+PERTURBATIONS_PATH = ("forcing_loader", "perturbations")
+SAMPLE_DIM = "sample"
+
+
+@dataclasses.dataclass
+class BatchMember:
+    """One of the experiments coalesced into a batch.
+
+    Attributes:
+        name: name of the original experiment.
+        start_time: its initial condition time.
+        sample: its index along the sample dimension of the batch's outputs.
+    """
+
+    name: str
+    start_time: str
+    sample: int
+
+
+@dataclasses.dataclass
+class ExperimentBatch:
+    experiment: Experiment
+    members: List[BatchMember]
+
+    @property
+    def name(self) -> str:
+        return self.experiment.name
+
+
+def _get_start_times_path(config: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    for path in START_TIMES_PATHS:
+        value: Any = config
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            return path
+    return None
+
+
+def _get(config: Dict[str, Any], path: Sequence[str]) -> Any:
+    for key in path:
+        config = config[key]
+    return config
+
+
+def get_start_times(config: Dict[str, Any]) -> Optional[List[str]]:
+    """Return the initial condition times of the config, if it lists any."""
+    path = _get_start_times_path(config)
+    if path is None:
+        return None
+    return _get(config, path)
+
+
+def _with_value(
+    config: Dict[str, Any], path: Sequence[str], value: Any
+) -> Dict[str, Any]:
+    config = copy.deepcopy(config)
+    parent = _get(config, path[:-1])
+    parent[path[-1]] = value
+    return config
+
+
+def get_batch_name(names: Sequence[str]) -> str:
+    """Join names on the part where they differ, e.g. "run-IC0" and "run-IC1"
+    become "run-IC0_1"."""
+    prefix = os.path.commonprefix(list(names))
+    max_suffix = min(len(name) for name in names) - len(prefix)
+    suffix = os.path.commonprefix([name[::-1] for name in names])[:max_suffix][::-1]
+    middles = [name[len(prefix) : len(name) - len(suffix)] for name in names]
+    return prefix + "_".join(middles) + suffix
+
+
+def batch_initial_conditions(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    max_batch_size: Optional[int] = None,
+) -> Tuple[List[Experiment], List[ExperimentBatch]]:
+    """Coalesce experiments whose configs differ only in a single start time
+    into batched experiments with one start time per member.
+
+    Experiments must also share a checkpoint and wandb run group to be batched,
+    and must not set a wandb name or ID or continue an earlier run.
+
+    Args:
+        script: launcher script the experiments belong to.
+        experiments: experiments to coalesce.
+        max_batch_size: maximum number of initial conditions per batch, e.g. to
+            keep within GPU memory. Defaults to no limit.
+
+    Returns:
+        The experiments to submit, with each batch in place of its first
+        member, and the batches.
+    """
+    groups: Dict[Any, List[Tuple[Experiment, Dict[str, Any]]]] = {}
+    order: List[Any] = []
+    for experiment in experiments:
+        config = script.get_config(experiment)
+        path = _get_start_times_path(config)
+        if (
+            path is not None
+            and len(_get(config, path)) == 1
+            and experiment.wandb_name is None
+            and experiment.wandb_id is None
+            and experiment.resume is None
+        ):
+            key: Any = (
+                path,
+                config_hash(_with_value(config, path, None)),
+                experiment.trained_model_dataset_id,
+                experiment.wandb_run_group,
+            )
+        else:
+            key = experiment.name  # cannot be batched
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((experiment, config))
+
+    result: List[Experiment] = []
+    batches: List[ExperimentBatch] = []
+    for key in order:
+        group = groups[key]
+        size = max_batch_size or len(group)
+        for i in range(0, len(group), size):
+            chunk = group[i : i + size]
+            if len(chunk) == 1:
+                result.append(chunk[0][0])
+                continue
+            batch = _get_batch(key[0], chunk)
+            result.append(batch.experiment)
+            batches.append(batch)
+    return result, batches
+
+
+def _get_batch(
+    path: Tuple[str, ...], chunk: Sequence[Tuple[Experiment, Dict[str, Any]]]
+) -> ExperimentBatch:
+    members = [
+        BatchMember(experiment.name, _get(config, path)[0], sample)
+        for sample, (experiment, config) in enumerate(chunk)
+    ]
+    first_experiment, first_config = chunk[0]
+    # the merged config is used as the overlay, which gives the same config
+    # whether or not the script deep merges overlays
+    overlay = _with_value(first_config, path, [m.start_time for m in members])
+    experiment = dataclasses.replace(
+        first_experiment,
+        name=get_batch_name([m.name for m in members]),
+        overlay=overlay,
+    )
+    return ExperimentBatch(experiment, members)
+
+
+def batch_perturbations(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    max_batch_size: Optional[int] = None,
+) -> List[Experiment]:
+    """Coalesce experiments whose configs differ only in their forcing
+    perturbations into experiments running each as a perturbation member.
+
+    Experiments must also share a checkpoint to be batched, and must not set a
+    wandb name or ID or continue an earlier run.
+
+    Args:
+        script: launcher script the experiments belong to.
+        experiments: experiments to coalesce.
+        max_batch_size: maximum number of members per job, e.g. to keep within
+            GPU memory. Defaults to no limit.
+
+    Returns:
+        The experiments to submit, with each batch in place of its first
+        member.
+    """
+    groups: Dict[Any, List[Tuple[Experiment, Dict[str, Any]]]] = {}
+    for experiment in experiments:
+        config = script.get_config(experiment)
+        if (
+            isinstance(config.get("forcing_loader"), dict)
+            and "perturbations" in config["forcing_loader"]
+            and experiment.wandb_name is None
+            and experiment.wandb_id is None
+            and experiment.resume is None
+            and experiment.perturbation_members is None
+        ):
+            key: Any = (
+                config_hash(_with_value(config, PERTURBATIONS_PATH, None)),
+                experiment.trained_model_dataset_id,
+            )
+        else:
+            key = experiment.name  # cannot be batched
+        groups.setdefault(key, []).append((experiment, config))
+
+    result: List[Experiment] = []
+    for group in groups.values():
+        size = max_batch_size or len(group)
+        for i in range(0, len(group), size):
+            chunk = group[i : i + size]
+            if len(chunk) == 1:
+                result.append(chunk[0][0])
+                continue
+            members = [
+                PerturbationMember(
+                    experiment.name,
+                    _get(config, PERTURBATIONS_PATH),
+                    wandb_run_group=experiment.wandb_run_group,
+                )
+                for experiment, config in chunk
+            ]
+            first_experiment, first_config = chunk[0]
+            result.append(
+                dataclasses.replace(
+                    first_experiment,
+                    name=get_batch_name([member.name for member in members]),
+                    # as in _get_batch, the same config whether or not the
+                    # script deep merges overlays
+                    overlay=first_config,
+                    perturbation_members=members,
+                )
+            )
+    return result
+
+
+def _get_batch_dir(directory: Optional[Path]) -> Path:
+    if directory is None:
+        directory = get_cache_dir() / "batches"
+    return Path(directory)
+
+
+def save_batch(batch: ExperimentBatch, directory: Optional[Path] = None):
+    """Record which sample of the batch belongs to which experiment."""
+    members = [dataclasses.asdict(member) for member in batch.members]
+    write_atomic(
+        _get_batch_dir(directory) / f"{batch.name}.yaml",
+        yaml.safe_dump({"name": batch.name, "members": members}).encode(),
+    )
+
+
+def load_batch_members(
+    name: str, directory: Optional[Path] = None
+) -> Optional[List[BatchMember]]:
+    """Return the members of the batched experiment with the given name, or None
+    if no batch with this name was submitted from this machine."""
+    try:
+        with open(_get_batch_dir(directory) / f"{name}.yaml") as f:
+            record = yaml.safe_load(f)
+    except FileNotFoundError:
+        return None
+    return [BatchMember(**member) for member in record["members"]]
+
+
+def split_batch_outputs(
+    ds: "xr.Dataset", members: Sequence[BatchMember], dim: str = SAMPLE_DIM
+) -> Dict[str, "xr.Dataset"]:
+    """Split outputs of a batched experiment which have a sample dimension,
+    such as its prediction files, into the outputs of each member."""
+    return {member.name: ds.isel({dim: member.sample}) for member in members}
+
+
+def split_batch_results(
+    results_dir: Path,
+    members: Sequence[BatchMember],
+    output_dir: Path,
+    dim: str = SAMPLE_DIM,
+) -> Dict[str, List[Path]]:
+    """Write each netCDF output of a batched experiment which has a sample
+    dimension to <output_dir>/<member name>/<filename> for each member.
+
+    Outputs without a sample dimension, such as metrics aggregated over the
+    batch, are left out as they cannot be split.
+
+    Args:
+        results_dir: directory of the batch's downloaded results.
+        members: members of the batch.
+        output_dir: directory of the per-member result directories.
+        dim: sample dimension of the outputs.
+
+    Returns:
+        The files written for each member.
+    """
+    import xarray as xr
+
+    written: Dict[str, List[Path]] = {member.name: [] for member in members}
+    for path in sorted(Path(results_dir).glob("*.nc")):
+        with xr.open_dataset(path) as ds:
+            if dim not in ds.dims:
+                continue
+            for name, member_ds in split_batch_outputs(ds, members, dim).items():
+                member_path = Path(output_dir) / name / path.name
+                member_path.parent.mkdir(parents=True, exist_ok=True)
+                member_ds.to_netcdf(member_path)
+                written[name].append(member_path)
+    return written
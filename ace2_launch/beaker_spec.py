@@ -0,0 +1,101 @@
+"""Construction of beaker experiment specs. beaker is only imported when
+get_experiment_spec is called, so that listing and validating experiments does
+not require it."""
+
+from typing import TYPE_CHECKING
+
+from .config import (
+    DATASET_CONFIG_MOUNTPATH,
+    PREVIOUS_RESULT_MOUNTPATH,
+    RESULT_PATH,
+    Experiment,
+    JobConfig,
+)
+
+if TYPE_CHECKING:
+    import beaker
+
+
+def get_experiment_spec(
+    job: JobConfig, experiment: Experiment, config_dataset_id: str
+) -> "beaker.ExperimentSpec":
+    """Return the beaker experiment spec running the given experiment, whose
+    config has been uploaded to the given dataset."""
+    import beaker
+
+    env_vars = [
+        beaker.EnvVar(name="WANDB_API_KEY", secret=job.wandb_api_key_secret),
+        beaker.EnvVar(name="WANDB_JOB_TYPE", value=job.wandb_job_type),
+        beaker.EnvVar(
+            name="WANDB_NAME", value=experiment.wandb_name or experiment.name
+        ),
+    ]
+    if experiment.wandb_id is not None:
+        # the same run is logged to by each segment of a job and by its
+        # continuations, so it may already exist
+        env_vars.append(beaker.EnvVar(name="WANDB_RUN_ID", value=experiment.wandb_id))
+        env_vars.append(beaker.EnvVar(name="WANDB_RESUME", value="allow"))
+    wandb_run_group = experiment.wandb_run_group or job.wandb_run_group
+    if wandb_run_group is not None:
+        env_vars.append(beaker.EnvVar(name="WANDB_RUN_GROUP", value=wandb_run_group))
+    if job.wandb_username is not None:
+        env_vars.append(beaker.EnvVar(name="WANDB_USERNAME", value=job.wandb_username))
+    datasets = [
+        beaker.DataMount(
+            source=beaker.DataSource(beaker=config_dataset_id),
+            mount_path=DATASET_CONFIG_MOUNTPATH,
+        ),
+        beaker.DataMount(
+            mount_path="/climate-default",
+            source=beaker.DataSource(weka="climate-default"),
+        ),
+    ]
+    trained_model_dataset_id = (
+        experiment.trained_model_dataset_id or job.trained_model_dataset_id
+    )
+    if trained_model_dataset_id is not None:
+        datasets.append(
+            beaker.DataMount(
+                mount_path="/ckpt.tar",
+                source=beaker.DataSource(beaker=trained_model_dataset_id),
+                sub_path=f"training_checkpoints/{job.checkpoint_name}",
+            )
+        )
+    for dataset_name, mount_path in job.extra_mounts.items():
+        datasets.append(
+            beaker.DataMount(
+                source=beaker.DataSource(beaker=dataset_name),
+                mount_path=mount_path,
+            )
+        )
+    if experiment.resume is not None:
+        datasets.append(
+            beaker.DataMount(
+                source=beaker.DataSource(beaker=experiment.resume.result_dataset_id),
+                mount_path=PREVIOUS_RESULT_MOUNTPATH,
+            )
+        )
+    spec = beaker.ExperimentSpec(
+        budget=job.budget,
+        description=job.description,
+        tasks=[
+            beaker.TaskSpec(
+                name=experiment.name,
+                image=beaker.ImageSource(beaker=job.image_name),
+                command=job.get_command(
+                    experiment.resume, experiment.perturbation_members
+                ),
+                result=beaker.ResultSpec(path=RESULT_PATH),
+                resources=beaker.TaskResources(
+                    gpu_count=job.gpu_count, shared_memory=job.shared_memory
+                ),
+                context=beaker.TaskContext(
+                    priority=job.priority, preemptible=job.preemptible
+                ),
+                constraints=beaker.Constraints(cluster=[job.cluster]),
+                env_vars=env_vars,
+                datasets=datasets,
+            )
+        ],
+    )
+    return spec
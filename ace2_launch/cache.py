@@ -0,0 +1,35 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict
+
+import yaml
+
+CACHE_DIR_ENV_VAR = "ACE2_LAUNCH_CACHE_DIR"
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "ace2_launch"
+
+
+def get_cache_dir() -> Path:
+    """Return the directory for the launcher's local state, which can be set
+    with the ACE2_LAUNCH_CACHE_DIR environment variable."""
+    return Path(os.environ.get(CACHE_DIR_ENV_VAR, DEFAULT_CACHE_DIR))
+
+
+def canonical_yaml(config: Dict[str, Any]) -> str:
+    """Return a YAML representation of the config which does not depend on
+    the order of its keys."""
+    return yaml.safe_dump(config, sort_keys=True, default_flow_style=False)
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    return hashlib.sha256(canonical_yaml(config).encode()).hexdigest()
+
+
+def write_atomic(path: Path, data: bytes):
+    """Write data to path such that readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
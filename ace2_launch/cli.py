@@ -0,0 +1,874 @@
+import argparse
+import dataclasses
+import itertools
+import textwrap
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import yaml
+
+from .batching import (
+    ExperimentBatch,
+    batch_initial_conditions,
+    batch_perturbations,
+    load_batch_members,
+    save_batch,
+    split_batch_results,
+)
+from .config import Experiment, JobConfig
+from .config_datasets import (
+    BeakerConfigDatasetBackend,
+    ConfigDatasetIndex,
+    ConfigDatasetStore,
+    LocalConfigDatasetBackend,
+)
+from .ledger import LedgerEntry, SubmissionLedger, generate_wandb_id
+from .planning import (
+    DEFAULT_GPU_MEMORY,
+    DEFAULT_MAX_SEGMENT_OUTPUT,
+    DEFAULT_MAX_SEGMENT_YEARS,
+    DEFAULT_N_CHANNELS,
+)
+from .resume import BeakerResultStore, LocalResultStore, ResultStore, plan_resume
+from .script import LaunchScript, load_script
+from .submit import (
+    CREATED,
+    FAILED,
+    BeakerExperimentBackend,
+    ExperimentBackend,
+    FakeExperimentBackend,
+    SubmissionResult,
+    submit_experiments,
+)
+from .sweep import (
+    DEFAULT_BATCH_SIZES,
+    DEFAULT_BENCHMARK_STEPS,
+    DEFAULT_FORWARD_STEPS_IN_MEMORY,
+    DEFAULT_NUM_DATA_WORKERS,
+    SweepPoint,
+    get_sweep_points,
+)
+
+
+def validate_experiments(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+):
+    """Validate the experiments' configs, exiting if any are invalid.
+
+    The experiments are iterated lazily, and a second time to report the configs
+    of invalid experiments, so they must not be a one-shot iterator.
+    """
+    from .validate import ValidationCache, validate_configs
+
+    config_type = script.job.config_type
+    if config_type is None:
+        print("Launcher script does not validate configs, skipping validation.")
+        return
+    print("Validating that configs have correct types.")
+    n_experiments = 0
+
+    def get_configs():
+        nonlocal n_experiments
+        for experiment in experiments:
+            n_experiments += 1
+            yield experiment.name, script.get_config(experiment)
+
+    errors = validate_configs(
+        config_type,
+        get_configs(),
+        max_workers=max_workers,
+        cache=ValidationCache() if use_cache else None,
+    )
+    if len(errors) > 0:
+        for experiment in experiments:
+            if experiment.name in errors:
+                print(
+                    f"Config for experiment {experiment.name} is invalid:\n"
+                    f"{script.get_config(experiment)}\n{errors[experiment.name]}"
+                )
+        raise SystemExit(f"{len(errors)} of {n_experiments} configs are invalid.")
+    print(f"All {n_experiments} configs are valid.")
+
+
+def submit(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    max_concurrency: int,
+    max_attempts: int,
+    offline_dir: Optional[str] = None,
+    on_result: Optional[Callable[[Experiment, SubmissionResult], None]] = None,
+) -> List[SubmissionResult]:
+    """Submit to beaker, or to local stand-ins if offline_dir is given."""
+    if offline_dir is None:
+        import beaker
+
+        client = beaker.Beaker.from_env()
+        store = ConfigDatasetStore(BeakerConfigDatasetBackend(client))
+        backend: ExperimentBackend = BeakerExperimentBackend(client)
+    else:
+        dataset_backend = LocalConfigDatasetBackend(Path(offline_dir) / "datasets")
+        store = ConfigDatasetStore(
+            dataset_backend,
+            ConfigDatasetIndex(dataset_backend.name, Path(offline_dir) / "index"),
+        )
+        backend = FakeExperimentBackend(directory=Path(offline_dir) / "experiments")
+    return submit_experiments(
+        script,
+        experiments,
+        backend,
+        store,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        on_result=on_result,
+    )
+
+
+def get_ledger(offline_dir: Optional[str]) -> SubmissionLedger:
+    if offline_dir is None:
+        return SubmissionLedger()
+    return SubmissionLedger(Path(offline_dir) / "ledger.sqlite")
+
+
+def assign_wandb_ids(
+    job: JobConfig, experiments: Iterable[Experiment], ledger: SubmissionLedger
+) -> Iterator[Experiment]:
+    """Choose the wandb run ID of each experiment before submitting it, reusing
+    the run of the original experiment for continuations.
+
+    New IDs are only chosen for new inference experiments. Training jobs are
+    left to fme, which manages their run across restarts. Jobs running
+    perturbation members get an ID for each member instead of one of their own.
+    """
+    for experiment in experiments:
+        if experiment.perturbation_members is not None:
+            members = [
+                dataclasses.replace(
+                    member,
+                    wandb_id=member.wandb_id
+                    or (
+                        generate_wandb_id()
+                        if job.wandb_job_type == "inference"
+                        else None
+                    ),
+                )
+                for member in experiment.perturbation_members
+            ]
+            yield dataclasses.replace(experiment, perturbation_members=members)
+            continue
+        wandb_id = experiment.wandb_id
+        if wandb_id is None and experiment.resume is not None:
+            original = ledger.get(experiment.wandb_name or experiment.name)
+            if original is not None:
+                wandb_id = original.wandb_id
+        elif wandb_id is None and job.wandb_job_type == "inference":
+            wandb_id = generate_wandb_id()
+        yield dataclasses.replace(experiment, wandb_id=wandb_id)
+
+
+def record_submission(
+    script: LaunchScript,
+    experiment: Experiment,
+    result: SubmissionResult,
+    ledger: SubmissionLedger,
+):
+    if result.status == CREATED:
+        # perturbation members are recorded under their own names, so that
+        # their wandb runs can be found from the original experiment names
+        runs = [(experiment.name, experiment.wandb_id)] + [
+            (member.name, member.wandb_id)
+            for member in experiment.perturbation_members or []
+        ]
+        for name, wandb_id in runs:
+            ledger.record(
+                LedgerEntry(
+                    name,
+                    script=str(script.path),
+                    config_hash=result.config_hash,
+                    config_dataset_id=result.config_dataset_id,
+                    experiment_id=result.experiment_id,
+                    wandb_id=wandb_id,
+                )
+            )
+
+
+def show_ledger(
+    experiments: Iterable[Experiment],
+    ledger: SubmissionLedger,
+    refresh: bool,
+    offline: bool,
+):
+    """Print the ledger entries of the experiments, optionally first looking up
+    result dataset IDs of newly scheduled jobs."""
+    if refresh and not offline:
+        import beaker
+
+        from .ledger import refresh_result_ids
+
+        n_updated = refresh_result_ids(ledger, beaker.Beaker.from_env())
+        print(f"Found result datasets of {n_updated} experiments.")
+    print("experiment  experiment_id  result_dataset_id  wandb_id  config_hash")
+    for experiment in experiments:
+        entry = ledger.get(experiment.name)
+        if entry is None:
+            print(f"{experiment.name}  not submitted from this machine")
+        else:
+            print(
+                f"{entry.name}  {entry.experiment_id}  {entry.result_dataset_id}  "
+                f"{entry.wandb_id}  {(entry.config_hash or '')[:16]}"
+            )
+
+
+def get_result_store(script: LaunchScript, offline_dir: Optional[str]) -> ResultStore:
+    if offline_dir is None:
+        import beaker
+
+        return BeakerResultStore(beaker.Beaker.from_env(), script.job.workspace)
+    return LocalResultStore(Path(offline_dir) / "results")
+
+
+def get_continuations(
+    script: LaunchScript, experiments: Iterable[Experiment], store: ResultStore
+) -> Iterator[Experiment]:
+    """Return continuations of the partially completed experiments, reporting
+    on the others."""
+    for experiment in experiments:
+        plan = plan_resume(script, experiment, store)
+        progress = f"{plan.n_completed}/{plan.n_segments} segments"
+        if plan.is_complete:
+            print(f"Experiment {experiment.name} is complete ({progress}).")
+        elif plan.n_completed == 0:
+            print(f"Experiment {experiment.name} has no completed segments.")
+        else:
+            continuation = plan.get_continuation()
+            print(
+                f"Experiment {experiment.name} completed {progress}, continuing "
+                f"from {plan.result_id} as {continuation.name}."
+            )
+            yield continuation
+
+
+def plan_experiments(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    grid: str,
+    gpu_memory: str,
+    max_segment_output: str,
+    max_segment_years: float,
+    n_channels: int,
+):
+    """Print a memory plan and the overlay implementing it for each experiment."""
+    from .planning import format_plan, parse_grid, plan_memory
+    from .sweep import TunedSettings, get_dataset_path
+
+    if script.job.config_type == "TrainConfig":
+        raise SystemExit("Only inference experiments can be planned.")
+    settings = TunedSettings()
+    for experiment in experiments:
+        config = script.get_config(experiment)
+        plan = plan_memory(
+            experiment.name,
+            config,
+            parse_grid(grid),
+            script.job.shared_memory,
+            segments=script.job.segments,
+            gpu_memory=gpu_memory,
+            max_segment_output=max_segment_output,
+            max_segment_years=max_segment_years,
+            n_channels=n_channels,
+        )
+        print(format_plan(plan, config))
+        print("  overlay:")
+        print(textwrap.indent(yaml.safe_dump(plan.overlay), "    "), end="")
+        if plan.n_segments is not None:
+            print(f"  JobConfig: segments={plan.n_segments}")
+        tuned = settings.get(get_dataset_path(config) or "", grid)
+        if tuned is not None:
+            print(
+                f"  fastest in sweep {tuned.experiment}: "
+                f"num_data_workers={tuned.num_data_workers}, "
+                f"forward_steps_in_memory={tuned.forward_steps_in_memory}, "
+                f"batch_size={tuned.batch_size}"
+            )
+
+
+def estimate_experiments(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    grid: str,
+    n_channels: int,
+    max_gpu_hours: float,
+    max_output: str,
+):
+    """Print the estimated cost of each experiment, flagging expensive ones."""
+    from .estimate import RunLedger, estimate_cost
+    from .planning import format_bytes, parse_bytes, parse_grid
+
+    if script.job.config_type == "TrainConfig":
+        raise SystemExit("Only inference experiments can be estimated.")
+    n_lat, n_lon = parse_grid(grid)
+    throughput, n_runs = RunLedger().get_throughput(n_lat * n_lon)
+    source = f"median of {n_runs} past runs" if n_runs > 0 else "default"
+    print(f"Throughput: {throughput:.2f} sample-steps/s ({source}).")
+    estimates = [
+        estimate_cost(
+            experiment.name,
+            script.get_config(experiment),
+            (n_lat, n_lon),
+            throughput,
+            segments=script.job.segments,
+            gpu_count=script.job.gpu_count,
+            n_channels=n_channels,
+        )
+        for experiment in experiments
+    ]
+    width = max(len(estimate.name) for estimate in estimates)
+    print(
+        f"  {'experiment':<{width}}  samples     steps  wall-hours  gpu-hours"
+        "     output"
+    )
+    n_flagged = 0
+    for estimate in estimates:
+        flagged = (
+            estimate.gpu_hours > max_gpu_hours
+            or estimate.output_bytes > parse_bytes(max_output)
+        )
+        n_flagged += flagged
+        print(
+            f"{'!' if flagged else ' '} {estimate.name:<{width}}  "
+            f"{estimate.n_samples:>7}  {estimate.n_steps:>8}  "
+            f"{estimate.wall_hours:>10.1f}  {estimate.gpu_hours:>9.1f}  "
+            f"{format_bytes(estimate.output_bytes):>9}"
+        )
+    total_gpu_hours = sum(estimate.gpu_hours for estimate in estimates)
+    total_bytes = sum(estimate.output_bytes for estimate in estimates)
+    print(
+        f"Total: {total_gpu_hours:.1f} GPU-hours, {format_bytes(total_bytes)} "
+        f"written. {n_flagged} experiment(s) exceed {max_gpu_hours} GPU-hours "
+        f"or {max_output} of output."
+    )
+
+
+def record_run(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    grid: str,
+    wall_hours: float,
+):
+    """Add a completed run to the ledger used to calibrate estimates."""
+    from .estimate import RunLedger, RunRecord, get_run_size
+    from .planning import parse_grid
+
+    # only look far enough to tell whether exactly one is selected
+    experiments = list(itertools.islice(experiments, 2))
+    if len(experiments) != 1:
+        raise SystemExit(
+            "Select exactly one experiment to record, got "
+            f"{'none' if len(experiments) == 0 else 'more than one'}."
+        )
+    n_lat, n_lon = parse_grid(grid)
+    experiment = experiments[0]
+    n_samples, n_steps = get_run_size(
+        script.get_config(experiment), script.job.segments
+    )
+    record = RunRecord(experiment.name, n_lat * n_lon, n_samples, n_steps, wall_hours)
+    RunLedger().add(record)
+    print(f"Recorded {experiment.name}: {record.throughput:.2f} sample-steps/s.")
+
+
+def get_sweeps(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    points: Sequence[SweepPoint],
+    n_forward_steps: int,
+) -> Dict[str, List[Tuple[Experiment, SweepPoint]]]:
+    """Return the benchmark experiments of the sweep of each experiment."""
+    from .sweep import get_sweep_experiments
+
+    if script.job.config_type == "TrainConfig":
+        raise SystemExit("Only inference experiments can be swept.")
+    try:
+        return {
+            experiment.name: get_sweep_experiments(
+                script, experiment, points, n_forward_steps
+            )
+            for experiment in experiments
+        }
+    except ValueError as err:
+        raise SystemExit(str(err))
+
+
+def collect_sweeps(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    sweeps: Dict[str, List[Tuple[Experiment, SweepPoint]]],
+    grid: str,
+    logs_dir: Optional[str],
+):
+    """Print the throughput of each sweep point and record the fastest point
+    of each sweep for its dataset and grid."""
+    from .sweep import (
+        BeakerLogSource,
+        LocalLogSource,
+        LogSource,
+        TunedSetting,
+        TunedSettings,
+        get_dataset_path,
+        get_fastest,
+        parse_benchmark_log,
+    )
+
+    if logs_dir is None:
+        import beaker
+
+        source: LogSource = BeakerLogSource(
+            beaker.Beaker.from_env(), script.job.workspace
+        )
+    else:
+        source = LocalLogSource(Path(logs_dir))
+    settings = TunedSettings()
+    for experiment in experiments:
+        results = []
+        print(f"Sweep of {experiment.name}:")
+        print("  point           steps/s  loader wait")
+        for benchmark, point in sweeps[experiment.name]:
+            log = source.get_log(benchmark.name)
+            result = None if log is None else parse_benchmark_log(
+                benchmark.name, point, log
+            )
+            if result is None:
+                print(f"  {point.label:<14}  no throughput logged")
+                continue
+            results.append(result)
+            wait = result.loader_wait_fraction
+            print(
+                f"  {point.label:<14}  {result.steps_per_second:>7.2f}  "
+                f"{'-' if wait is None else f'{wait:.0%}':>11}"
+            )
+        if len(results) == 0:
+            continue
+        fastest = get_fastest(results)
+        config = script.get_config(experiment)
+        dataset = get_dataset_path(config)
+        print(f"  fastest: {fastest.point.label}")
+        if dataset is None:
+            print("  config has no data path, not recording the fastest point")
+            continue
+        setting = TunedSetting(
+            dataset=dataset,
+            grid=grid,
+            num_data_workers=fastest.point.num_data_workers,
+            forward_steps_in_memory=fastest.point.forward_steps_in_memory,
+            batch_size=fastest.point.batch_size,
+            steps_per_second=fastest.steps_per_second,
+            experiment=fastest.name,
+        )
+        settings.set(setting)
+        print(f"  recorded for {dataset} on the {grid} grid, overlay:")
+        print(
+            textwrap.indent(yaml.safe_dump(setting.get_overlay(config)), "    "),
+            end="",
+        )
+
+
+def list_experiments(script: LaunchScript, experiments: Iterable[Experiment]):
+    for experiment in experiments:
+        print(experiment.name)
+
+
+def print_batches(batches: Sequence[ExperimentBatch]):
+    for batch in batches:
+        print(f"Batched experiment {batch.name} runs:")
+        for member in batch.members:
+            print(f"  sample {member.sample}: {member.name} ({member.start_time})")
+
+
+def print_perturbation_batches(experiments: Iterable[Experiment]):
+    for experiment in experiments:
+        if experiment.perturbation_members is not None:
+            print(f"Batched experiment {experiment.name} runs:")
+            for member in experiment.perturbation_members:
+                print(f"  {member.name}: {member.perturbations}")
+
+
+def split_batches(experiments: Iterable[Experiment], results: str, output: str):
+    """Split the downloaded results of batched experiments, found in
+    <results>/<batch name>, into per-IC result directories under output.
+
+    Batches are split as recorded when they were submitted, rather than as the
+    script would batch its experiments now, and only if one of their members is
+    among the experiments.
+    """
+    names = {experiment.name for experiment in experiments}
+    for results_dir in sorted(Path(results).iterdir()):
+        if not results_dir.is_dir():
+            continue
+        members = load_batch_members(results_dir.name)
+        if members is None:
+            print(
+                f"No batch {results_dir.name} was submitted from this machine, "
+                "skipping."
+            )
+            continue
+        if not any(member.name in names for member in members):
+            continue
+        written = split_batch_results(results_dir, members, Path(output))
+        for name, paths in written.items():
+            print(f"Wrote {len(paths)} files of {name} to {Path(output) / name}")
+
+
+def submit_and_record(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    args: argparse.Namespace,
+    batches: Sequence[ExperimentBatch] = (),
+    resume: bool = False,
+):
+    """Validate and submit the experiments, recording each in the ledger as its
+    submission completes."""
+    validate_experiments(
+        script, experiments, max_workers=args.jobs, use_cache=not args.no_cache
+    )
+    for batch in batches:
+        save_batch(batch)
+    if resume:
+        experiments = get_continuations(
+            script, experiments, get_result_store(script, args.offline)
+        )
+    ledger = get_ledger(args.offline)
+    print("Starting experiment submission.")
+    results = submit(
+        script,
+        assign_wandb_ids(script.job, experiments, ledger),
+        max_concurrency=args.concurrency,
+        max_attempts=args.max_attempts,
+        offline_dir=args.offline,
+        on_result=lambda experiment, result: record_submission(
+            script, experiment, result, ledger
+        ),
+    )
+    if len(results) == 0:
+        print("No experiments to continue." if resume else "No experiments.")
+        return
+    if any(result.status == FAILED for result in results):
+        raise SystemExit(1)
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="ace2-launch",
+        description="List, validate or submit the experiments of a launcher script.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help in [
+        ("list", "print the names of the selected experiments"),
+        ("validate", "validate the configs of the selected experiments"),
+        (
+            "plan",
+            "suggest segments and forward_steps_in_memory which fit in memory",
+        ),
+        ("estimate", "estimate the wall time, GPU-hours and output size"),
+        ("record-run", "record the wall time of a completed run for estimates"),
+        ("submit", "validate, then submit the selected experiments to beaker"),
+        (
+            "split",
+            "split the downloaded results of batched experiments per initial "
+            "condition",
+        ),
+        ("ledger", "show the recorded IDs of submitted experiments"),
+        (
+            "sweep",
+            "list, submit or collect short benchmarks over data loader workers, "
+            "forward steps in memory and initial conditions per job",
+        ),
+    ]:
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument(
+            "script",
+            help=(
+                "launcher script, or a directory in which case its run.py is used"
+            ),
+        )
+        subparser.add_argument(
+            "--only",
+            action="append",
+            metavar="PATTERN",
+            help="only use experiments whose names match this glob pattern, "
+            "may be given more than once",
+        )
+        subparser.add_argument(
+            "--batch-ics",
+            action=argparse.BooleanOptionalAction,
+            default=None,
+            help="coalesce experiments which differ only in their initial "
+            "condition into one job per batch of initial conditions, defaults "
+            "to the launcher script's batch_initial_conditions",
+        )
+        subparser.add_argument(
+            "--batch-perturbations",
+            action=argparse.BooleanOptionalAction,
+            default=None,
+            help="coalesce experiments which differ only in their forcing "
+            "perturbations into one job running each as a concurrent process, "
+            "defaults to the launcher script's batch_perturbations",
+        )
+        subparser.add_argument(
+            "--max-batch-size",
+            type=int,
+            default=None,
+            help="maximum number of initial conditions or perturbations per "
+            "batched job",
+        )
+        if command in ("plan", "estimate", "record-run", "sweep"):
+            subparser.add_argument(
+                "--grid",
+                default="1deg",
+                help="'1deg', '4deg' or <n_lat>x<n_lon>",
+            )
+        if command in ("plan", "estimate"):
+            subparser.add_argument(
+                "--n-channels",
+                type=int,
+                default=DEFAULT_N_CHANNELS,
+                help="number of input and output channels of the model",
+            )
+        if command == "estimate":
+            subparser.add_argument(
+                "--max-gpu-hours",
+                type=float,
+                default=500.0,
+                help="flag experiments estimated to take more GPU-hours",
+            )
+            subparser.add_argument(
+                "--max-output",
+                default="1TiB",
+                help="flag experiments estimated to write more",
+            )
+        if command == "record-run":
+            subparser.add_argument(
+                "--wall-hours",
+                type=float,
+                required=True,
+                help="wall time of the completed run",
+            )
+        if command == "plan":
+            subparser.add_argument("--gpu-memory", default=DEFAULT_GPU_MEMORY)
+            subparser.add_argument(
+                "--max-segment-output",
+                default=DEFAULT_MAX_SEGMENT_OUTPUT,
+                help="maximum size of the output of each segment",
+            )
+            subparser.add_argument(
+                "--max-segment-years",
+                type=float,
+                default=DEFAULT_MAX_SEGMENT_YEARS,
+                help="maximum simulated years per segment, limiting the work "
+                "lost to a preemption",
+            )
+        if command == "sweep":
+            subparser.add_argument(
+                "--num-data-workers",
+                type=int,
+                nargs="+",
+                default=list(DEFAULT_NUM_DATA_WORKERS),
+            )
+            subparser.add_argument(
+                "--forward-steps-in-memory",
+                type=int,
+                nargs="+",
+                default=list(DEFAULT_FORWARD_STEPS_IN_MEMORY),
+            )
+            subparser.add_argument(
+                "--batch-sizes",
+                type=int,
+                nargs="+",
+                default=list(DEFAULT_BATCH_SIZES),
+                help="numbers of initial conditions per job, only swept for "
+                "configs with start_indices.times",
+            )
+            subparser.add_argument(
+                "--benchmark-steps",
+                type=int,
+                default=DEFAULT_BENCHMARK_STEPS,
+                help="forward steps of each benchmark, rounded up to whole "
+                "windows of forward_steps_in_memory",
+            )
+            action = subparser.add_mutually_exclusive_group()
+            action.add_argument(
+                "--submit",
+                action="store_true",
+                help="validate, then submit the benchmarks",
+            )
+            action.add_argument(
+                "--collect",
+                action="store_true",
+                help="parse the throughput of finished benchmarks from their "
+                "logs and record the fastest setting of each dataset and grid",
+            )
+            subparser.add_argument(
+                "--logs",
+                metavar="DIR",
+                help="with --collect, read logs from <DIR>/<experiment>.log "
+                "instead of beaker",
+            )
+        if command in ("validate", "submit", "sweep"):
+            subparser.add_argument(
+                "--jobs",
+                type=int,
+                default=None,
+                help="number of processes validating configs, defaults to the "
+                "number of CPUs",
+            )
+            subparser.add_argument(
+                "--no-cache",
+                action="store_true",
+                help="validate every config, even those which passed before",
+            )
+        if command in ("submit", "ledger", "sweep"):
+            subparser.add_argument(
+                "--offline",
+                metavar="DIR",
+                help="use local stand-ins for beaker storing their state "
+                "in this directory, e.g. to benchmark submission",
+            )
+        if command == "ledger":
+            subparser.add_argument(
+                "--refresh",
+                action="store_true",
+                help="first look up result datasets of newly scheduled jobs",
+            )
+        if command in ("submit", "sweep"):
+            subparser.add_argument(
+                "--concurrency",
+                type=int,
+                default=8,
+                help="maximum number of submissions in flight",
+            )
+            subparser.add_argument(
+                "--max-attempts",
+                type=int,
+                default=5,
+                help="maximum attempts per submission on transient errors",
+            )
+        if command == "split":
+            subparser.add_argument(
+                "--results",
+                metavar="DIR",
+                required=True,
+                help="directory of the batches' results, in <DIR>/<batch name>",
+            )
+            subparser.add_argument(
+                "--output",
+                metavar="DIR",
+                required=True,
+                help="write the results of each IC to <DIR>/<experiment name>",
+            )
+        if command == "submit":
+            subparser.add_argument(
+                "--resume",
+                action="store_true",
+                help="instead of the experiments, submit continuations of those "
+                "whose segments were only partially completed",
+            )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = _get_parser().parse_args(argv)
+    script = load_script(args.script)
+    experiments: Iterable[Experiment] = script.select(args.only)
+    if next(iter(experiments), None) is None:
+        raise SystemExit(f"No experiments in {script.path} match {args.only}.")
+    batches: List[ExperimentBatch] = []
+    batch_ics = args.batch_ics
+    if batch_ics is None:
+        batch_ics = script.job.batch_initial_conditions
+    batch_members = args.batch_perturbations
+    if batch_members is None:
+        batch_members = script.job.batch_perturbations
+    if args.command == "split":
+        # batches are split as they were submitted
+        batch_ics = batch_members = False
+    if batch_members and batch_ics:
+        raise SystemExit(
+            "Initial conditions and perturbations cannot both be batched, pass "
+            "--no-batch-ics or --no-batch-perturbations."
+        )
+    if batch_ics:
+        experiments, batches = batch_initial_conditions(
+            script, experiments, max_batch_size=args.max_batch_size
+        )
+        print_batches(batches)
+    elif batch_members:
+        experiments = batch_perturbations(
+            script, experiments, max_batch_size=args.max_batch_size
+        )
+        print_perturbation_batches(experiments)
+    if args.command == "list":
+        list_experiments(script, experiments)
+    elif args.command == "plan":
+        plan_experiments(
+            script,
+            experiments,
+            grid=args.grid,
+            gpu_memory=args.gpu_memory,
+            max_segment_output=args.max_segment_output,
+            max_segment_years=args.max_segment_years,
+            n_channels=args.n_channels,
+        )
+    elif args.command == "estimate":
+        estimate_experiments(
+            script,
+            experiments,
+            grid=args.grid,
+            n_channels=args.n_channels,
+            max_gpu_hours=args.max_gpu_hours,
+            max_output=args.max_output,
+        )
+    elif args.command == "record-run":
+        record_run(script, experiments, grid=args.grid, wall_hours=args.wall_hours)
+    elif args.command == "ledger":
+        show_ledger(
+            experiments,
+            get_ledger(args.offline),
+            refresh=args.refresh,
+            offline=args.offline is not None,
+        )
+    elif args.command == "validate":
+        validate_experiments(
+            script, experiments, max_workers=args.jobs, use_cache=not args.no_cache
+        )
+    elif args.command == "sweep":
+        points = get_sweep_points(
+            args.num_data_workers, args.forward_steps_in_memory, args.batch_sizes
+        )
+        sweeps = get_sweeps(script, experiments, points, args.benchmark_steps)
+        if args.collect:
+            collect_sweeps(script, experiments, sweeps, args.grid, args.logs)
+            return
+        # benchmarks are short enough to run as a single segment
+        script = LaunchScript(
+            script.path,
+            dataclasses.replace(script.job, segments=None),
+            [benchmark for sweep in sweeps.values() for benchmark, _ in sweep],
+        )
+        list_experiments(script, script.select())
+        if args.submit:
+            submit_and_record(script, script.select(), args)
+    elif args.command == "split":
+        split_batches(experiments, args.results, args.output)
+    elif args.command == "submit":
+        submit_and_record(
+            script, experiments, args, batches=batches, resume=args.resume
+        )
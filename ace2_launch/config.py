@@ -0,0 +1,253 @@
+import dataclasses
+import json
+import shlex
+from typing import Any, Dict, List, Mapping, Optional
+
+DATASET_CONFIG_FILENAME = "config.yaml"
+DATASET_CONFIG_MOUNTPATH = "/configmount"
+PREVIOUS_RESULT_MOUNTPATH = "/previous-output"
+RESULT_PATH = "/output"
+# writes the config of a perturbation member, given the job's config path, the
+# member's config path, its perturbations as JSON and its experiment directory
+_WRITE_MEMBER_CONFIG = (
+    "import json, sys, yaml; "
+    "config = yaml.safe_load(open(sys.argv[1])); "
+    "config['forcing_loader']['perturbations'] = json.loads(sys.argv[3]); "
+    "config['experiment_dir'] = sys.argv[4]; "
+    "yaml.safe_dump(config, open(sys.argv[2], 'w'))"
+)
+
+
+@dataclasses.dataclass
+class SegmentResume:
+    """Completed segments of an earlier run of a segmented experiment. These are
+    copied into the output directory before running, and segmented inference
+    skips segments whose restart file already exists.
+
+    Attributes:
+        result_dataset_id: beaker dataset with the earlier run's outputs.
+        segment_dirs: names of the completed segment directories.
+    """
+
+    result_dataset_id: str
+    segment_dirs: List[str]
+
+
+@dataclasses.dataclass
+class PerturbationMember:
+    """An experiment run as one process of a job which evaluates several
+    forcing perturbations of an otherwise identical config.
+
+    Attributes:
+        name: name of the original experiment, used as its wandb run name and
+            as the directory of its outputs within the job's results.
+        perturbations: forcing_loader.perturbations of its config.
+        wandb_run_group: its wandb run group, if any.
+        wandb_id: its wandb run ID, or None to let wandb choose one.
+    """
+
+    name: str
+    perturbations: Dict[str, Any]
+    wandb_run_group: Optional[str] = None
+    wandb_id: Optional[str] = None
+
+
+@dataclasses.dataclass
+class JobConfig:
+    """Settings shared by every experiment submitted from one launcher script.
+
+    Attributes:
+        image_name: beaker image the task runs in.
+        description: beaker experiment description.
+        module: python module run with the config path as its only argument.
+        config_type: name of the fme.ace config class used to validate merged
+            configs, or None to submit without validating.
+        base_config_filename: base config, relative to the launcher script.
+        deep_merge: whether overlays are merged recursively into the base
+            config. If False, top-level keys of the overlay replace those of
+            the base config.
+        trained_model_dataset_id: beaker dataset with the checkpoint to mount
+            at /ckpt.tar, or None to mount no checkpoint.
+        checkpoint_name: name of the checkpoint within the trained model dataset.
+        segments: if given, passed to the module as "--segments".
+        nproc_per_node: if given, run the module with torchrun on this many
+            processes instead of with python.
+        extra_mounts: mapping from beaker dataset to mount path.
+        batch_initial_conditions: whether experiments differing only in their
+            initial condition are coalesced into batched jobs by default.
+        batch_perturbations: whether experiments differing only in their
+            forcing perturbations are coalesced into one job by default.
+        wandb_api_key_secret: beaker secret holding the wandb API key.
+        wandb_job_type: value of WANDB_JOB_TYPE.
+        wandb_run_group: value of WANDB_RUN_GROUP, if any.
+        wandb_username: value of WANDB_USERNAME, if any.
+        config_dataset_prefix: prefix of the uploaded config dataset names.
+        cluster: beaker cluster to run on.
+        priority: beaker job priority.
+        preemptible: whether the job may be preempted.
+        gpu_count: number of GPUs for the task.
+        shared_memory: shared memory for the task.
+        workspace: beaker workspace, or None for the default workspace.
+        budget: beaker budget the experiment is charged to.
+    """
+
+    image_name: str
+    description: str
+    module: str
+    config_type: Optional[str]
+    base_config_filename: str = "base-config.yaml"
+    deep_merge: bool = True
+    trained_model_dataset_id: Optional[str] = None
+    checkpoint_name: str = "best_inference_ckpt.tar"
+    segments: Optional[int] = None
+    nproc_per_node: Optional[int] = None
+    extra_mounts: Dict[str, str] = dataclasses.field(default_factory=dict)
+    batch_initial_conditions: bool = False
+    batch_perturbations: bool = False
+    wandb_api_key_secret: str = "wandb-api-key"
+    wandb_job_type: str = "inference"
+    wandb_run_group: Optional[str] = None
+    wandb_username: Optional[str] = None
+    config_dataset_prefix: str = "ace-inference-config-"
+    cluster: str = "ai2/jupiter-cirrascale-2"
+    priority: str = "high"
+    preemptible: bool = True
+    gpu_count: int = 1
+    shared_memory: str = "50GiB"
+    workspace: Optional[str] = None
+    budget: str = "ai2/climate"
+
+    @property
+    def command(self) -> List[str]:
+        return self.get_command()
+
+    def _get_module_command(self, config_path: str) -> List[str]:
+        if self.nproc_per_node is None:
+            command = ["python", "-m", self.module]
+        else:
+            command = [
+                "torchrun",
+                "--nproc_per_node",
+                str(self.nproc_per_node),
+                "-m",
+                self.module,
+            ]
+        command.append(config_path)
+        if self.segments is not None:
+            command.extend(["--segments", str(self.segments)])
+        return command
+
+    def get_command(
+        self,
+        resume: Optional[SegmentResume] = None,
+        perturbation_members: Optional[List[PerturbationMember]] = None,
+    ) -> List[str]:
+        config_path = f"{DATASET_CONFIG_MOUNTPATH}/{DATASET_CONFIG_FILENAME}"
+        if perturbation_members is not None:
+            return self._get_members_command(config_path, perturbation_members)
+        command = self._get_module_command(config_path)
+        if resume is not None:
+            sources = [
+                f"{PREVIOUS_RESULT_MOUNTPATH}/{segment_dir}"
+                for segment_dir in resume.segment_dirs
+            ]
+            copy_command = ["cp", "-r", *sources, RESULT_PATH]
+            command = [
+                "bash",
+                "-c",
+                f"mkdir -p {RESULT_PATH} && {shlex.join(copy_command)} && "
+                + shlex.join(command),
+            ]
+        return command
+
+    def _get_members_command(
+        self, config_path: str, members: List[PerturbationMember]
+    ) -> List[str]:
+        """Return a command running each member as a concurrent process on the
+        same GPU, writing its outputs to <RESULT_PATH>/<member name>, so that
+        the checkpoint is mounted once and forcing data read by one process is
+        served to the others from the page cache. Fails if any member fails."""
+        lines = ["pids=()"]
+        for i, member in enumerate(members):
+            member_config_path = f"/tmp/member-{i}.yaml"
+            lines.append(
+                shlex.join(
+                    [
+                        "python",
+                        "-c",
+                        _WRITE_MEMBER_CONFIG,
+                        config_path,
+                        member_config_path,
+                        json.dumps(member.perturbations),
+                        f"{RESULT_PATH}/{member.name}",
+                    ]
+                )
+                + " || exit 1"
+            )
+            env = [f"WANDB_NAME={member.name}"]
+            if member.wandb_run_group is not None:
+                env.append(f"WANDB_RUN_GROUP={member.wandb_run_group}")
+            if member.wandb_id is not None:
+                env.extend([f"WANDB_RUN_ID={member.wandb_id}", "WANDB_RESUME=allow"])
+            command = ["env", *env, *self._get_module_command(member_config_path)]
+            lines.append(f"{shlex.join(command)} & pids+=($!)")
+        lines.append(
+            'status=0; for pid in "${pids[@]}"; do wait "$pid" || status=1; done'
+        )
+        lines.append("exit $status")
+        return ["bash", "-c", "\n".join(lines)]
+
+
+@dataclasses.dataclass
+class Experiment:
+    """A single beaker experiment.
+
+    Attributes:
+        name: beaker experiment name, also used as the wandb run name.
+        overlay: configuration merged into the base config of the script.
+        trained_model_dataset_id: overrides the checkpoint dataset of the job.
+        wandb_run_group: overrides the wandb run group of the job.
+        wandb_name: overrides the wandb run name, which defaults to name.
+        wandb_id: wandb run ID, or None to let wandb choose one.
+        resume: completed segments of an earlier run to continue from.
+        perturbation_members: experiments run as concurrent processes of this
+            one, each with its own forcing perturbations, or None to run the
+            config once.
+    """
+
+    name: str
+    overlay: Dict[str, Any]
+    trained_model_dataset_id: Optional[str] = None
+    wandb_run_group: Optional[str] = None
+    wandb_name: Optional[str] = None
+    wandb_id: Optional[str] = None
+    resume: Optional[SegmentResume] = None
+    perturbation_members: Optional[List[PerturbationMember]] = None
+
+
+def experiments_from_overlays(
+    overlays: Mapping[str, Dict[str, Any]], **kwargs
+) -> List[Experiment]:
+    """Return an experiment for each name and overlay, with any given
+    Experiment attributes (e.g. trained_model_dataset_id) set on all of them.
+    """
+    return [Experiment(name, overlay, **kwargs) for name, overlay in overlays.items()]
+
+
+def merge_configs(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge nested configurations."""
+    base_copy = base.copy()  # don't modify the original base
+    for k, v in new.items():
+        if isinstance(v, dict):
+            base_copy[k] = merge_configs(base_copy.get(k, {}), v)
+        else:
+            base_copy[k] = v
+    return base_copy
+
+
+def apply_overlay(
+    base: Dict[str, Any], overlay: Dict[str, Any], deep_merge: bool = True
+) -> Dict[str, Any]:
+    if deep_merge:
+        return merge_configs(base, overlay)
+    return {**base, **overlay}
@@ -0,0 +1,150 @@
+"""Content-addressed storage of experiment configs.
+
+Each config is uploaded to a dataset named after the hash of its canonical
+YAML, and a local index maps hashes to dataset IDs, so an identical config is
+only ever uploaded once.
+"""
+
+import abc
+import collections
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from .cache import canonical_yaml, config_hash, get_cache_dir, write_atomic
+from .config import DATASET_CONFIG_FILENAME
+
+if TYPE_CHECKING:
+    import beaker
+
+# length of the config hash used in dataset names
+HASH_NAME_LENGTH = 16
+
+
+class ConfigDatasetBackend(abc.ABC):
+    """Somewhere config datasets can be uploaded to."""
+
+    #: name of the backend, used to keep separate indexes per backend
+    name: str
+
+    @abc.abstractmethod
+    def upload(self, dataset_name: str, content: bytes) -> str:
+        """Upload content as the config file of a dataset with the given name,
+        and return the dataset's ID. If a complete dataset with this name and
+        content already exists return its ID instead."""
+        ...
+
+
+class BeakerConfigDatasetBackend(ConfigDatasetBackend):
+    name = "beaker"
+
+    def __init__(self, client: "beaker.Beaker"):
+        self.client = client
+
+    def upload(self, dataset_name: str, content: bytes) -> str:
+        import beaker
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, DATASET_CONFIG_FILENAME)
+            with open(filepath, "wb") as f:
+                f.write(content)
+            try:
+                return self.client.dataset.create(dataset_name, filepath).id
+            except beaker.exceptions.DatasetConflict:
+                # uploaded before, but not by us or not recorded in our index
+                existing = self.client.dataset.get(dataset_name)
+                if self._is_complete(existing, content):
+                    return existing.id
+                # left behind by an interrupted upload, so upload it again
+                self.client.dataset.delete(existing)
+                return self.client.dataset.create(dataset_name, filepath).id
+
+    def _is_complete(self, dataset: "beaker.Dataset", content: bytes) -> bool:
+        """Whether the dataset was committed with content as its config file."""
+        if dataset.committed is None:
+            return False
+        try:
+            uploaded = self.client.dataset.get_file(
+                dataset, DATASET_CONFIG_FILENAME, quiet=True
+            )
+        except FileNotFoundError:
+            return False
+        return uploaded == content
+
+
+class LocalConfigDatasetBackend(ConfigDatasetBackend):
+    """Stand-in for beaker which stores each dataset as a local directory,
+    for testing without beaker access."""
+
+    name = "local"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.n_uploads = 0
+        self._lock = threading.Lock()
+
+    def upload(self, dataset_name: str, content: bytes) -> str:
+        path = self.directory / dataset_name / DATASET_CONFIG_FILENAME
+        if not path.exists():
+            write_atomic(path, content)
+            with self._lock:
+                self.n_uploads += 1
+        return dataset_name
+
+
+class ConfigDatasetIndex:
+    """Local mapping from config hash to config dataset ID, stored as one small
+    file per config so that concurrent writers never conflict."""
+
+    def __init__(self, backend_name: str, directory: Optional[Path] = None):
+        if directory is None:
+            directory = get_cache_dir() / "config-datasets"
+        self.directory = Path(directory) / backend_name
+
+    def _path(self, hash: str) -> Path:
+        return self.directory / hash[:2] / hash
+
+    def get(self, hash: str) -> Optional[str]:
+        try:
+            return self._path(hash).read_text()
+        except FileNotFoundError:
+            return None
+
+    def set(self, hash: str, dataset_id: str):
+        write_atomic(self._path(hash), dataset_id.encode())
+
+
+class ConfigDatasetStore:
+    """Returns a config dataset for each config, uploading only configs which
+    have not been uploaded before."""
+
+    def __init__(
+        self,
+        backend: ConfigDatasetBackend,
+        index: Optional[ConfigDatasetIndex] = None,
+    ):
+        self.backend = backend
+        if index is None:
+            index = ConfigDatasetIndex(backend.name)
+        self.index = index
+        self._locks: Dict[str, threading.Lock] = collections.defaultdict(
+            threading.Lock
+        )
+        self._locks_lock = threading.Lock()
+
+    def get_dataset_id(self, config: Dict[str, Any], prefix: str) -> str:
+        hash = config_hash(config)
+        # concurrent submissions of the same config should upload it once
+        with self._locks_lock:
+            lock = self._locks[hash]
+        with lock:
+            dataset_id = self.index.get(hash)
+            if dataset_id is None:
+                dataset_name = prefix + hash[:HASH_NAME_LENGTH]
+                dataset_id = self.backend.upload(
+                    dataset_name, canonical_yaml(config).encode()
+                )
+                self.index.set(hash, dataset_id)
+        return dataset_id
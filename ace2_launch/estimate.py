@@ -0,0 +1,135 @@
+"""Estimates of the wall time, GPU-hours and output size of inference runs.
+
+Throughput is measured in sample-steps per second, i.e. forward steps times
+initial conditions, which is treated as independent of the number of initial
+conditions run together. It is calibrated from a ledger of past runs with the
+same number of grid points, falling back to DEFAULT_THROUGHPUT.
+"""
+
+import dataclasses
+import json
+import statistics
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .batching import get_start_times
+from .cache import get_cache_dir
+from .planning import BYTES_PER_VALUE, DEFAULT_N_CHANNELS, estimate_output_bytes
+
+# sample-steps per second of ACE2 on one H100, by number of grid points
+DEFAULT_THROUGHPUT = {180 * 360: 1.7, 45 * 90: 12.0}
+# used for grids without a default or ledger entries, scaled by grid points
+_REFERENCE_GRID_POINTS = 180 * 360
+
+
+@dataclasses.dataclass
+class RunRecord:
+    """A completed run, used to calibrate throughput.
+
+    Attributes:
+        name: experiment name.
+        grid_points: number of horizontal grid points.
+        n_samples: number of initial conditions run together.
+        n_steps: forward steps over all segments.
+        wall_hours: wall time of the run.
+    """
+
+    name: str
+    grid_points: int
+    n_samples: int
+    n_steps: int
+    wall_hours: float
+
+    @property
+    def throughput(self) -> float:
+        return self.n_samples * self.n_steps / (self.wall_hours * 3600)
+
+
+class RunLedger:
+    """Past runs, stored as one JSON line per run."""
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is None:
+            path = get_cache_dir() / "runs.jsonl"
+        self.path = Path(path)
+
+    def add(self, record: RunRecord):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(dataclasses.asdict(record)) + "\n")
+
+    def records(self) -> List[RunRecord]:
+        try:
+            with open(self.path) as f:
+                return [RunRecord(**json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def get_throughput(self, grid_points: int) -> Tuple[float, int]:
+        """Return the median throughput of past runs on this grid and the number
+        of runs it is based on, or a default throughput and zero."""
+        throughputs = [
+            record.throughput
+            for record in self.records()
+            if record.grid_points == grid_points
+        ]
+        if len(throughputs) > 0:
+            return statistics.median(throughputs), len(throughputs)
+        if grid_points in DEFAULT_THROUGHPUT:
+            return DEFAULT_THROUGHPUT[grid_points], 0
+        reference = DEFAULT_THROUGHPUT[_REFERENCE_GRID_POINTS]
+        return reference * _REFERENCE_GRID_POINTS / grid_points, 0
+
+
+@dataclasses.dataclass
+class CostEstimate:
+    name: str
+    n_samples: int
+    n_steps: int
+    wall_hours: float
+    gpu_hours: float
+    output_bytes: int
+
+
+def get_run_size(
+    config: Dict[str, Any], segments: Optional[int] = None
+) -> Tuple[int, int]:
+    """Return the number of initial conditions and the total forward steps of
+    an inference config."""
+    start_times = get_start_times(config)
+    n_samples = 1 if start_times is None else len(start_times)
+    return n_samples, config["n_forward_steps"] * (segments or 1)
+
+
+def estimate_cost(
+    name: str,
+    config: Dict[str, Any],
+    grid: Tuple[int, int],
+    throughput: float,
+    segments: Optional[int] = None,
+    gpu_count: int = 1,
+    n_channels: int = DEFAULT_N_CHANNELS,
+) -> CostEstimate:
+    """Estimate the cost of an inference config.
+
+    Args:
+        name: experiment name.
+        config: merged evaluator or inference config.
+        grid: number of latitudes and longitudes.
+        throughput: sample-steps per second.
+        segments: number of segments the job runs, if segmented.
+        gpu_count: GPUs of the task.
+        n_channels: number of channels written if the data writer has no names.
+    """
+    n_samples, n_steps = get_run_size(config, segments)
+    wall_hours = n_samples * n_steps / throughput / 3600
+    output_bytes = estimate_output_bytes(
+        config.get("data_writer", {}),
+        n_steps,
+        n_samples,
+        grid[0] * grid[1] * BYTES_PER_VALUE,
+        n_channels,
+    )
+    return CostEstimate(
+        name, n_samples, n_steps, wall_hours, wall_hours * gpu_count, output_bytes
+    )
@@ -0,0 +1,157 @@
+"""Local record of submitted experiments, linking each experiment name to its
+config, beaker IDs and wandb run ID.
+
+The wandb run ID is chosen at submission and passed to the job as
+WANDB_RUN_ID, so it is known without waiting for the run to start. Result
+dataset IDs are only assigned once a job is scheduled, and are filled in later
+by refresh_result_ids.
+"""
+
+import dataclasses
+import datetime
+import secrets
+import sqlite3
+import string
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from .cache import get_cache_dir
+
+if TYPE_CHECKING:
+    import beaker
+
+_WANDB_ID_ALPHABET = string.ascii_lowercase + string.digits
+_WANDB_ID_LENGTH = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    name TEXT PRIMARY KEY,
+    script TEXT,
+    config_hash TEXT,
+    config_dataset_id TEXT,
+    experiment_id TEXT,
+    result_dataset_id TEXT,
+    wandb_id TEXT,
+    submitted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_config_hash ON submissions (config_hash);
+CREATE INDEX IF NOT EXISTS submissions_experiment_id ON submissions (experiment_id);
+CREATE INDEX IF NOT EXISTS submissions_wandb_id ON submissions (wandb_id);
+"""
+
+
+def generate_wandb_id() -> str:
+    """Return a random ID in the format wandb uses for run IDs."""
+    return "".join(
+        secrets.choice(_WANDB_ID_ALPHABET) for _ in range(_WANDB_ID_LENGTH)
+    )
+
+
+def get_default_ledger_path() -> Path:
+    return get_cache_dir() / "ledger.sqlite"
+
+
+@dataclasses.dataclass
+class LedgerEntry:
+    name: str
+    script: Optional[str] = None
+    config_hash: Optional[str] = None
+    config_dataset_id: Optional[str] = None
+    experiment_id: Optional[str] = None
+    result_dataset_id: Optional[str] = None
+    wandb_id: Optional[str] = None
+    submitted_at: Optional[str] = None
+
+
+_COLUMNS = [field.name for field in dataclasses.fields(LedgerEntry)]
+
+
+class SubmissionLedger:
+    """SQLite table of submitted experiments, keyed by experiment name."""
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is None:
+            path = get_default_ledger_path()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def record(self, entry: LedgerEntry):
+        """Insert or replace the entry for the experiment's name."""
+        if entry.submitted_at is None:
+            entry = dataclasses.replace(
+                entry,
+                submitted_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            )
+        values = dataclasses.asdict(entry)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO submissions ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [values[column] for column in _COLUMNS],
+            )
+
+    def update(self, name: str, **values: Optional[str]):
+        """Set columns of the entry for the given name."""
+        unknown = set(values) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown ledger columns {sorted(unknown)}")
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"UPDATE submissions SET {assignments} WHERE name = ?",
+                [*values.values(), name],
+            )
+
+    def _select(self, where: str = "", parameters: Iterable = ()) -> List[LedgerEntry]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM submissions {where}",
+                list(parameters),
+            ).fetchall()
+        return [LedgerEntry(*row) for row in rows]
+
+    def get(self, name: str) -> Optional[LedgerEntry]:
+        entries = self._select("WHERE name = ?", [name])
+        return entries[0] if entries else None
+
+    def entries(self) -> List[LedgerEntry]:
+        return self._select("ORDER BY submitted_at")
+
+    def get_wandb_ids(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Return the wandb run ID of each of the given names which is in the
+        ledger, which is None for experiments submitted without one."""
+        names = list(names)
+        entries = []
+        # stay below SQLite's limit on the number of parameters
+        for start in range(0, len(names), 500):
+            chunk = names[start : start + 500]
+            entries.extend(
+                self._select(f"WHERE name IN ({', '.join('?' * len(chunk))})", chunk)
+            )
+        return {entry.name: entry.wandb_id for entry in entries}
+
+
+def refresh_result_ids(ledger: SubmissionLedger, client: "beaker.Beaker") -> int:
+    """Fill in result dataset IDs of submitted experiments whose jobs have been
+    scheduled since, returning the number of entries updated."""
+    n_updated = 0
+    for entry in ledger.entries():
+        if entry.experiment_id is None or entry.result_dataset_id is not None:
+            continue
+        experiment = client.experiment.get(entry.experiment_id)
+        for job in reversed(experiment.jobs):
+            if job.execution is not None and job.execution.result is not None:
+                ledger.update(
+                    entry.name, result_dataset_id=job.execution.result.beaker
+                )
+                n_updated += 1
+                break
+    return n_updated
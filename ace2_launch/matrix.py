@@ -0,0 +1,152 @@
+"""Declarative matrices of experiments, e.g. every random seed crossed with
+every run length.
+
+A matrix is defined by named axes, each with labelled variants contributing an
+overlay fragment and optionally a checkpoint or wandb run group. Experiments
+are generated on demand when the matrix is iterated, by merging the fragments
+of one variant per axis in axis order, so a large matrix costs nothing until it
+is used.
+"""
+
+import dataclasses
+import itertools
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .cache import config_hash
+from .config import Experiment, merge_configs
+
+
+@dataclasses.dataclass
+class Variant:
+    """One value of a matrix axis.
+
+    Attributes:
+        label: substituted for the axis name in the name template.
+        overlay: fragment merged into the experiment's overlay.
+        trained_model_dataset_id: checkpoint of experiments with this variant.
+        wandb_run_group: wandb run group of experiments with this variant, which
+            may contain {axis} fields like the name template.
+    """
+
+    label: str
+    overlay: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    trained_model_dataset_id: Optional[str] = None
+    wandb_run_group: Optional[str] = None
+
+
+AxisSpec = Union[Mapping[str, Dict[str, Any]], Sequence[Variant]]
+
+
+def _get_variants(axis: AxisSpec) -> List[Variant]:
+    if isinstance(axis, Mapping):
+        return [Variant(label, overlay) for label, overlay in axis.items()]
+    return list(axis)
+
+
+class ExperimentMatrix:
+    """Every combination of one variant per axis, as experiments.
+
+    Iterating the matrix generates its experiments lazily, skipping any whose
+    overlay, checkpoint and run group are identical to an earlier one. Later
+    axes take precedence over earlier ones where their fragments overlap.
+
+    Args:
+        name_template: experiment name, with a {axis} field for each axis whose
+            variants should be distinguished by name.
+        axes: mapping from axis name to its variants, given either as
+            Variants or as a mapping from label to overlay fragment.
+        overlay: fragment shared by all experiments, merged first.
+        exclude: if given, combinations for which this returns True given
+            the mapping from axis name to label are skipped.
+        trained_model_dataset_id: checkpoint of experiments whose variants
+            do not set one.
+        wandb_run_group: run group of experiments whose variants do not set one,
+            which may contain {axis} fields.
+    """
+
+    def __init__(
+        self,
+        name_template: str,
+        axes: Mapping[str, AxisSpec],
+        overlay: Optional[Dict[str, Any]] = None,
+        exclude: Optional[Callable[[Dict[str, str]], bool]] = None,
+        trained_model_dataset_id: Optional[str] = None,
+        wandb_run_group: Optional[str] = None,
+    ):
+        self.name_template = name_template
+        self.axes = {name: _get_variants(axis) for name, axis in axes.items()}
+        self.overlay = overlay or {}
+        self.exclude = exclude
+        self.trained_model_dataset_id = trained_model_dataset_id
+        self.wandb_run_group = wandb_run_group
+        #: (skipped name, name of the identical experiment) from the last
+        #: iteration
+        self.duplicates: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        """Number of combinations, before exclusions and deduplication."""
+        n = 1
+        for variants in self.axes.values():
+            n *= len(variants)
+        return n
+
+    def _get_experiment(self, combination: Sequence[Variant]) -> Experiment:
+        labels = {name: v.label for name, v in zip(self.axes, combination)}
+        overlay = self.overlay
+        trained_model_dataset_id = self.trained_model_dataset_id
+        wandb_run_group = self.wandb_run_group
+        for variant in combination:
+            overlay = merge_configs(overlay, variant.overlay)
+            trained_model_dataset_id = (
+                variant.trained_model_dataset_id or trained_model_dataset_id
+            )
+            wandb_run_group = variant.wandb_run_group or wandb_run_group
+        return Experiment(
+            self.name_template.format(**labels),
+            overlay,
+            trained_model_dataset_id=trained_model_dataset_id,
+            wandb_run_group=(
+                None if wandb_run_group is None else wandb_run_group.format(**labels)
+            ),
+        )
+
+    def __iter__(self) -> Iterator[Experiment]:
+        self.duplicates = []
+        seen: Dict[str, str] = {}
+        names = set()
+        for combination in itertools.product(*self.axes.values()):
+            if self.exclude is not None and self.exclude(
+                {name: v.label for name, v in zip(self.axes, combination)}
+            ):
+                continue
+            experiment = self._get_experiment(combination)
+            key = config_hash(
+                {
+                    "overlay": experiment.overlay,
+                    "trained_model_dataset_id": experiment.trained_model_dataset_id,
+                    "wandb_run_group": experiment.wandb_run_group,
+                }
+            )
+            if key in seen:
+                self.duplicates.append((experiment.name, seen[key]))
+                continue
+            if experiment.name in names:
+                raise ValueError(
+                    f"Matrix generates different experiments named "
+                    f"{experiment.name}, add the axes which distinguish them to "
+                    f"the name template {self.name_template!r}"
+                )
+            seen[key] = experiment.name
+            names.add(experiment.name)
+            yield experiment
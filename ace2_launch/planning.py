@@ -0,0 +1,288 @@
+"""Choice of segment counts and forward_steps_in_memory from rough estimates of
+the memory and output size of an inference run.
+
+The estimates are deliberately simple and err on the side of caution:
+
+- every field is float32 on the given grid, one per initial condition;
+- the GPU holds the model plus GPU_COPIES_PER_STEP copies of every channel for
+  each step in memory (prediction, target and their normalized forms);
+- shared memory holds PREFETCH_FACTOR windows of every channel per data loader
+  worker, plus one window of the written variables waiting for the writer;
+- prediction files hold every time_coarsen-th step of the written variables,
+  and monthly files one monthly mean of them per month.
+
+Segmented inference runs n_forward_steps in each segment, so segmenting only
+changes how output is split between segments and how much work a preemption
+can lose. Segments are chosen so that each writes at most max_segment_output
+bytes and runs at most max_segment_years, and cover whole years if the run
+does.
+"""
+
+import dataclasses
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .batching import get_start_times
+
+BYTES_PER_VALUE = 4
+STEP_HOURS = 6
+HOURS_PER_MONTH = 730.5
+STEPS_PER_YEAR = 365 * 24 // STEP_HOURS
+PREFETCH_FACTOR = 2
+GPU_COPIES_PER_STEP = 4
+GPU_MODEL_BYTES = 8 * 2**30
+MEMORY_SAFETY_FRACTION = 0.8
+# channels of the ACE2 models, inputs plus outputs
+DEFAULT_N_CHANNELS = 60
+# upper limit on forward_steps_in_memory, beyond which larger values no longer
+# speed up inference noticeably
+MAX_FORWARD_STEPS_IN_MEMORY = 100
+DEFAULT_GPU_MEMORY = "80GiB"
+DEFAULT_MAX_SEGMENT_OUTPUT = "10GiB"
+DEFAULT_MAX_SEGMENT_YEARS = 100
+GRIDS = {"1deg": (180, 360), "4deg": (45, 90)}
+
+_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 10**3,
+    "MB": 10**6,
+    "GB": 10**9,
+    "TB": 10**12,
+    "KIB": 2**10,
+    "MIB": 2**20,
+    "GIB": 2**30,
+    "TIB": 2**40,
+}
+
+
+def parse_bytes(size: str) -> int:
+    """Parse a size such as "50GiB" or "100GB" into bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([A-Za-z]*)\s*", size)
+    if match is None or match.group(2).upper() not in _UNITS:
+        raise ValueError(f"Cannot parse size {size!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def format_bytes(n_bytes: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n_bytes) < 1024:
+            return f"{n_bytes:.1f}{unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f}TiB"
+
+
+def parse_grid(grid: str) -> Tuple[int, int]:
+    """Parse a grid given by name (e.g. "1deg") or as "<n_lat>x<n_lon>"."""
+    if grid in GRIDS:
+        return GRIDS[grid]
+    try:
+        n_lat, n_lon = grid.lower().split("x")
+        return int(n_lat), int(n_lon)
+    except ValueError:
+        raise ValueError(
+            f"Grid must be one of {sorted(GRIDS)} or <n_lat>x<n_lon>, got {grid!r}"
+        )
+
+
+@dataclasses.dataclass
+class MemoryPlan:
+    """Planned segmentation and steps in memory of one experiment.
+
+    Attributes:
+        name: experiment name.
+        n_samples: number of initial conditions run together.
+        total_steps: forward steps over all segments.
+        n_segments: number of segments, or None if the job is not segmented.
+        steps_per_segment: forward steps per segment.
+        forward_steps_in_memory: planned steps in memory.
+        output_bytes_per_segment: estimated bytes written per segment.
+        gpu_bytes: estimated peak GPU memory.
+        host_bytes: estimated peak shared memory.
+        warnings: problems the plan could not avoid.
+    """
+
+    name: str
+    n_samples: int
+    total_steps: int
+    n_segments: Optional[int]
+    steps_per_segment: int
+    forward_steps_in_memory: int
+    output_bytes_per_segment: int
+    gpu_bytes: int
+    host_bytes: int
+    warnings: List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def overlay(self) -> Dict[str, Any]:
+        overlay: Dict[str, Any] = {
+            "forward_steps_in_memory": self.forward_steps_in_memory
+        }
+        if self.n_segments is not None:
+            overlay["n_forward_steps"] = self.steps_per_segment
+        return overlay
+
+
+def _get_num_data_workers(config: Dict[str, Any]) -> int:
+    for key in ("loader", "forcing_loader"):
+        if key in config and "num_data_workers" in config[key]:
+            return config[key]["num_data_workers"]
+    return 1
+
+
+def _get_coarsen_factor(data_writer: Dict[str, Any]) -> int:
+    time_coarsen = data_writer.get("time_coarsen")
+    if time_coarsen is None:
+        return 1
+    if isinstance(time_coarsen, dict):
+        return time_coarsen.get("coarsen_factor", 1)
+    return int(time_coarsen)
+
+
+def estimate_output_bytes(
+    data_writer: Dict[str, Any],
+    n_steps: int,
+    n_samples: int,
+    field_bytes: int,
+    n_channels: int,
+) -> int:
+    """Estimate the bytes written by the data writer over n_steps."""
+    names = data_writer.get("names")
+    n_written = n_channels if names is None else len(names)
+    n_bytes = 0
+    if data_writer.get("save_prediction_files", True):
+        n_times = math.ceil(n_steps / _get_coarsen_factor(data_writer))
+        n_bytes += n_times * n_samples * n_written * field_bytes
+    if data_writer.get("save_monthly_files", True):
+        n_months = math.ceil(n_steps * STEP_HOURS / HOURS_PER_MONTH)
+        n_bytes += n_months * n_samples * n_written * field_bytes
+    return n_bytes
+
+
+def _get_n_segments(total_steps: int, n_needed: int) -> int:
+    """Return the smallest number of segments, at least n_needed, which splits
+    the run into whole years, or else into whole steps."""
+    unit = STEPS_PER_YEAR if total_steps % STEPS_PER_YEAR == 0 else 1
+    n_units = total_steps // unit
+    return next(
+        (n for n in range(n_needed, n_units + 1) if n_units % n == 0), n_units
+    )
+
+
+def plan_memory(
+    name: str,
+    config: Dict[str, Any],
+    grid: Tuple[int, int],
+    shared_memory: str,
+    segments: Optional[int] = None,
+    gpu_memory: str = DEFAULT_GPU_MEMORY,
+    max_segment_output: str = DEFAULT_MAX_SEGMENT_OUTPUT,
+    max_segment_years: float = DEFAULT_MAX_SEGMENT_YEARS,
+    n_channels: int = DEFAULT_N_CHANNELS,
+) -> MemoryPlan:
+    """Plan segments and forward_steps_in_memory for an inference config.
+
+    Args:
+        name: experiment name, used in the report.
+        config: merged evaluator or inference config.
+        grid: number of latitudes and longitudes.
+        shared_memory: shared memory of the task, e.g. "50GiB".
+        segments: number of segments the job currently runs, or None if it is
+            not segmented, in which case only forward_steps_in_memory is planned.
+        gpu_memory: memory of the GPU.
+        max_segment_output: maximum bytes each segment should write.
+        max_segment_years: maximum simulated years per segment.
+        n_channels: number of input and output channels of the model.
+    """
+    warnings = []
+    start_times = get_start_times(config)
+    n_samples = 1 if start_times is None else len(start_times)
+    field_bytes = grid[0] * grid[1] * BYTES_PER_VALUE
+    data_writer = config.get("data_writer", {})
+    total_steps = config["n_forward_steps"] * (segments or 1)
+
+    total_output = estimate_output_bytes(
+        data_writer, total_steps, n_samples, field_bytes, n_channels
+    )
+    if segments is None:
+        n_segments = None
+        steps_per_segment = total_steps
+        if total_output > parse_bytes(max_segment_output):
+            warnings.append(
+                f"writes {format_bytes(total_output)} but the job is not "
+                "segmented, consider writing fewer variables"
+            )
+    else:
+        n_needed = max(
+            1,
+            math.ceil(total_output / parse_bytes(max_segment_output)),
+            math.ceil(total_steps / (max_segment_years * STEPS_PER_YEAR)),
+        )
+        n_segments = _get_n_segments(total_steps, n_needed)
+        steps_per_segment = total_steps // n_segments
+
+    names = data_writer.get("names")
+    n_written = n_channels if names is None else len(names)
+    if not data_writer.get("save_prediction_files", True):
+        n_written = 0
+    gpu_per_step = n_samples * n_channels * field_bytes * GPU_COPIES_PER_STEP
+    host_per_step = (
+        n_samples
+        * field_bytes
+        * (n_channels * _get_num_data_workers(config) * PREFETCH_FACTOR + n_written)
+    )
+    gpu_available = parse_bytes(gpu_memory) * MEMORY_SAFETY_FRACTION - GPU_MODEL_BYTES
+    host_available = parse_bytes(shared_memory) * MEMORY_SAFETY_FRACTION
+    # windows hold one more step than are run, the initial condition
+    max_steps = (
+        int(min(gpu_available / gpu_per_step, host_available / host_per_step)) - 1
+    )
+    if max_steps < 1:
+        warnings.append(
+            "even one step in memory may not fit, consider fewer initial "
+            "conditions, fewer data workers or more shared memory"
+        )
+    forward_steps_in_memory = max(
+        1, min(max_steps, MAX_FORWARD_STEPS_IN_MEMORY, steps_per_segment)
+    )
+    window = forward_steps_in_memory + 1
+    return MemoryPlan(
+        name=name,
+        n_samples=n_samples,
+        total_steps=total_steps,
+        n_segments=n_segments,
+        steps_per_segment=steps_per_segment,
+        forward_steps_in_memory=forward_steps_in_memory,
+        output_bytes_per_segment=estimate_output_bytes(
+            data_writer, steps_per_segment, n_samples, field_bytes, n_channels
+        ),
+        gpu_bytes=GPU_MODEL_BYTES + window * gpu_per_step,
+        host_bytes=window * host_per_step,
+        warnings=warnings,
+    )
+
+
+def format_plan(plan: MemoryPlan, config: Dict[str, Any]) -> str:
+    """Return a report of the plan, compared to the config's current values."""
+    lines = [f"{plan.name}:"]
+    lines.append(
+        f"  {plan.n_samples} initial condition(s), {plan.total_steps} steps in total"
+    )
+    if plan.n_segments is not None:
+        lines.append(
+            f"  segments: {plan.n_segments} of {plan.steps_per_segment} steps, "
+            f"currently {plan.total_steps // config['n_forward_steps']}"
+        )
+    lines.append(
+        f"  forward_steps_in_memory: {plan.forward_steps_in_memory}, "
+        f"currently {config.get('forward_steps_in_memory')}"
+    )
+    lines.append(
+        f"  output per segment: {format_bytes(plan.output_bytes_per_segment)}, "
+        f"GPU memory: {format_bytes(plan.gpu_bytes)}, "
+        f"shared memory: {format_bytes(plan.host_bytes)}"
+    )
+    for warning in plan.warnings:
+        lines.append(f"  warning: {warning}")
+    return "\n".join(lines)
@@ -0,0 +1,164 @@
+"""Resumption of segmented runs which were preempted before finishing.
+
+Segmented inference writes each segment to a segment_XXXX directory of the
+result, ending with its restart file, and skips segments whose restart file
+already exists. A continuation copies the completed segments of the most
+complete earlier result into its output directory and runs the same config, so
+only the missing segments are computed and its result holds every segment.
+"""
+
+import abc
+import dataclasses
+import os
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+from .config import Experiment, SegmentResume
+from .script import LaunchScript
+
+if TYPE_CHECKING:
+    import beaker
+
+RESTART_FILENAME = "restart.nc"
+SEGMENT_DIR_FORMAT = "segment_{:04d}"
+CONTINUATION_SUFFIX = "-resume-"
+_RESTART_PATTERN = re.compile(r"^segment_(\d{4})/" + re.escape(RESTART_FILENAME) + "$")
+
+
+class ResultStore(abc.ABC):
+    """Somewhere the results of experiments can be listed."""
+
+    @abc.abstractmethod
+    def get_result_ids(self, experiment_name: str) -> List[str]:
+        """Return the IDs of the results of every job of the experiment with
+        the given name and of its continuations."""
+        ...
+
+    @abc.abstractmethod
+    def list_files(self, result_id: str) -> List[str]:
+        """Return the paths of the files in a result, relative to its root."""
+        ...
+
+
+class BeakerResultStore(ResultStore):
+    def __init__(self, client: "beaker.Beaker", workspace: Optional[str] = None):
+        self.client = client
+        self.workspace = workspace
+
+    def get_result_ids(self, experiment_name: str) -> List[str]:
+        experiments = self.client.workspace.experiments(
+            self.workspace, match=experiment_name
+        )
+        result_ids = []
+        for experiment in experiments:
+            if not _is_run_of(experiment.name, experiment_name):
+                continue
+            for job in experiment.jobs:
+                if job.execution is not None and job.execution.result is not None:
+                    result_ids.append(job.execution.result.beaker)
+        return result_ids
+
+    def list_files(self, result_id: str) -> List[str]:
+        return [info.path for info in self.client.dataset.ls(result_id)]
+
+
+class LocalResultStore(ResultStore):
+    """Stand-in for beaker which keeps the results of each job of an experiment
+    as directories named <directory>/<experiment name>/<job>, for testing
+    without beaker access."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def get_result_ids(self, experiment_name: str) -> List[str]:
+        if not self.directory.is_dir():
+            return []
+        result_ids = []
+        for name in sorted(os.listdir(self.directory)):
+            if _is_run_of(name, experiment_name):
+                for job in sorted(os.listdir(self.directory / name)):
+                    result_ids.append(f"{name}/{job}")
+        return result_ids
+
+    def list_files(self, result_id: str) -> List[str]:
+        root = self.directory / result_id
+        return [
+            str(Path(dirpath, filename).relative_to(root))
+            for dirpath, _, filenames in os.walk(root)
+            for filename in filenames
+        ]
+
+
+def _is_run_of(name: str, experiment_name: str) -> bool:
+    return name == experiment_name or name.startswith(
+        experiment_name + CONTINUATION_SUFFIX
+    )
+
+
+def get_completed_segments(paths: Iterable[str]) -> int:
+    """Return the number of consecutive segments, starting from the first, whose
+    restart file is among the given result paths."""
+    completed = set()
+    for path in paths:
+        match = _RESTART_PATTERN.match(path)
+        if match is not None:
+            completed.add(int(match.group(1)))
+    n_completed = 0
+    while n_completed in completed:
+        n_completed += 1
+    return n_completed
+
+
+@dataclasses.dataclass
+class ResumePlan:
+    """How far a segmented experiment got, and what is left to run.
+
+    Attributes:
+        experiment: the original experiment.
+        n_segments: total number of segments.
+        n_completed: number of completed segments in the most complete result.
+        result_id: ID of the most complete result, if any.
+    """
+
+    experiment: Experiment
+    n_segments: int
+    n_completed: int
+    result_id: Optional[str] = None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.n_completed >= self.n_segments
+
+    def get_continuation(self) -> Experiment:
+        """Return an experiment which runs only the missing segments."""
+        if self.result_id is None or self.n_completed == 0:
+            raise ValueError(f"{self.experiment.name} has no completed segments.")
+        if self.is_complete:
+            raise ValueError(f"{self.experiment.name} is already complete.")
+        segment_dirs = [SEGMENT_DIR_FORMAT.format(i) for i in range(self.n_completed)]
+        return dataclasses.replace(
+            self.experiment,
+            name=(
+                f"{self.experiment.name}{CONTINUATION_SUFFIX}"
+                f"{SEGMENT_DIR_FORMAT.format(self.n_completed)}"
+            ),
+            wandb_name=self.experiment.wandb_name or self.experiment.name,
+            resume=SegmentResume(self.result_id, segment_dirs),
+        )
+
+
+def plan_resume(
+    script: LaunchScript, experiment: Experiment, store: ResultStore
+) -> ResumePlan:
+    """Find the most complete result of the experiment or its continuations."""
+    n_segments = script.job.segments
+    if n_segments is None:
+        raise ValueError(f"Launcher script {script.path} does not run segments.")
+    plan = ResumePlan(experiment, n_segments, n_completed=0)
+    for result_id in store.get_result_ids(experiment.name):
+        n_completed = get_completed_segments(store.list_files(result_id))
+        if n_completed > plan.n_completed:
+            plan.n_completed = n_completed
+            plan.result_id = result_id
+    return plan
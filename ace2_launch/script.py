@@ -0,0 +1,108 @@
+import fnmatch
+import functools
+import hashlib
+import importlib.util
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import yaml
+
+from .config import Experiment, JobConfig, apply_overlay
+
+DEFAULT_SCRIPT_NAME = "run.py"
+
+
+class LaunchScript:
+    """An experiment launcher script, which must define a JobConfig called JOB
+    and an iterable of Experiments called EXPERIMENTS.
+
+    EXPERIMENTS may be an iterator, e.g. an itertools.chain over experiment
+    matrices, so that experiments are only created as they are used. The
+    script is imported as a module, so it must not have side effects beyond
+    defining these.
+    """
+
+    def __init__(
+        self, path: Path, job: JobConfig, experiments: Iterable[Experiment]
+    ):
+        self.path = path
+        self.job = job
+        self._experiments: Optional[Iterable[Experiment]] = experiments
+
+    @property
+    def experiments(self) -> Iterator[Experiment]:
+        """Return a new iterator over the experiments. If EXPERIMENTS is an
+        iterator which was already used, the script is imported again."""
+        experiments = self._experiments
+        if experiments is None:
+            experiments = _import_script(self.path).EXPERIMENTS
+        elif isinstance(experiments, Iterator):
+            self._experiments = None
+        return iter(experiments)
+
+    @property
+    def directory(self) -> Path:
+        return self.path.parent
+
+    @functools.cached_property
+    def base_config(self) -> Dict[str, Any]:
+        with open(self.directory / self.job.base_config_filename, "r") as f:
+            return yaml.safe_load(f)
+
+    def get_config(self, experiment: Experiment) -> Dict[str, Any]:
+        """Return the base config with the experiment's overlay applied."""
+        return apply_overlay(
+            self.base_config, experiment.overlay, deep_merge=self.job.deep_merge
+        )
+
+    def select(self, patterns: Optional[Sequence[str]] = None) -> "Selection":
+        """Return experiments whose names match any of the given glob patterns,
+        or all experiments if no patterns are given.
+        """
+        return Selection(self, patterns or ())
+
+
+class Selection:
+    """The experiments of a launcher script whose names match any of the given
+    glob patterns, or all of them if there are none.
+
+    Experiments are filtered lazily each time the selection is iterated, so it
+    can be iterated more than once without holding them all in memory.
+    """
+
+    def __init__(self, script: LaunchScript, patterns: Sequence[str]):
+        self.script = script
+        self.patterns = patterns
+
+    def __iter__(self) -> Iterator[Experiment]:
+        for experiment in self.script.experiments:
+            if not self.patterns or any(
+                fnmatch.fnmatchcase(experiment.name, p) for p in self.patterns
+            ):
+                yield experiment
+
+
+def _import_script(script_path: Path):
+    # the scripts live in directories with dashes and share a filename, so
+    # give each a unique module name rather than importing it by package
+    digest = hashlib.sha1(str(script_path).encode()).hexdigest()[:8]
+    module_name = f"_ace2_launch_script_{digest}"
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for attr in ("JOB", "EXPERIMENTS"):
+        if not hasattr(module, attr):
+            raise AttributeError(f"Launcher script {script_path} does not define {attr}")
+    return module
+
+
+def load_script(path: str) -> LaunchScript:
+    """Load a launcher script, given its path or the path of its directory."""
+    script_path = Path(path)
+    if script_path.is_dir():
+        script_path = script_path / DEFAULT_SCRIPT_NAME
+    script_path = script_path.resolve()
+    if not script_path.is_file():
+        raise FileNotFoundError(f"No launcher script at {script_path}")
+    module = _import_script(script_path)
+    return LaunchScript(script_path, module.JOB, module.EXPERIMENTS)
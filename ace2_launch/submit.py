@@ -0,0 +1,310 @@
+import abc
+import concurrent.futures
+import dataclasses
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .beaker_spec import get_experiment_spec
+from .cache import config_hash, write_atomic
+from .config import Experiment, JobConfig
+from .config_datasets import ConfigDatasetStore
+from .script import LaunchScript
+
+if TYPE_CHECKING:
+    import beaker
+
+CREATED = "created"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class ExperimentExistsError(Exception):
+    pass
+
+
+class TransientSubmissionError(Exception):
+    """An error which may not happen again if the request is retried. Network
+    errors and HTTP 429 and 5xx responses are also treated as transient."""
+
+    pass
+
+
+class ExperimentBackend(abc.ABC):
+    """Somewhere experiments can be created."""
+
+    @abc.abstractmethod
+    def create(
+        self, job: JobConfig, experiment: Experiment, config_dataset_id: str
+    ) -> str:
+        """Create the experiment and return its ID.
+
+        Raises:
+            ExperimentExistsError: if an experiment with this name exists.
+        """
+        ...
+
+    def url(self, experiment_id: str) -> str:
+        return experiment_id
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, TransientSubmissionError):
+        return True
+    try:
+        import requests
+    except ImportError:  # only the offline stand-ins are in use
+        return False
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and (
+            response.status_code == 429 or response.status_code >= 500
+        )
+    return False
+
+
+class BeakerExperimentBackend(ExperimentBackend):
+    def __init__(self, client: "beaker.Beaker"):
+        self.client = client
+
+    def create(
+        self, job: JobConfig, experiment: Experiment, config_dataset_id: str
+    ) -> str:
+        import beaker
+
+        spec = get_experiment_spec(job, experiment, config_dataset_id)
+        try:
+            created = self.client.experiment.create(
+                experiment.name, spec, workspace=job.workspace
+            )
+        except beaker.exceptions.ExperimentConflict as err:
+            raise ExperimentExistsError(experiment.name) from err
+        return created.id
+
+    def url(self, experiment_id: str) -> str:
+        return f"https://beaker.org/ex/{experiment_id}"
+
+
+class FakeExperimentBackend(ExperimentBackend):
+    """Stand-in for beaker which only records created experiments, for testing
+    and benchmarking submission offline.
+
+    Args:
+        latency: seconds each create call takes.
+        transient_failure_rate: fraction of create calls which raise a
+            TransientSubmissionError.
+        existing: names of experiments which already exist.
+        seed: seed for the random transient failures.
+        directory: if given, created experiments are recorded as files in this
+            directory, so they exist on later runs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        transient_failure_rate: float = 0.0,
+        existing: Optional[Set[str]] = None,
+        seed: int = 0,
+        directory: Optional[Path] = None,
+    ):
+        self.latency = latency
+        self.transient_failure_rate = transient_failure_rate
+        self.experiments = set(existing or ())
+        self.directory = directory
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+            self.experiments.update(os.listdir(directory))
+        self.n_calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def create(
+        self, job: JobConfig, experiment: Experiment, config_dataset_id: str
+    ) -> str:
+        time.sleep(self.latency)
+        with self._lock:
+            self.n_calls += 1
+            if self._random.random() < self.transient_failure_rate:
+                raise TransientSubmissionError("simulated transient failure")
+            if experiment.name in self.experiments:
+                raise ExperimentExistsError(experiment.name)
+            self.experiments.add(experiment.name)
+        if self.directory is not None:
+            write_atomic(self.directory / experiment.name, config_dataset_id.encode())
+        return f"fake-{experiment.name}"
+
+
+@dataclasses.dataclass
+class SubmissionResult:
+    name: str
+    status: str
+    experiment_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 1
+    config_hash: Optional[str] = None
+    config_dataset_id: Optional[str] = None
+
+
+def _get_backoff(initial_backoff: float, attempt: int) -> float:
+    """Exponential backoff with jitter, so that concurrent submissions which
+    fail together do not all retry at the same moment."""
+    return initial_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+
+
+def submit_experiment(
+    script: LaunchScript,
+    experiment: Experiment,
+    backend: ExperimentBackend,
+    store: ConfigDatasetStore,
+    max_attempts: int = 5,
+    initial_backoff: float = 1.0,
+) -> SubmissionResult:
+    """Upload the experiment's config if needed and create the experiment,
+    retrying on transient errors. Never raises, errors are recorded in the
+    result instead."""
+    job = script.job
+    config = script.get_config(experiment)
+    hash = config_hash(config)
+    config_dataset_id = None
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            config_dataset_id = store.get_dataset_id(
+                config, job.config_dataset_prefix
+            )
+            experiment_id = backend.create(job, experiment, config_dataset_id)
+        except ExperimentExistsError:
+            status, experiment_id, error = SKIPPED, None, None
+        except Exception as err:
+            if _is_transient(err) and attempt < max_attempts:
+                time.sleep(_get_backoff(initial_backoff, attempt))
+                continue
+            status, experiment_id, error = FAILED, None, f"{type(err).__name__}: {err}"
+        else:
+            status, error = CREATED, None
+        return SubmissionResult(
+            experiment.name,
+            status,
+            experiment_id=experiment_id,
+            error=error,
+            attempts=attempt,
+            config_hash=hash,
+            config_dataset_id=config_dataset_id,
+        )
+
+
+def submit_experiments(
+    script: LaunchScript,
+    experiments: Iterable[Experiment],
+    backend: ExperimentBackend,
+    store: ConfigDatasetStore,
+    max_concurrency: int = 8,
+    max_attempts: int = 5,
+    initial_backoff: float = 1.0,
+    on_result: Optional[Callable[[Experiment, SubmissionResult], None]] = None,
+) -> List[SubmissionResult]:
+    """Submit experiments concurrently, skipping those whose names already
+    exist, and print a summary table of the results.
+
+    Experiments are consumed lazily, as submissions complete, so that at most
+    max_concurrency of them are held in flight.
+
+    Args:
+        script: launcher script the experiments belong to.
+        experiments: experiments to submit.
+        backend: where to create the experiments.
+        store: where to upload configs.
+        max_concurrency: maximum number of submissions in flight.
+        max_attempts: maximum attempts per submission on transient errors.
+        initial_backoff: seconds to wait before the first retry, doubled for
+            each subsequent retry.
+        on_result: called in this thread with each experiment and its result,
+            as its submission completes.
+
+    Returns:
+        Results in the order of the given experiments.
+    """
+    start = time.perf_counter()
+    results: Dict[int, SubmissionResult] = {}
+    pending: Dict[concurrent.futures.Future, Tuple[int, Experiment]] = {}
+
+    def collect(futures: Iterable[concurrent.futures.Future]):
+        for future in futures:
+            index, experiment = pending.pop(future)
+            result = future.result()
+            print(f"Experiment {result.name}: {result.status}.")
+            if on_result is not None:
+                on_result(experiment, result)
+            results[index] = result
+
+    with concurrent.futures.ThreadPoolExecutor(max_concurrency) as executor:
+        for index, experiment in enumerate(experiments):
+            if len(pending) >= max_concurrency:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                collect(done)
+            future = executor.submit(
+                submit_experiment,
+                script,
+                experiment,
+                backend,
+                store,
+                max_attempts=max_attempts,
+                initial_backoff=initial_backoff,
+            )
+            pending[future] = (index, experiment)
+        collect(concurrent.futures.as_completed(list(pending)))
+    ordered = [results[index] for index in sorted(results)]
+    if len(ordered) > 0:
+        print_summary(ordered, backend, time.perf_counter() - start)
+    return ordered
+
+
+def print_summary(
+    results: Sequence[SubmissionResult], backend: ExperimentBackend, elapsed: float
+):
+    width = max(len(result.name) for result in results)
+    print(f"{'experiment':<{width}}  {'status':<7}  attempts  details")
+    for result in results:
+        if result.status == CREATED:
+            details = backend.url(result.experiment_id)
+        elif result.status == SKIPPED:
+            details = "already exists"
+        else:
+            details = result.error
+        print(
+            f"{result.name:<{width}}  {result.status:<7}  {result.attempts:>8}  "
+            f"{details}"
+        )
+    counts = {
+        status: sum(result.status == status for result in results)
+        for status in (CREATED, SKIPPED, FAILED)
+    }
+    print(
+        f"{counts[CREATED]} created, {counts[SKIPPED]} skipped, "
+        f"{counts[FAILED]} failed in {elapsed:.1f}s "
+        f"({len(results) / elapsed:.2f} submissions/s)."
+    )
+    if counts[SKIPPED] > 0:
+        print(
+            "Skipped experiments already exist. If you want to submit them, delete "
+            "the existing experiments with the same names, or rename the new "
+            "experiments."
+        )
@@ -0,0 +1,346 @@
+"""Throughput sweeps over the data loader workers, forward steps in memory and
+initial conditions per job of inference runs.
+
+Each point of a sweep is a short benchmark run of an experiment's config with
+one combination of these settings. When inference finishes, fme logs its
+duration, the time spent in each of its timers and the total steps per second
+over all initial conditions, which are parsed from the job's logs. The fastest
+point is recorded per dataset and grid, so experiments on the same data can
+reuse it.
+"""
+
+import abc
+import dataclasses
+import datetime
+import itertools
+import math
+import re
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import yaml
+
+from .batching import _get, _get_start_times_path, _with_value
+from .cache import get_cache_dir, write_atomic
+from .config import Experiment
+from .script import LaunchScript
+
+if TYPE_CHECKING:
+    import beaker
+
+DEFAULT_BENCHMARK_STEPS = 400
+DEFAULT_NUM_DATA_WORKERS = (4, 8, 16)
+DEFAULT_FORWARD_STEPS_IN_MEMORY = (10, 40, 80)
+DEFAULT_BATCH_SIZES = (1, 2, 4)
+SWEEP_SUFFIX = "-sweep-"
+# interval between the initial conditions of a batch, as in the launch scripts
+_BATCH_INTERVAL = datetime.timedelta(days=1)
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_LOADER_KEYS = ("loader", "forcing_loader")
+_STEPS_PER_SECOND_PATTERN = re.compile(r"total steps per second:\s*([\d.]+)", re.I)
+_DURATION_PATTERN = re.compile(r"(\w+) duration:\s*([\d.]+)", re.I)
+_INFERENCE_TIMER = "inference"
+_DATA_LOADING_TIMER = "data_loading"
+
+
+@dataclasses.dataclass(frozen=True)
+class SweepPoint:
+    """One combination of the swept settings.
+
+    Attributes:
+        num_data_workers: data loader worker processes.
+        forward_steps_in_memory: steps run between reads of forcing data.
+        batch_size: initial conditions run together.
+    """
+
+    num_data_workers: int
+    forward_steps_in_memory: int
+    batch_size: int
+
+    @property
+    def label(self) -> str:
+        return (
+            f"w{self.num_data_workers}-m{self.forward_steps_in_memory}"
+            f"-b{self.batch_size}"
+        )
+
+
+def get_sweep_points(
+    num_data_workers: Sequence[int] = DEFAULT_NUM_DATA_WORKERS,
+    forward_steps_in_memory: Sequence[int] = DEFAULT_FORWARD_STEPS_IN_MEMORY,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+) -> List[SweepPoint]:
+    return [
+        SweepPoint(*values)
+        for values in itertools.product(
+            num_data_workers, forward_steps_in_memory, batch_sizes
+        )
+    ]
+
+
+def _get_loader_key(config: Dict[str, Any]) -> str:
+    for key in _LOADER_KEYS:
+        if key in config:
+            return key
+    raise ValueError(f"Config has none of the data loaders {_LOADER_KEYS}")
+
+
+def get_dataset_path(config: Dict[str, Any]) -> Optional[str]:
+    """Return the data path the config reads forcing or target data from."""
+    for key in _LOADER_KEYS:
+        dataset = config.get(key, {}).get("dataset")
+        if isinstance(dataset, list):
+            dataset = dataset[0] if len(dataset) > 0 else None
+        if isinstance(dataset, dict) and "data_path" in dataset:
+            return dataset["data_path"]
+    return None
+
+
+def _get_batch_times(first_time: str, batch_size: int) -> List[str]:
+    start = datetime.datetime.strptime(first_time, _TIME_FORMAT)
+    return [
+        (start + i * _BATCH_INTERVAL).strftime(_TIME_FORMAT) for i in range(batch_size)
+    ]
+
+
+def get_benchmark_config(
+    config: Dict[str, Any], point: SweepPoint, n_forward_steps: int
+) -> Dict[str, Any]:
+    """Return the config with the point's settings, running n_forward_steps
+    rounded up to whole windows of forward_steps_in_memory."""
+    loader_key = _get_loader_key(config)
+    config = _with_value(
+        config, (loader_key, "num_data_workers"), point.num_data_workers
+    )
+    config["forward_steps_in_memory"] = point.forward_steps_in_memory
+    config["n_forward_steps"] = point.forward_steps_in_memory * math.ceil(
+        n_forward_steps / point.forward_steps_in_memory
+    )
+    path = _get_start_times_path(config)
+    if path is not None:
+        config = _with_value(
+            config,
+            path,
+            _get_batch_times(_get(config, path)[0], point.batch_size),
+        )
+    elif point.batch_size != 1:
+        raise ValueError(
+            "Batch size can only be swept for configs with start_indices.times"
+        )
+    return config
+
+
+def get_config_points(
+    config: Dict[str, Any], points: Sequence[SweepPoint]
+) -> List[SweepPoint]:
+    """Return the points to sweep for the config, with every batch size
+    collapsed to 1 if it has no start_indices.times to batch."""
+    if _get_start_times_path(config) is not None:
+        return list(points)
+    return list(
+        dict.fromkeys(dataclasses.replace(point, batch_size=1) for point in points)
+    )
+
+
+def get_sweep_experiments(
+    script: LaunchScript,
+    experiment: Experiment,
+    points: Sequence[SweepPoint],
+    n_forward_steps: int = DEFAULT_BENCHMARK_STEPS,
+) -> List[Tuple[Experiment, SweepPoint]]:
+    """Return a benchmark experiment of each sweep point, in a wandb run group
+    of the sweep.
+
+    As for batches, the merged config is used as the overlay, which gives the
+    same config whether or not the script deep merges overlays. Batch sizes are
+    only swept if the config has start times to batch.
+    """
+    config = script.get_config(experiment)
+    points = get_config_points(config, points)
+    sweep_name = f"{experiment.name}{SWEEP_SUFFIX.rstrip('-')}"
+    return [
+        (
+            dataclasses.replace(
+                experiment,
+                name=f"{experiment.name}{SWEEP_SUFFIX}{point.label}",
+                overlay=get_benchmark_config(config, point, n_forward_steps),
+                wandb_run_group=sweep_name,
+            ),
+            point,
+        )
+        for point in points
+    ]
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """Throughput of one sweep point, parsed from its logs.
+
+    Attributes:
+        name: name of the benchmark experiment.
+        point: its settings.
+        steps_per_second: forward steps per second summed over initial
+            conditions.
+        duration: seconds spent in inference.
+        loader_wait: seconds spent waiting for the data loader, if logged.
+    """
+
+    name: str
+    point: SweepPoint
+    steps_per_second: float
+    duration: Optional[float] = None
+    loader_wait: Optional[float] = None
+
+    @property
+    def loader_wait_fraction(self) -> Optional[float]:
+        if self.loader_wait is None or not self.duration:
+            return None
+        return self.loader_wait / self.duration
+
+
+def parse_benchmark_log(
+    name: str, point: SweepPoint, lines: Iterable[str]
+) -> Optional[BenchmarkResult]:
+    """Return the throughput logged by a finished inference run, or None if the
+    run did not log one, e.g. because it has not finished."""
+    steps_per_second = None
+    durations: Dict[str, float] = {}
+    for line in lines:
+        match = _STEPS_PER_SECOND_PATTERN.search(line)
+        if match is not None:
+            steps_per_second = float(match.group(1))
+            continue
+        match = _DURATION_PATTERN.search(line)
+        if match is not None:
+            durations[match.group(1).lower()] = float(match.group(2))
+    if steps_per_second is None:
+        return None
+    return BenchmarkResult(
+        name,
+        point,
+        steps_per_second,
+        duration=durations.get(_INFERENCE_TIMER),
+        loader_wait=durations.get(_DATA_LOADING_TIMER),
+    )
+
+
+class LogSource(abc.ABC):
+    """Somewhere the logs of experiments can be read."""
+
+    @abc.abstractmethod
+    def get_log(self, experiment_name: str) -> Optional[Iterable[str]]:
+        """Return the lines logged by the experiment with the given name, or
+        None if there is no such experiment."""
+        ...
+
+
+class BeakerLogSource(LogSource):
+    def __init__(self, client: "beaker.Beaker", workspace: Optional[str] = None):
+        self.client = client
+        self.workspace = workspace
+
+    def get_log(self, experiment_name: str) -> Optional[Iterable[str]]:
+        experiments = self.client.workspace.experiments(
+            self.workspace, match=experiment_name
+        )
+        for experiment in experiments:
+            if experiment.name == experiment_name:
+                chunks = self.client.experiment.logs(experiment, quiet=True)
+                return b"".join(chunks).decode(errors="replace").splitlines()
+        return None
+
+
+class LocalLogSource(LogSource):
+    """Stand-in for beaker which reads the logs of each experiment from
+    <directory>/<experiment name>.log, for testing without beaker access."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def get_log(self, experiment_name: str) -> Optional[Iterable[str]]:
+        try:
+            with open(self.directory / f"{experiment_name}.log") as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return None
+
+
+def get_fastest(results: Sequence[BenchmarkResult]) -> BenchmarkResult:
+    return max(results, key=lambda result: result.steps_per_second)
+
+
+@dataclasses.dataclass
+class TunedSetting:
+    """Fastest sweep point measured for a dataset and grid.
+
+    Attributes:
+        dataset: data path of the swept config.
+        grid: grid the sweep ran on, e.g. "1deg".
+        num_data_workers: fastest number of data loader workers.
+        forward_steps_in_memory: fastest forward steps in memory.
+        batch_size: fastest number of initial conditions per job.
+        steps_per_second: forward steps per second summed over initial
+            conditions at this setting.
+        experiment: name of the benchmark experiment it was measured by.
+    """
+
+    dataset: str
+    grid: str
+    num_data_workers: int
+    forward_steps_in_memory: int
+    batch_size: int
+    steps_per_second: float
+    experiment: str
+
+    def get_overlay(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Return an overlay applying the setting to the config, other than
+        its batch size."""
+        return {
+            "forward_steps_in_memory": self.forward_steps_in_memory,
+            _get_loader_key(config): {"num_data_workers": self.num_data_workers},
+        }
+
+
+class TunedSettings:
+    """Fastest settings by dataset and grid, stored as one YAML file."""
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is None:
+            path = get_cache_dir() / "tuned-settings.yaml"
+        self.path = Path(path)
+
+    def settings(self) -> List[TunedSetting]:
+        try:
+            with open(self.path) as f:
+                records = yaml.safe_load(f) or []
+        except FileNotFoundError:
+            return []
+        return [TunedSetting(**record) for record in records]
+
+    def get(self, dataset: str, grid: str) -> Optional[TunedSetting]:
+        for setting in self.settings():
+            if setting.dataset == dataset and setting.grid == grid:
+                return setting
+        return None
+
+    def set(self, setting: TunedSetting):
+        """Replace the setting for the dataset and grid."""
+        settings = [
+            other
+            for other in self.settings()
+            if (other.dataset, other.grid) != (setting.dataset, setting.grid)
+        ]
+        settings.append(setting)
+        write_atomic(
+            self.path,
+            yaml.safe_dump([dataclasses.asdict(s) for s in settings]).encode(),
+        )
@@ -0,0 +1,151 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib.metadata
+import os
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import config_hash, get_cache_dir, write_atomic
+
+# number of distinct configs generated ahead of validation
+DEFAULT_WINDOW = 1024
+
+
+def validate_config(config_type: str, config: Dict[str, Any]):
+    """Raise an error if the config does not have the correct types for the
+    given fme.ace config class."""
+    import dacite
+    import fme
+
+    dacite.from_dict(
+        getattr(fme.ace, config_type), config, config=dacite.Config(strict=True)
+    )
+
+
+def _get_validation_error(config_type: str, config: Dict[str, Any]) -> Optional[str]:
+    try:
+        validate_config(config_type, config)
+    except Exception:
+        # exceptions raised by dacite do not all survive pickling, so send
+        # the formatted error back from worker processes instead
+        return traceback.format_exc()
+    return None
+
+
+def get_fme_version() -> str:
+    # read from package metadata so that cache lookups do not import fme
+    return importlib.metadata.version("fme")
+
+
+class ValidationCache:
+    """Record of configs which have passed validation, stored as one empty
+    file per config under the given directory.
+
+    Entries are keyed on the config class, the canonical hash of the config and
+    the installed fme version, so upgrading fme invalidates all entries.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        if directory is None:
+            directory = get_cache_dir() / "validation"
+        self.directory = directory
+
+    def _path(self, config_type: str, hash: str, fme_version: str) -> Path:
+        key = hashlib.sha256(f"{config_type}:{fme_version}:{hash}".encode()).hexdigest()
+        return self.directory / key[:2] / key
+
+    def contains(self, config_type: str, hash: str, fme_version: str) -> bool:
+        """Whether the config with the given hash passed validation."""
+        return self._path(config_type, hash, fme_version).exists()
+
+    def add(self, config_type: str, hash: str, fme_version: str):
+        write_atomic(self._path(config_type, hash, fme_version), b"")
+
+
+def validate_configs(
+    config_type: str,
+    configs: Iterable[Tuple[str, Dict[str, Any]]],
+    max_workers: Optional[int] = None,
+    cache: Optional[ValidationCache] = None,
+    window: int = DEFAULT_WINDOW,
+) -> Dict[str, str]:
+    """Validate configs in parallel, skipping those which passed before and
+    validating identical configs once.
+
+    Configs are consumed lazily, holding at most window distinct configs in
+    memory at a time, so they can be generated on demand.
+
+    Args:
+        config_type: name of the fme.ace config class to validate against.
+        configs: pairs of experiment name and config.
+        max_workers: number of validation processes, defaults to the number
+            of CPUs. If 1, configs are validated in this process.
+        cache: record of previously validated configs, or None to validate
+            every config.
+        window: maximum number of configs awaiting validation.
+
+    Returns:
+        Mapping from name to formatted error for each invalid config.
+    """
+    fme_version = get_fme_version() if cache is not None else ""
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    names_by_hash: Dict[str, List[str]] = {}
+    errors_by_hash: Dict[str, str] = {}
+    pending: Dict[str, Dict[str, Any]] = {}
+    with contextlib.ExitStack() as stack:
+        executor: Optional[concurrent.futures.Executor] = None
+        n_workers = 1
+
+        def validate_pending():
+            nonlocal executor, n_workers
+            hashes = list(pending)
+            if executor is None:
+                # later windows are only validated if this one was full
+                n_workers = min(max_workers, len(hashes))
+            if n_workers == 1:
+                results = [
+                    _get_validation_error(config_type, pending[h]) for h in hashes
+                ]
+            else:
+                if executor is None:
+                    executor = stack.enter_context(
+                        concurrent.futures.ProcessPoolExecutor(n_workers)
+                    )
+                # each worker imports fme once, so hand out work in large chunks
+                chunksize = -(-len(hashes) // n_workers)
+                results = list(
+                    executor.map(
+                        _get_validation_error,
+                        [config_type] * len(hashes),
+                        [pending[h] for h in hashes],
+                        chunksize=chunksize,
+                    )
+                )
+            for hash, error in zip(hashes, results):
+                if error is None:
+                    if cache is not None:
+                        cache.add(config_type, hash, fme_version)
+                else:
+                    errors_by_hash[hash] = error
+            pending.clear()
+
+        for name, config in configs:
+            hash = config_hash(config)
+            if hash in names_by_hash:
+                names_by_hash[hash].append(name)
+                continue
+            names_by_hash[hash] = [name]
+            if cache is None or not cache.contains(config_type, hash, fme_version):
+                pending[hash] = config
+                if len(pending) >= window:
+                    validate_pending()
+        if len(pending) > 0:
+            validate_pending()
+    return {
+        name: error
+        for hash, error in errors_by_hash.items()
+        for name in names_by_hash[hash]
+    }
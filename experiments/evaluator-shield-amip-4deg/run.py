@@ -1,23 +1,15 @@
-# requires beaker-py, install with
-# pip install -U beaker-py
+# submit with
+# python -m ace2_launch submit experiments/evaluator-shield-amip-4deg
 
-import beaker
-import uuid
-from typing import Dict, Any
-import tempfile
-import yaml
-import os
-import fme
-import dacite
+import itertools
+
+from ace2_launch import Experiment, JobConfig, experiments_from_overlays
 
 IMAGE_NAME = "brianhenn/fme-926fd6e7"
 TRAINED_MODEL_DATASET_ID = "01J4WEM48F3J6Z1CT2ARZ89F4T"
 REFERENCE_DATASET_PATH = "/climate-default/2024-07-24-vertically-resolved-c96-4deg-shield-amip-ensemble-dataset/netCDFs/ic_0001"
 TARGET_DATASET_PATH = "/climate-default/2024-07-24-vertically-resolved-c96-4deg-shield-amip-ensemble-dataset/netCDFs/ic_0002"
-CHECKPOINT_NAME = "best_inference_ckpt.tar"
 LOCAL_BASE_CONFIG_FILENAME = "base-config.yaml"
-DATASET_CONFIG_FILENAME = "config.yaml"
-DATASET_CONFIG_MOUNTPATH = "/configmount"
 
 
 # experiments defined by overlays which will overwrite the keys of the base config
@@ -168,136 +160,32 @@ RANDOM_SEED_OVERLAYS = {
     ),
 }
 
-def merge_configs(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
-    """Merge nested configurations."""
-    base_copy = base.copy() # don't modify the original base
-    for k, v in new.items():
-        if isinstance(v, dict):
-            base_copy[k] = merge_configs(base_copy.get(k, {}), v)
-        else:
-            base_copy[k] = v
-    return base_copy
-
-
-def write_config_dataset(config: Dict[str, Any]):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        filepath = os.path.join(temp_dir, DATASET_CONFIG_FILENAME)
-        with open(filepath, "w") as f:
-            yaml.safe_dump(config, f)
-        dataset_name = "ace-inference-config-" + str(uuid.uuid4())[:8]
-        dataset = client.dataset.create(dataset_name, filepath)
-    return dataset
 
-
-def get_experiment_spec(
-    name: str,
-    config: Dict[str, Any],
+JOB = JobConfig(
     image_name=IMAGE_NAME,
+    description="Do inference with ACE2 model trained on SHiELD-AMIP.",
+    module="fme.ace.evaluator",
+    config_type="InferenceEvaluatorConfig",
+    base_config_filename=LOCAL_BASE_CONFIG_FILENAME,
     trained_model_dataset_id=TRAINED_MODEL_DATASET_ID,
-):
-    """Given a dict representing the inference configuration, return a beaker experiment spec."""
-    config_dataset = write_config_dataset(config)
-    env_vars = [
-        beaker.EnvVar(name="WANDB_API_KEY", secret="wandb-api-key-ai2cm-sa"),
-        beaker.EnvVar(name="WANDB_JOB_TYPE", value="inference"),
-        beaker.EnvVar(name="WANDB_NAME", value=name),
-        beaker.EnvVar(name="WANDB_RUN_GROUP", value="shield-amip-ace2-inference"),
-        beaker.EnvVar(name="WANDB_USERNAME", value="bhenn1983")
-    ]
-    datasets = [
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=config_dataset.id),
-            mount_path=DATASET_CONFIG_MOUNTPATH,
-        ),
-        beaker.DataMount(
-            mount_path="/ckpt.tar",
-            source=beaker.DataSource(beaker=trained_model_dataset_id),
-            sub_path=f"training_checkpoints/{CHECKPOINT_NAME}",
-        ),
-        beaker.DataMount(
-            mount_path="/climate-default",
-            source=beaker.DataSource(weka="climate-default"),
-        ),
-    ]
-    spec = beaker.ExperimentSpec(
-        budget="ai2/climate",
-        description="Do inference with ACE2 model trained on SHiELD-AMIP.",
-        tasks=[
-            beaker.TaskSpec(
-                name=name,
-                image=beaker.ImageSource(beaker=image_name),
-                command=[
-                    "python",
-                    "-m",
-                    "fme.ace.evaluator",
-                    f"{DATASET_CONFIG_MOUNTPATH}/{DATASET_CONFIG_FILENAME}",
-                ],
-                result=beaker.ResultSpec(path="/output"),
-                resources=beaker.TaskResources(gpu_count=1, shared_memory="50GiB"),
-                context=beaker.TaskContext(priority="high", preemptible=True),
-                constraints=beaker.Constraints(cluster=["ai2/jupiter-cirrascale-2"]),
-                env_vars=env_vars,
-                datasets=datasets,
-            )
-        ],
-    )
-    return spec
+    wandb_api_key_secret="wandb-api-key-ai2cm-sa",
+    wandb_run_group="shield-amip-ace2-inference",
+    wandb_username="bhenn1983",
+    workspace="ai2/ace",
+)
+# chained rather than concatenated, so experiments are created as they are used
+EXPERIMENTS = itertools.chain(
+    experiments_from_overlays(EXPERIMENT_OVERLAYS),
+    (
+        Experiment(name, overlay, trained_model_dataset_id=checkpoint)
+        for name, (checkpoint, overlay) in RANDOM_SEED_OVERLAYS.items()
+    ),
+)
 
 
 if __name__ == "__main__":
-    client = beaker.Beaker.from_env()
-
-    with open(LOCAL_BASE_CONFIG_FILENAME, "r") as f:
-        base_config = yaml.safe_load(f)
+    import sys
 
-    print("Validating that configs have correct types.")
-    for name, overlay in EXPERIMENT_OVERLAYS.items():
-        config = merge_configs(base_config, overlay)
-        print(f"Validating config for experiment {name}.")
-        print(f"Config that is being validated:\n{config}")
-        dacite.from_dict(
-            fme.ace.InferenceEvaluatorConfig, config, config=dacite.Config(strict=True)
-        )
-    print("All configs are valid. Starting experiment submission.")
-    for name, overlay in EXPERIMENT_OVERLAYS.items():
-        config = merge_configs(base_config, overlay)
-        print(f"Creating experiment {name}.")
-        spec = get_experiment_spec(name, config)
-        try:
-            experiment = client.experiment.create(name, spec, workspace="ai2/ace")
-            print(
-                f"Experiment {name} created. See https://beaker.org/ex/{experiment.id}"
-            )
-        except beaker.exceptions.ExperimentConflict:
-            print(
-                f"Failed to create experiment {name} because it already exists. "
-                "Skipping experiment creation. If you want to submit this experiment, "
-                "delete the existing experiment with the same name, or rename the new "
-                "experiment."
-            )
+    from ace2_launch.cli import main
 
-    for name, (checkpoint, overlay) in RANDOM_SEED_OVERLAYS.items():
-        config = merge_configs(base_config, overlay)
-        print(f"Validating config for experiment {name}.")
-        print(f"Config that is being validated:\n{config}")
-        try:
-            dacite.from_dict(
-                fme.ace.InferenceEvaluatorConfig, config, config=dacite.Config(strict=True)
-            )
-        except:
-            print(f"Error in config for experiment {name}.")
-            break
-        print(f"Creating experiment {name}.")
-        spec = get_experiment_spec(name, config, trained_model_dataset_id=checkpoint)
-        try:
-            experiment = client.experiment.create(name, spec, workspace="ai2/ace")
-            print(
-                f"Experiment {name} created. See https://beaker.org/ex/{experiment.id}"
-            )
-        except beaker.exceptions.ExperimentConflict:
-            print(
-                f"Failed to create experiment {name} because it already exists. "
-                "Skipping experiment creation. If you want to submit this experiment, "
-                "delete the existing experiment with the same name, or rename the new "
-                "experiment."
-            )
+    main(["submit", __file__, *sys.argv[1:]])
@@ -1,24 +1,19 @@
-# requires beaker-py, install with
-# pip install -U beaker-py
+# submit with
+# python -m ace2_launch submit experiments/training-shield-amip
 
-import beaker
-import uuid
-from typing import Dict, Any
-import tempfile
-import yaml
 import os
-import fme
-import dacite
+
+import yaml
+
+from ace2_launch import JobConfig, experiments_from_overlays
 
 IMAGE_NAME = "brianhenn/fme-c8336903"
 LOCAL_BASE_CONFIG_FILENAME = "base-config.yaml"
-DATASET_CONFIG_FILENAME = "config.yaml"
-DATASET_CONFIG_MOUNTPATH = "/configmount"
 STATS_DATASET_1DEG_NAME = "andrep/2024-07-24-vertically-resolved-c96-1deg-shield-amip-ensemble-dataset-stats"
 STATS_DATASET_4DEG_NAME = "andrep/2024-07-24-vertically-resolved-c96-4deg-shield-amip-ensemble-dataset-stats"
 REFERENCE_DATASET_1DEG_NAME = "brianhenn/2024-07-24-vertically-resolved-c96-1deg-shield-amip-monthly-reference"
 REFERENCE_DATASET_4DEG_NAME = "brianhenn/2024-07-24-vertically-resolved-c96-4deg-shield-amip-monthly-reference"
-with open(LOCAL_BASE_CONFIG_FILENAME, "r") as f:
+with open(os.path.join(os.path.dirname(__file__), LOCAL_BASE_CONFIG_FILENAME), "r") as f:
     base_config = yaml.safe_load(f)
 NO_CO2_IN_NAMES = base_config["stepper"]["in_names"]
 NO_CO2_IN_NAMES.remove("global_mean_co2")
@@ -133,113 +128,35 @@ EXPERIMENT_OVERLAYS = {
 }
 
 
-def merge_configs(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
-    """Merge nested configurations."""
-    base = base.copy()
-    for k, v in new.items():
-        if isinstance(v, dict):
-            base[k] = merge_configs(base.get(k, {}), v)
-        else:
-            base[k] = v
-    return base
-
-def write_config_dataset(config: Dict[str, Any]):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        filepath = os.path.join(temp_dir, DATASET_CONFIG_FILENAME)
-        with open(filepath, "w") as f:
-            yaml.safe_dump(config, f)
-        dataset_name = "ace-training-config-" + str(uuid.uuid4())[:8]
-        dataset = client.dataset.create(dataset_name, filepath)
-    return dataset
-
-
-def get_experiment_spec(name: str, config: Dict[str, Any], image_name=IMAGE_NAME):
-    """Given a dict representing the training configuration, return a beaker experiment spec."""
-    config_dataset = write_config_dataset(config)
-    env_vars = [
-        beaker.EnvVar(name="WANDB_API_KEY", secret="wandb-api-key-ai2cm-sa"),
-        beaker.EnvVar(name="WANDB_JOB_TYPE", value="training"),
-        beaker.EnvVar(name="WANDB_NAME", value=name),
-        beaker.EnvVar(name="WANDB_RUN_GROUP", value="shield-amip-ace2-training"),
-        beaker.EnvVar(name="WANDB_USERNAME", value="bhenn1983")
-    ]
-    datasets = [
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=config_dataset.id),
-            mount_path=DATASET_CONFIG_MOUNTPATH,
-        ),
-        beaker.DataMount(
-            mount_path="/climate-default",
-            source=beaker.DataSource(weka="climate-default"),
-        ),
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=STATS_DATASET_1DEG_NAME),
-            mount_path="/statsdata-1deg",
-        ),
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=STATS_DATASET_4DEG_NAME),
-            mount_path="/statsdata-4deg",
-        ),
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=REFERENCE_DATASET_1DEG_NAME),
-            mount_path="/refdata-1deg",
-        ),
-        beaker.DataMount(
-            source=beaker.DataSource(beaker=REFERENCE_DATASET_4DEG_NAME),
-            mount_path="/refdata-4deg",
-        ),
-    ]
-    spec = beaker.ExperimentSpec(
-        budget="ai2/climate",
-        description="SHiELD AMIP ACE2 training",
-        tasks=[
-            beaker.TaskSpec(
-                name=name,
-                image=beaker.ImageSource(beaker=image_name),
-                command=[
-                    "torchrun",
-                    "--nproc_per_node",
-                    "8",
-                    "-m",
-                    "fme.ace.train",
-                    f"{DATASET_CONFIG_MOUNTPATH}/{DATASET_CONFIG_FILENAME}",
-                ],
-                result=beaker.ResultSpec(path="/output"),
-                resources=beaker.TaskResources(gpu_count=8, shared_memory="400GiB"),
-                context=beaker.TaskContext(priority="urgent", preemptible=True),
-                constraints=beaker.Constraints(cluster=["ai2/jupiter-cirrascale-2"]),
-                env_vars=env_vars,
-                datasets=datasets,
-            )
-        ],
-    )
-    return spec
+JOB = JobConfig(
+    image_name=IMAGE_NAME,
+    description="SHiELD AMIP ACE2 training",
+    module="fme.ace.train",
+    config_type="TrainConfig",
+    base_config_filename=LOCAL_BASE_CONFIG_FILENAME,
+    nproc_per_node=8,
+    extra_mounts={
+        STATS_DATASET_1DEG_NAME: "/statsdata-1deg",
+        STATS_DATASET_4DEG_NAME: "/statsdata-4deg",
+        REFERENCE_DATASET_1DEG_NAME: "/refdata-1deg",
+        REFERENCE_DATASET_4DEG_NAME: "/refdata-4deg",
+    },
+    wandb_api_key_secret="wandb-api-key-ai2cm-sa",
+    wandb_job_type="training",
+    wandb_run_group="shield-amip-ace2-training",
+    wandb_username="bhenn1983",
+    config_dataset_prefix="ace-training-config-",
+    priority="urgent",
+    gpu_count=8,
+    shared_memory="400GiB",
+    workspace="ai2/ace",
+)
+EXPERIMENTS = experiments_from_overlays(EXPERIMENT_OVERLAYS)
 
 
 if __name__ == "__main__":
-    client = beaker.Beaker.from_env()
+    import sys
 
-    with open(LOCAL_BASE_CONFIG_FILENAME, "r") as f:
-        base_config = yaml.safe_load(f)
+    from ace2_launch.cli import main
 
-    print("Validating that configs have correct types.")
-    for name, overlay in EXPERIMENT_OVERLAYS.items():
-        config = merge_configs(base_config, overlay)
-        print(f"Validating config for experiment {name}.")
-        print(f"Config that is being validated:\n{config}")
-        dacite.from_dict(fme.ace.TrainConfig, config, config=dacite.Config(strict=True))
-    print("All configs are valid. Starting experiment submission.")
-    for name, overlay in EXPERIMENT_OVERLAYS.items():
-        config = merge_configs(base_config, overlay)
-        print(f"Creating experiment {name}.")
-        spec = get_experiment_spec(name, config)
-        try:
-            experiment = client.experiment.create(name, spec, workspace="ai2/ace")
-            print(f"Experiment created. See https://beaker.org/ex/{experiment.id}")
-        except beaker.exceptions.ExperimentConflict:
-            print(
-                f"Failed to create experiment {name} because it already exists. "
-                "Skipping experiment creation. If you want to submit this experiment, "
-                "delete the existing experiment with the same name, or rename the new "
-                "experiment."
-            )
+    main(["submit", __file__, *sys.argv[1:]])
@@ -1,4 +1,4 @@
-import yaml
+from run_registry import load_registry
 
 WANDB_ENTITY = "ai2cm"
 WANDB_PROJECT = "ace"
@@ -19,97 +19,93 @@ SHiELD_TRAINING_RUN_WANDB_IDS = {
     "rs3": "men5bnw6",
 }
 
-with open(WANDB_ID_FILE, "r") as f:
-    wandb_ids = yaml.safe_load(f)
-
-
-# this is brittle but works with current set of names
-def get_runs_subset(all_runs, name_key):
-    return {
-        f"IC{k.split(name_key)[1][:1]}": v
-        for k, v in all_runs.items()
-        if k.startswith(name_key)
-    }
-
+registry = load_registry(WANDB_ID_FILE)
 
 # SHiELD evaluation wandb IDs using best checkpoint, RS2
-ERA5_BEST_INFERENCE_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "era5-co2-10yr-RS2-IC"
+ERA5_BEST_INFERENCE_10YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-era5", duration="10yr", rs=2, variant="ni"
 )
-ERA5_BEST_INFERENCE_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "era5-co2-81yr-RS2-IC"
+ERA5_BEST_INFERENCE_81YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-era5", duration="81yr", rs=2, variant="ni"
 )
-ERA5_BEST_INFERENCE_1YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "era5-co2-1yr-2020-RS2-IC"
+ERA5_BEST_INFERENCE_1YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-era5", duration="1yr", rs=2, variant="2020"
 )
 
-# SHiELD evaluation wandb IDs using best checkpoint, RS2
-SHiELD_AMIP_1DEG_BEST_INFERENCE_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-10yr-IC"
-)
-SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-IC"
-)
+# SHiELD evaluation wandb IDs using best checkpoint, RS2, with the runs saving
+# monthly output in place of the other runs of the same ICs
+SHiELD_AMIP_1DEG_BEST_INFERENCE_10YR_WANDB_RUN_IDS = {
+    **registry.ids_by_ic(model="ace2-shield", duration="10yr", rs=None, variant=""),
+    **registry.ids_by_ic(
+        model="ace2-shield", duration="10yr", rs=None, variant="monthly"
+    ),
+}
+SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_WANDB_RUN_IDS = {
+    **registry.ids_by_ic(model="ace2-shield", duration="81yr", rs=None, variant=""),
+    **registry.ids_by_ic(
+        model="ace2-shield", duration="81yr", rs=None, variant="monthly"
+    ),
+}
 
 # SHiELD evaluation wandb IDs using other RS checkpoints
-SHiELD_AMIP_1DEG_RS0_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-10yr-RS0-IC"
+SHiELD_AMIP_1DEG_RS0_10YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="10yr", rs=0, variant=""
 )
-SHiELD_AMIP_1DEG_RS0_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-RS0-IC"
+SHiELD_AMIP_1DEG_RS0_81YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="81yr", rs=0, variant=""
 )
-SHiELD_AMIP_1DEG_RS1_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-10yr-RS1-IC"
+SHiELD_AMIP_1DEG_RS1_10YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="10yr", rs=1, variant=""
 )
-SHiELD_AMIP_1DEG_RS1_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-RS1-IC"
+SHiELD_AMIP_1DEG_RS1_81YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="81yr", rs=1, variant=""
 )
-SHiELD_AMIP_1DEG_RS3_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-10yr-RS3-IC"
+SHiELD_AMIP_1DEG_RS3_10YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="10yr", rs=3, variant=""
 )
-SHiELD_AMIP_1DEG_RS3_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-RS3-IC"
+SHiELD_AMIP_1DEG_RS3_81YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="81yr", rs=3, variant=""
 )
 
 # 'dataset comparison' runs of SHiELD-AMIP IC0001 against IC0002
 SHiELD_AMIP_1DEG_REFERENCE_10YR_WANDB_RUN_IDS = {
-    "IC0": wandb_ids["shield-amip-1deg-reference-inference-10yr-1941"],
-    "IC1": wandb_ids["shield-amip-1deg-reference-inference-10yr-1951"],
-    "IC2": wandb_ids["shield-amip-1deg-reference-inference-10yr-1961"],
-    "IC3": wandb_ids["shield-amip-1deg-reference-inference-10yr-1971"],
-    "IC4": wandb_ids["shield-amip-1deg-reference-inference-10yr-1981"],
-    "IC5": wandb_ids["shield-amip-1deg-reference-inference-10yr-1991"],
-    "IC6": wandb_ids["shield-amip-1deg-reference-inference-10yr"],
-    "IC7": wandb_ids["shield-amip-1deg-reference-inference-10yr-2011"],
+    "IC0": registry["shield-amip-1deg-reference-inference-10yr-1941"],
+    "IC1": registry["shield-amip-1deg-reference-inference-10yr-1951"],
+    "IC2": registry["shield-amip-1deg-reference-inference-10yr-1961"],
+    "IC3": registry["shield-amip-1deg-reference-inference-10yr-1971"],
+    "IC4": registry["shield-amip-1deg-reference-inference-10yr-1981"],
+    "IC5": registry["shield-amip-1deg-reference-inference-10yr-1991"],
+    "IC6": registry["shield-amip-1deg-reference-inference-10yr"],
+    "IC7": registry["shield-amip-1deg-reference-inference-10yr-2011"],
 }
 SHiELD_AMIP_1DEG_REFERENCE_81YR_WANDB_RUN_ID = {
-    "IC0": wandb_ids["shield-amip-1deg-reference-inference-81yr"],
+    "IC0": registry["shield-amip-1deg-reference-inference-81yr"],
 }
 
 # 'dataset comparison' runs of SHiELD-AMIP ICs against ERA5
 SHiELD_AMIP_ERA5_1DEG_COMPARISON_10YR_WANDB_RUN_IDS = {
-    "IC0": wandb_ids["shield-amip-IC1-vs-era5-10yr"],
-    "IC1": wandb_ids["shield-amip-IC2-vs-era5-10yr"],
+    "IC0": registry["shield-amip-IC1-vs-era5-10yr"],
+    "IC1": registry["shield-amip-IC2-vs-era5-10yr"],
 }
 SHiELD_AMIP_ERA5_1DEG_COMPARISON_81YR_WANDB_RUN_IDS = {
-    "IC0": wandb_ids["shield-amip-IC1-vs-era5-81yr"],
-    "IC1": wandb_ids["shield-amip-IC2-vs-era5-81yr"],
+    "IC0": registry["shield-amip-IC1-vs-era5-81yr"],
+    "IC1": registry["shield-amip-IC2-vs-era5-81yr"],
 }
 
 # climSST ACE baseline
-CLIMSST_DEG_10YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace-climsst-inference-10yr-IC"
+CLIMSST_DEG_10YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace-climsst", duration="10yr", variant=""
 )
-CLIMSST_DEG_81YR_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace-climsst-inference-81yr-IC"
+CLIMSST_DEG_81YR_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace-climsst", duration="81yr", variant=""
 )
 
 # ACE2-SHiELD CO2 sensitivity runs
-SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_FIXEDCO2_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-fixedCO2-IC"
+SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_FIXEDCO2_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="81yr", rs=None, variant="fixedCO2"
 )
-SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_NOCO2_WANDB_RUN_IDS = get_runs_subset(
-    wandb_ids, "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC"
+SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_NOCO2_WANDB_RUN_IDS = registry.ids_by_ic(
+    model="ace2-shield", duration="81yr", rs=1, variant="noCO2"
 )
 
 # inference summary at 1deg
@@ -146,41 +142,37 @@ CO2_SENSITIVITY_ACE2_SHiELD_1DEG = {
 
 ENSO_DEEP_DIVE = {
     "10yr": {
-        "ACE2-ERA5": {
-            "IC0": wandb_ids["era5-co2-10yr-RS2-IC0-monthly-output"],
-            "IC1": wandb_ids["era5-co2-10yr-RS2-IC1-monthly-output"],
-            "IC2": wandb_ids["era5-co2-10yr-RS2-IC2-monthly-output"],
-        },
-        "ACE2-SHiELD": {
-            "IC0": wandb_ids["shield-amip-1deg-ace2-inference-10yr-IC0-monthly"],
-            "IC1": wandb_ids["shield-amip-1deg-ace2-inference-10yr-IC1-monthly"],
-            "IC2": wandb_ids["shield-amip-1deg-ace2-inference-10yr-IC2-monthly"],
-        },
+        "ACE2-ERA5": registry.ids_by_ic(
+            model="ace2-era5", duration="10yr", rs=2, variant="monthly-output"
+        ),
+        "ACE2-SHiELD": registry.ids_by_ic(
+            model="ace2-shield", duration="10yr", rs=None, variant="monthly"
+        ),
     },
     "81yr": {
-        "ACE2-ERA5": {
-            "IC0": wandb_ids["era5-co2-81yr-RS2-IC0-monthly-output"],
-        },
-        "ACE2-SHiELD": {
-            "IC0": wandb_ids["shield-amip-1deg-ace2-inference-81yr-IC0-monthly"],
-        },
+        "ACE2-ERA5": registry.ids_by_ic(
+            model="ace2-era5", duration="81yr", rs=2, variant="monthly-output"
+        ),
+        "ACE2-SHiELD": registry.ids_by_ic(
+            model="ace2-shield", duration="81yr", rs=None, variant="monthly"
+        ),
     },
 }
 
 PERTURBED_SSTS = {
     "ACE2-SHiELD": {
-        0.0: wandb_ids["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p0-IC0"],
-        0.5: wandb_ids["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p5-IC0"],
-        1.0: wandb_ids["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-1p0-IC0"],
-        2.0: wandb_ids["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-2p0-IC0"],
-        4.0: wandb_ids["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-4p0-IC0"],
+        0.0: registry["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p0-IC0"],
+        0.5: registry["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p5-IC0"],
+        1.0: registry["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-1p0-IC0"],
+        2.0: registry["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-2p0-IC0"],
+        4.0: registry["shield-amip-1deg-ace2-inference-perturbed-30yr-ms-4p0-IC0"],
     },
     "ACE2-ERA5": {
-        0.0: wandb_ids["era5-ace2-inference-perturbed-30yr-ms2-0p0-IC0"],
-        0.5: wandb_ids["era5-ace2-inference-perturbed-30yr-ms2-0p5-IC0"],
-        1.0: wandb_ids["era5-ace2-inference-perturbed-30yr-ms2-1p0-IC0"],
-        2.0: wandb_ids["era5-ace2-inference-perturbed-30yr-ms2-2p0-IC0"],
-        4.0: wandb_ids["era5-ace2-inference-perturbed-30yr-ms2-4p0-IC0"],
+        0.0: registry["era5-ace2-inference-perturbed-30yr-ms2-0p0-IC0"],
+        0.5: registry["era5-ace2-inference-perturbed-30yr-ms2-0p5-IC0"],
+        1.0: registry["era5-ace2-inference-perturbed-30yr-ms2-1p0-IC0"],
+        2.0: registry["era5-ace2-inference-perturbed-30yr-ms2-2p0-IC0"],
+        4.0: registry["era5-ace2-inference-perturbed-30yr-ms2-4p0-IC0"],
     }
 }
 
@@ -1,124 +1,55 @@
 """This script is used to get the wandb ids of the runs that we want to analyze.
 
-Ensure your beaker default workspace is set to ai2cm/ace before running."""
+Ensure your beaker default workspace is set to ai2cm/ace before running.
 
+The beaker experiment names are taken from the EXPERIMENTS of the launcher
+scripts below, which are imported without submitting anything. Names already
+in wandb_ids.yaml with an ID are kept, and only the missing ones are looked up:
+first in the local submission ledger of ace2_launch, if there is one, and
+otherwise in the beaker logs of the experiments, several at a time. Names
+without a beaker experiment are remembered for NOT_SUBMITTED_TTL_DAYS before
+they are looked up again. Pass --refresh to look up every name again, which
+only replaces the IDs of names for which a new ID is found.
+
+Every name in an existing wandb_ids.yaml must still be given by the launcher
+scripts or LEGACY_EXPERIMENT_NAMES, as the notebooks look them up."""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import beaker
 import utils
 import yaml
+from replay import FixtureNotFoundError
 
-# the beaker experiment names are taken from these scripts
-# ../experiments/evaluator-era5-main/run.py
-# ../experiments/evaluator-era5-main/run-segmented.py
-# ../experiments/evaluator-era5-main/run-rs-comparison.py
-# ../experiments/evaluator-era5-main/run-weather-forecast.py
-# ../experiments/evaluator-shield-amip-1deg/run.py
-# ../experiments/evaluator-shield-constraints-ablation/run.py
-# ../experiments/evaluator-amip-plus-uniform-sst/run.py
-
-beaker_experiment_names = [
-    "era5-co2-10yr-RS2-IC0-ni",
-    "era5-co2-10yr-RS2-IC1-ni",
-    "era5-co2-10yr-RS2-IC2-ni",
-    "era5-co2-10yr-daily-output-RS2-ni",
-    "era5-co2-30yr-daily-output-RS2-ni",
-    "era5-co2-81yr-RS2-IC0-ni",
-    "era5-co2-81yr-RS2-IC1-ni",
-    "era5-co2-81yr-RS2-IC2-ni",
-    "era5-truth-81yr-ni",
-    "era5-truth-10yr-ni",
-    "era5-co2-15day-2020-RS2-ni",
-    "era5-co2-100day-2020-video-RS2-wd-ni",
-    "era5-co2-10yr-RS2-segmented-ni",
-    "era5-co2-10yr-RS2-clim-forcing-ni",
-    "era5-co2-60yr-rs0-ni",
-    "era5-co2-60yr-rs1-ni",
-    "era5-co2-60yr-rs2-ni",
-    "era5-co2-60yr-rs3-ni",
-    "era5-co2-15day-2020-RS2-pf",
-    "era5-co2-10yr-climSST-precip-only",
-    "era5-co2-1yr-2020-RS2-IC0",
-    "era5-co2-1yr-2020-RS2-IC1",
-    "era5-co2-1yr-2020-RS2-IC2",
-    "era5-co2-10yr-RS2-IC0-monthly-output",
-    "era5-co2-10yr-RS2-IC1-monthly-output",
-    "era5-co2-10yr-RS2-IC2-monthly-output",
-    "era5-co2-81yr-RS2-IC0-monthly-output",
-    "shield-amip-1deg-ace2-inference-10yr-IC0",
-    "shield-amip-1deg-ace2-inference-10yr-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-fixedCO2-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-fixedCO2-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-fixedCO2-IC2",
-    "shield-amip-1deg-reference-inference-10yr",
-    "shield-amip-1deg-reference-inference-10yr-1941",
-    "shield-amip-1deg-reference-inference-10yr-1951",
-    "shield-amip-1deg-reference-inference-10yr-1961",
-    "shield-amip-1deg-reference-inference-10yr-1971",
-    "shield-amip-1deg-reference-inference-10yr-1981",
-    "shield-amip-1deg-reference-inference-10yr-1991",
-    "shield-amip-1deg-reference-inference-10yr-2011",
-    "shield-amip-1deg-reference-inference-81yr",
-    "shield-amip-IC1-vs-era5-10yr",
-    "shield-amip-IC2-vs-era5-10yr",
-    "shield-amip-IC1-vs-era5-81yr",
-    "shield-amip-IC2-vs-era5-81yr",
-    "shield-amip-c96-vs-c24-4deg-10yr-IC0",
-    "shield-amip-c96-vs-c24-4deg-10yr-IC1",
-    "shield-amip-c96-vs-c24-4deg-81yr-IC0",
-    "shield-amip-c96-vs-c24-4deg-81yr-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-RS0-IC0",
-    "shield-amip-1deg-ace2-inference-10yr-RS0-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-RS0-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-RS0-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-RS0-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-RS0-IC2",
-    "shield-amip-1deg-ace2-inference-10yr-RS1-IC0",
-    "shield-amip-1deg-ace2-inference-10yr-RS1-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-RS1-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-RS1-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-RS1-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-RS1-IC2",
-    "shield-amip-1deg-ace2-inference-10yr-RS2-IC0",
-    "shield-amip-1deg-ace2-inference-10yr-RS2-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-RS2-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-RS2-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-RS2-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-RS2-IC2",
-    "shield-amip-1deg-ace2-inference-10yr-RS3-IC0",
-    "shield-amip-1deg-ace2-inference-10yr-RS3-IC1",
-    "shield-amip-1deg-ace2-inference-10yr-RS3-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-RS3-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-RS3-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-RS3-IC2",
-    "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC0",
-    "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC1",
-    "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC2",
-    "shield-amip-1deg-ace-climsst-inference-10yr-IC0",
-    "shield-amip-1deg-ace-climsst-inference-10yr-IC1",
-    "shield-amip-1deg-ace-climsst-inference-10yr-IC2",
-    "shield-amip-1deg-ace-climsst-inference-81yr-IC0",
-    "shield-amip-1deg-ace-climsst-inference-81yr-IC1",
-    "shield-amip-1deg-ace-climsst-inference-81yr-IC2",
-    "shield-amip-no-constraints-10yr-IC0-rerun",
-    "shield-amip-no-constraints-10yr-IC1-rerun",
-    "shield-amip-no-constraints-10yr-IC2-rerun",
-    "shield-amip-dry-air-10yr-IC0-rerun",
-    "shield-amip-dry-air-10yr-IC1-rerun",
-    "shield-amip-dry-air-10yr-IC2-rerun",
-    "shield-amip-dry-air-and-moisture-10yr-IC0-rerun",
-    "shield-amip-dry-air-and-moisture-10yr-IC1-rerun",
-    "shield-amip-dry-air-and-moisture-10yr-IC2-rerun",
-    "shield-amip-1deg-ace2-inference-10yr-IC0-monthly",
-    "shield-amip-1deg-ace2-inference-10yr-IC1-monthly",
-    "shield-amip-1deg-ace2-inference-10yr-IC2-monthly",
-    "shield-amip-1deg-ace2-inference-81yr-IC0-monthly",
-    "era5-ace2-inference-perturbed-30yr-ms2-0p0-IC0",
-    "era5-ace2-inference-perturbed-30yr-ms2-0p5-IC0",
-    "era5-ace2-inference-perturbed-30yr-ms2-1p0-IC0",
-    "era5-ace2-inference-perturbed-30yr-ms2-2p0-IC0",
-    "era5-ace2-inference-perturbed-30yr-ms2-4p0-IC0",
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+from ace2_launch import load_script
+from ace2_launch.cache import get_cache_dir, write_atomic
+from ace2_launch.ledger import SubmissionLedger, get_default_ledger_path
+
+WANDB_IDS_FILENAME = "wandb_ids.yaml"
+LAUNCH_SCRIPTS = [
+    "experiments/evaluator-era5-main/run.py",
+    "experiments/evaluator-era5-main/run-segmented.py",
+    "experiments/evaluator-era5-main/run-1000yr.py",
+    "experiments/evaluator-era5-main/run-rs-comparison.py",
+    "experiments/evaluator-era5-main/run-weather-forecast.py",
+    "experiments/evaluator-shield-amip-1deg/run.py",
+    "experiments/evaluator-shield-constraints-ablation/run.py",
+    "experiments/evaluator-amip-plus-uniform-sst/run.py",
+]
+# stands in for the wandb ID of experiments which were never submitted, e.g.
+# ICs which were run as one batched job, so that they are looked up again
+NOT_SUBMITTED: Any = object()
+NOT_SUBMITTED_TTL_DAYS = 7.0
+# submitted under names which the launcher scripts no longer give
+LEGACY_EXPERIMENT_NAMES = [
     "shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p0-IC0",
     "shield-amip-1deg-ace2-inference-perturbed-30yr-ms-0p5-IC0",
     "shield-amip-1deg-ace2-inference-perturbed-30yr-ms-1p0-IC0",
@@ -126,19 +57,126 @@ beaker_experiment_names = [
     "shield-amip-1deg-ace2-inference-perturbed-30yr-ms-4p0-IC0",
 ]
 
-# assuming all runs are using same wandb entity and project
-wandb_ids = {}
-for name in beaker_experiment_names:
-    print(f"Getting wandb id for {name}")
-    output = utils.beaker_experiment_to_wandb(name)
+
+def get_experiment_names() -> List[str]:
+    names = []
+    for path in LAUNCH_SCRIPTS:
+        script = load_script(str(REPO_ROOT / path))
+        names.extend(experiment.name for experiment in script.experiments)
+    names.extend(LEGACY_EXPERIMENT_NAMES)
+    return list(dict.fromkeys(names))
+
+
+def get_not_submitted_path() -> Path:
+    return get_cache_dir() / "wandb-ids-not-submitted.yaml"
+
+
+def load_not_submitted(ttl_days: float = NOT_SUBMITTED_TTL_DAYS) -> Dict[str, float]:
+    """Return the times names were last found to have no beaker experiment,
+    leaving out those found longer ago than ttl_days."""
+    try:
+        with open(get_not_submitted_path()) as f:
+            looked_up = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
+    oldest = time.time() - ttl_days * 24 * 3600
+    return {name: when for name, when in looked_up.items() if when >= oldest}
+
+
+def save_not_submitted(looked_up: Dict[str, float]):
+    write_atomic(get_not_submitted_path(), yaml.safe_dump(looked_up).encode())
+
+
+def check_names(wandb_ids: Dict[str, Optional[str]], names: List[str]):
+    """Raise if names in the existing file are no longer given by the launcher
+    scripts, which would drop them when the file is refreshed."""
+    dropped = sorted(set(wandb_ids) - set(names))
+    if len(dropped) > 0:
+        raise SystemExit(
+            f"The experiments {dropped} are in the existing wandb IDs but not in "
+            "the launcher scripts, add them to LAUNCH_SCRIPTS or "
+            "LEGACY_EXPERIMENT_NAMES"
+        )
+
+
+def get_ledger_wandb_ids(names: List[str]) -> Dict[str, str]:
+    """Return the wandb IDs recorded when the experiments were submitted from
+    this machine, without creating a ledger if there is none."""
+    if len(names) == 0 or not get_default_ledger_path().exists():
+        return {}
+    ledger = SubmissionLedger()
+    try:
+        recorded = ledger.get_wandb_ids(names)
+    finally:
+        ledger.close()
+    return {name: id_ for name, id_ in recorded.items() if id_ is not None}
+
+
+def get_beaker_wandb_id(name: str) -> Optional[str]:
+    """Return the wandb ID linked from the experiment's logs, None if there is
+    none, or NOT_SUBMITTED if there is no such experiment."""
+    try:
+        output = utils.beaker_experiment_to_wandb(name)
+    except (beaker.exceptions.ExperimentNotFound, FixtureNotFoundError):
+        # one write per line, as experiments are looked up in threads
+        print(f"WARNING: No beaker experiment {name}. Leaving it out.\n", end="")
+        return NOT_SUBMITTED
     if output is None:
-        print(f"WARNING: Could not get wandb id for {name}. Using None.")
-        id_ = None
-    else:
-        entity, project, id_ = output
-        assert entity == "ai2cm"
-        assert project == "ace"
-    wandb_ids[name] = id_
-
-with open("wandb_ids.yaml", "w") as f:
-    yaml.safe_dump(wandb_ids, f)
+        print(f"WARNING: Could not get wandb id for {name}. Using None.\n", end="")
+        return None
+    # assuming all runs are using same wandb entity and project
+    entity, project, id_ = output
+    assert entity == "ai2cm"
+    assert project == "ace"
+    return id_
+
+
+def main(path: str, max_workers: int, refresh: bool):
+    existing: Dict[str, Optional[str]] = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = yaml.safe_load(f) or {}
+    names = get_experiment_names()
+    check_names(existing, names)
+    wandb_ids = dict(existing)
+    not_submitted = {} if refresh else load_not_submitted()
+    missing = [
+        name
+        for name in names
+        if (refresh or wandb_ids.get(name) is None) and name not in not_submitted
+    ]
+    print(f"Getting wandb ids for {len(missing)} of {len(names)} experiments")
+    from_ledger = get_ledger_wandb_ids(missing)
+    wandb_ids.update(from_ledger)
+    missing = [name for name in missing if name not in from_ledger]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for name, id_ in zip(missing, executor.map(get_beaker_wandb_id, missing)):
+            if id_ is NOT_SUBMITTED:
+                not_submitted[name] = time.time()
+            elif id_ is not None:
+                wandb_ids[name] = id_
+            elif name not in wandb_ids:
+                wandb_ids[name] = None
+    save_not_submitted(not_submitted)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        yaml.safe_dump(wandb_ids, f)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=WANDB_IDS_FILENAME)
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="beaker experiments whose logs are read at once",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="look up every name again, keeping known IDs if none is found",
+    )
+    args = parser.parse_args()
+    main(args.path, args.max_workers, args.refresh)
@@ -0,0 +1,304 @@
+"""Opt-in instrumentation of the time, data transfer and memory of the notebook
+data access utilities.
+
+Functions decorated with instrument record a CallRecord per call into the
+process-wide COLLECTOR while profiling is enabled, e.g.
+
+    with io_profile.profile_io() as profile:
+        ds = utils.load_ensemble(...)
+    print(profile.table())
+    profile.to_json("io-profile.json")
+
+Bytes and cache hits are counted by the caches as they are used, and are
+attributed to the outermost instrumented call of the context they are counted
+in, so nested calls are not counted twice and calls running concurrently in
+different threads are counted separately. Work fanned out to threads by a call
+is attributed to it if submitted to a ContextThreadPoolExecutor, which runs it
+in a copy of the submitting context. Data read lazily, e.g. by dask when a
+dataset is computed, is counted in COLLECTOR.unattributed instead. Peak
+RSS is the peak resident memory of the process while the call ran, sampled from
+/proc/self/statm every RSS_SAMPLE_SECONDS. Where there is no /proc it is the
+high-water mark of the process up to the end of the call instead.
+"""
+
+import concurrent.futures
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable)
+RSS_SAMPLE_SECONDS = 0.01
+
+
+@dataclasses.dataclass
+class TransferCounts:
+    bytes_fetched: int = 0
+    bytes_served: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+@dataclasses.dataclass
+class CallRecord:
+    """Wall time, transfers and memory of a call of an instrumented function.
+
+    Attributes:
+        function: name of the function.
+        wall_seconds: wall time of the call.
+        bytes_fetched: bytes downloaded during the call.
+        bytes_served: bytes read from local caches during the call.
+        cache_hits: requests served from local caches.
+        cache_misses: requests which had to be downloaded.
+        peak_rss_bytes: peak resident memory of the process during the call.
+    """
+
+    function: str
+    wall_seconds: float
+    bytes_fetched: int
+    bytes_served: int
+    cache_hits: int
+    cache_misses: int
+    peak_rss_bytes: int
+
+
+def get_peak_rss() -> int:
+    """Return the high-water mark of the resident memory of the process in
+    bytes, over its whole lifetime."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_current_rss() -> Optional[int]:
+    """Return the resident memory of the process in bytes, or None if there is
+    no /proc/self/statm."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class RSSSampler:
+    """Samples the resident memory of the process in a background thread, to
+    find its peak between start and stop."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        rss = get_current_rss()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "RSSSampler":
+        self._sample()
+        if get_current_rss() is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> int:
+        """Stop sampling and return the peak resident memory in bytes, or the
+        high-water mark of the process if it cannot be sampled."""
+        if self._thread is None:
+            return get_peak_rss()
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+def _format_bytes(n_bytes: float) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(n_bytes) < 1000:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1000
+    return f"{n_bytes:.1f} TB"
+
+
+class IOCollector:
+    """Records of instrumented calls made while profiling is enabled."""
+
+    def __init__(self):
+        self.records: List[CallRecord] = []
+        self.unattributed = TransferCounts()
+        self._n_enabled = 0
+        self._lock = threading.Lock()
+        self._current: contextvars.ContextVar[Optional[TransferCounts]] = (
+            contextvars.ContextVar("current_call_counts", default=None)
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._n_enabled > 0
+
+    def count(self, **counts: int):
+        """Add to the transfer counts of the instrumented call of the current
+        context, or to the unattributed counts if there is none, given as fields
+        of TransferCounts."""
+        current = self._current.get()
+        target = self.unattributed if current is None else current
+        with self._lock:
+            for name, value in counts.items():
+                setattr(target, name, getattr(target, name) + value)
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call func, recording it if it is the outermost instrumented call of
+        the current context."""
+        if self._current.get() is not None:
+            return func(*args, **kwargs)
+        counts = TransferCounts()
+        token = self._current.set(counts)
+        sampler = RSSSampler().start()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall_seconds = time.perf_counter() - start
+            self._current.reset(token)
+            with self._lock:
+                totals = dataclasses.replace(counts)
+            record = CallRecord(
+                function=func.__name__,
+                wall_seconds=wall_seconds,
+                bytes_fetched=totals.bytes_fetched,
+                bytes_served=totals.bytes_served,
+                cache_hits=totals.cache_hits,
+                cache_misses=totals.cache_misses,
+                peak_rss_bytes=sampler.stop(),
+            )
+            with self._lock:
+                self.records.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+            self.unattributed = TransferCounts()
+
+    def summarize(self) -> Dict[str, Dict[str, float]]:
+        """Return totals of the records of each function, with the maximum of
+        their peak RSS."""
+        summary: Dict[str, Dict[str, float]] = {}
+        for record in self.records:
+            totals = summary.setdefault(
+                record.function,
+                {
+                    "calls": 0,
+                    "wall_seconds": 0.0,
+                    "bytes_fetched": 0,
+                    "bytes_served": 0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                    "peak_rss_bytes": 0,
+                },
+            )
+            totals["calls"] += 1
+            for name in (
+                "wall_seconds",
+                "bytes_fetched",
+                "bytes_served",
+                "cache_hits",
+                "cache_misses",
+            ):
+                totals[name] += getattr(record, name)
+            totals["peak_rss_bytes"] = max(
+                totals["peak_rss_bytes"], record.peak_rss_bytes
+            )
+        return summary
+
+    def table(self) -> str:
+        """Return a table of the totals of each function, slowest first."""
+        summary = self.summarize()
+        width = max([len("function")] + [len(name) for name in summary])
+        lines = [
+            f"{'function':<{width}}  calls  wall (s)     fetched      cached"
+            "   hits  misses    peak RSS"
+        ]
+        for name, totals in sorted(
+            summary.items(), key=lambda item: -item[1]["wall_seconds"]
+        ):
+            lines.append(
+                f"{name:<{width}}  {totals['calls']:>5}  "
+                f"{totals['wall_seconds']:>8.2f}  "
+                f"{_format_bytes(totals['bytes_fetched']):>10}  "
+                f"{_format_bytes(totals['bytes_served']):>10}  "
+                f"{totals['cache_hits']:>5}  {totals['cache_misses']:>6}  "
+                f"{_format_bytes(totals['peak_rss_bytes']):>10}"
+            )
+        return "\n".join(lines)
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        """Return the records and their summary as JSON, also writing it to
+        path if given."""
+        data = json.dumps(
+            {
+                "records": [dataclasses.asdict(record) for record in self.records],
+                "summary": self.summarize(),
+            },
+            indent=1,
+        )
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(data)
+        return data
+
+
+COLLECTOR = IOCollector()
+
+
+class ContextThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Thread pool which runs each task in a copy of the context it was
+    submitted from, so transfers of the task are attributed to the
+    instrumented call which submitted it."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def count_transfer(**counts: int):
+    """Count transfers, given as fields of TransferCounts, if profiling."""
+    if COLLECTOR.enabled:
+        COLLECTOR.count(**counts)
+
+
+def instrument(func: F) -> F:
+    """Record calls of func while profiling is enabled."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not COLLECTOR.enabled:
+            return func(*args, **kwargs)
+        return COLLECTOR.call(func, *args, **kwargs)
+
+    return wrapper  # type: ignore
+
+
+@contextlib.contextmanager
+def profile_io(reset: bool = True) -> Iterator[IOCollector]:
+    """Record instrumented calls made within the context, discarding earlier
+    records unless reset is False."""
+    if reset:
+        COLLECTOR.reset()
+    COLLECTOR._n_enabled += 1
+    try:
+        yield COLLECTOR
+    finally:
+        COLLECTOR._n_enabled -= 1
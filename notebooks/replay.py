@@ -0,0 +1,572 @@
+"""Record/replay of the wandb and beaker calls made by the notebook utilities
+and plot scripts, so their data paths can be run and timed without network
+access or credentials.
+
+The mode is chosen with the ACE2_PAPER_REPLAY environment variable:
+
+- unset: get_wandb_api and get_beaker_client return the real clients;
+- "record": calls go to the real clients, and their responses and file
+  payloads are saved to the fixture directory;
+- "replay": calls are served from the fixture directory alone, raising
+  FixtureNotFoundError for calls which were not recorded.
+
+The fixture directory is set with ACE2_PAPER_FIXTURE_DIR, "./fixtures" by
+default. Only the parts of the API used by this repository are supported:
+
+    fixtures/
+        wandb/runs/<entity>/<project>/<id>.json    state, config and summary
+        wandb/history/<entity>/<project>/<id>/<key hash>.json    history rows
+        beaker/experiments/<name or ID>.json    experiment and result IDs
+        beaker/logs/<name or ID>.log    log bytes up to where reading stopped
+        beaker/datasets/<dataset ID>/<path>    file payloads
+        beaker/datasets/<dataset ID>/<path>.ranges.json    byte ranges recorded
+        beaker/file_info/<dataset ID>/<path>.json    file sizes
+
+Logs and files are recorded as far as they were read, so replay serves what
+the recorded code used, e.g. the byte ranges read by ResultFileCache.open_ranged.
+Reads of byte ranges which were not recorded raise FixtureNotFoundError.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import types
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+MODE_ENV_VAR = "ACE2_PAPER_REPLAY"
+FIXTURE_DIR_ENV_VAR = "ACE2_PAPER_FIXTURE_DIR"
+DEFAULT_FIXTURE_DIR = "./fixtures"
+RECORD = "record"
+REPLAY = "replay"
+# pages of replayed logs and file streams
+PAGE_SIZE = 2**16
+
+
+class FixtureNotFoundError(FileNotFoundError):
+    pass
+
+
+def get_mode() -> Optional[str]:
+    mode = os.environ.get(MODE_ENV_VAR) or None
+    if mode not in (None, RECORD, REPLAY):
+        raise ValueError(
+            f"{MODE_ENV_VAR} must be unset, {RECORD!r} or {REPLAY!r}, got {mode!r}"
+        )
+    return mode
+
+
+def get_fixture_store() -> "FixtureStore":
+    return FixtureStore(os.environ.get(FIXTURE_DIR_ENV_VAR, DEFAULT_FIXTURE_DIR))
+
+
+def get_wandb_api():
+    """Return a wandb.Api, or its recording or replaying stand-in."""
+    mode = get_mode()
+    if mode == REPLAY:
+        return ReplayWandbApi(get_fixture_store())
+    import wandb
+
+    api = wandb.Api()
+    if mode == RECORD:
+        return RecordingWandbApi(api, get_fixture_store())
+    return api
+
+
+def get_beaker_client():
+    """Return a beaker.Beaker client, or its recording or replaying stand-in."""
+    mode = get_mode()
+    if mode == REPLAY:
+        return ReplayBeaker(get_fixture_store())
+    import beaker
+
+    client = beaker.Beaker.from_env()
+    if mode == RECORD:
+        return RecordingBeaker(client, get_fixture_store())
+    return client
+
+
+def _to_json(value: Any) -> Any:
+    """Return value with anything JSON cannot represent, e.g. media in a run
+    summary, replaced by None."""
+    return json.loads(json.dumps(value, default=lambda _: None))
+
+
+def _get_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _ranges_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.ranges.json")
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _covers(ranges: List[Tuple[int, int]], start: int, end: int) -> bool:
+    """Return whether merged ranges cover the range from start to end."""
+    if start >= end:
+        return True
+    return any(s <= start and end <= e for s, e in ranges)
+
+
+class FixtureStore:
+    """Files of recorded responses under a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def path(self, *parts: str) -> Path:
+        return self.directory.joinpath(*parts)
+
+    def _existing_path(self, *parts: str) -> Path:
+        path = self.path(*parts)
+        if not path.exists():
+            raise FixtureNotFoundError(
+                f"No recorded response at {path}, record one by running with "
+                f"{MODE_ENV_VAR}={RECORD}"
+            )
+        return path
+
+    def read_json(self, *parts: str) -> Any:
+        with open(self._existing_path(*parts)) as f:
+            return json.load(f)
+
+    def write_json(self, value: Any, *parts: str):
+        self.write_bytes(json.dumps(value, indent=1, sort_keys=True).encode(), *parts)
+
+    def read_bytes(
+        self, *parts: str, offset: int = 0, length: Optional[int] = None
+    ) -> bytes:
+        with open(self._existing_path(*parts), "rb") as f:
+            f.seek(offset)
+            return f.read() if length is None or length < 0 else f.read(length)
+
+    def write_bytes(self, data: bytes, *parts: str):
+        path = self.path(*parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_index(self, path: Path) -> Dict[str, Any]:
+        try:
+            with open(_ranges_path(path)) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {"ranges": [], "size": None}
+        index["ranges"] = [tuple(r) for r in index["ranges"]]
+        return index
+
+    def write_range(
+        self, data: bytes, offset: int, *parts: str, size: Optional[int] = None
+    ):
+        """Write data at an offset of a file, which may be written concurrently
+        at other offsets, and add the range to the file's index of recorded
+        ranges along with its size, if given."""
+        path = self.path(*parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            # serializes updates of the index, across threads and processes
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.pwrite(fd, data, offset)
+            index = self._read_index(path)
+            if len(data) > 0:
+                index["ranges"] = _merge_ranges(
+                    index["ranges"] + [(offset, offset + len(data))]
+                )
+            if size is not None:
+                index["size"] = size
+            self.write_json(index, *parts[:-1], f"{parts[-1]}.ranges.json")
+        finally:
+            os.close(fd)
+
+    def read_range(
+        self, *parts: str, offset: int = 0, length: int = -1, size: Optional[int] = None
+    ) -> bytes:
+        """Read a range of a file written by write_range, to its end if length
+        is negative, given the size of the file if its index does not have it.
+
+        Raises:
+            FixtureNotFoundError: if any of the range was not recorded.
+        """
+        path = self._existing_path(*parts)
+        index = self._read_index(path)
+        if index["size"] is not None:
+            size = index["size"]
+        end = offset + length if length >= 0 else size
+        if end is None:
+            raise FixtureNotFoundError(
+                f"The size of {path} was not recorded, record it by running "
+                f"with {MODE_ENV_VAR}={RECORD}"
+            )
+        if size is not None:
+            end = min(end, size)
+        if not _covers(index["ranges"], offset, end):
+            raise FixtureNotFoundError(
+                f"Bytes {offset} to {end} of {path} were not recorded, record "
+                f"them by running with {MODE_ENV_VAR}={RECORD}"
+            )
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(end - offset)
+
+
+def _pages(data: bytes) -> Iterator[bytes]:
+    for start in range(0, len(data), PAGE_SIZE):
+        yield data[start : start + PAGE_SIZE]
+
+
+# wandb
+
+
+def _run_parts(entity: str, project: str, id: str) -> List[str]:
+    return ["wandb", "runs", entity, project, f"{id}.json"]
+
+
+def _history_parts(entity: str, project: str, id: str, key: str) -> List[str]:
+    return ["wandb", "history", entity, project, id, f"{key}.json"]
+
+
+class ReplayRun:
+    """A wandb run served from recorded responses."""
+
+    def __init__(self, store: FixtureStore, entity: str, project: str, id: str):
+        self._store = store
+        self._path = (entity, project, id)
+        recorded = store.read_json(*_run_parts(entity, project, id))
+        self.entity = entity
+        self.project = project
+        self.id = id
+        self.state = recorded["state"]
+        self.config = recorded["config"]
+        self.summary_metrics = recorded["summary_metrics"]
+        self.summary = dict(recorded["summary_metrics"])
+        self.lastHistoryStep = recorded["lastHistoryStep"]
+
+    def history(self, samples: int = 500, keys: Optional[Sequence[str]] = None, **_):
+        import pandas as pd
+
+        key = _get_key("history", samples, sorted(keys or []))
+        return pd.DataFrame(self._store.read_json(*_history_parts(*self._path, key)))
+
+    def scan_history(
+        self,
+        keys: Optional[Sequence[str]] = None,
+        page_size: int = 1000,
+        min_step: Optional[int] = None,
+        max_step: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        key = _get_key("scan_history", sorted(keys or []))
+        for row in self._store.read_json(*_history_parts(*self._path, key)):
+            step = row["_step"]
+            if (min_step is None or step >= min_step) and (
+                max_step is None or step < max_step
+            ):
+                yield row
+
+
+class ReplayWandbApi:
+    """Stand-in for wandb.Api serving runs recorded by RecordingWandbApi."""
+
+    def __init__(self, store: FixtureStore):
+        self._store = store
+
+    def run(self, path: str) -> ReplayRun:
+        entity, project, id = path.split("/")[-3:]
+        return ReplayRun(self._store, entity, project, id)
+
+    def runs(
+        self, path: str, filters: Optional[dict] = None, per_page: int = 50
+    ) -> List[ReplayRun]:
+        """Return the recorded runs with the given IDs, filtered by
+        {"name": <ID>} or {"name": {"$in": [<ID>, ...]}}, leaving out those
+        which were not recorded."""
+        name = (filters or {}).get("name")
+        if isinstance(name, str):
+            ids = [name]
+        elif isinstance(name, dict) and set(name) == {"$in"}:
+            ids = list(name["$in"])
+        else:
+            ids = None
+        if ids is None or set(filters or {}) != {"name"}:
+            raise FixtureNotFoundError(
+                f"Runs of {path} selected by filters {filters} cannot be replayed, "
+                "only runs selected by ID with {'name': <ID>} or "
+                "{'name': {'$in': [<ID>, ...]}}"
+            )
+        entity, project = path.split("/")[-2:]
+        runs = []
+        for id in ids:
+            if self._store.path(*_run_parts(entity, project, id)).exists():
+                runs.append(ReplayRun(self._store, entity, project, id))
+        return runs
+
+
+class RecordingRun:
+    """A wandb run which records its responses as it is used."""
+
+    def __init__(self, run, store: FixtureStore):
+        self._run = run
+        self._store = store
+        self._path = (run.entity, run.project, run.id)
+        self._lock = threading.Lock()
+        store.write_json(
+            {
+                "state": run.state,
+                "config": _to_json(dict(run.config)),
+                "summary_metrics": _to_json(dict(run.summary_metrics)),
+                "lastHistoryStep": run.lastHistoryStep,
+            },
+            *_run_parts(*self._path),
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._run, name)
+
+    def history(
+        self, samples: int = 500, keys: Optional[Sequence[str]] = None, **kwargs
+    ):
+        df = self._run.history(samples=samples, keys=keys, **kwargs)
+        key = _get_key("history", samples, sorted(keys or []))
+        self._store.write_json(
+            _to_json(df.to_dict(orient="list")), *_history_parts(*self._path, key)
+        )
+        return df
+
+    def scan_history(
+        self,
+        keys: Optional[Sequence[str]] = None,
+        page_size: int = 1000,
+        min_step: Optional[int] = None,
+        max_step: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        rows = list(
+            self._run.scan_history(
+                keys=keys, page_size=page_size, min_step=min_step, max_step=max_step
+            )
+        )
+        # step ranges scanned concurrently are merged into one recording
+        key = _get_key("scan_history", sorted(keys or []))
+        parts = _history_parts(*self._path, key)
+        with self._lock:
+            try:
+                recorded = self._store.read_json(*parts)
+            except FixtureNotFoundError:
+                recorded = []
+            by_step = {row["_step"]: row for row in recorded}
+            by_step.update((row["_step"], row) for row in _to_json(rows))
+            self._store.write_json([by_step[step] for step in sorted(by_step)], *parts)
+        return iter(rows)
+
+
+class RecordingWandbApi:
+    """Wrapper of wandb.Api which records the runs it returns."""
+
+    def __init__(self, api, store: FixtureStore):
+        self._api = api
+        self._store = store
+
+    def run(self, path: str) -> RecordingRun:
+        return RecordingRun(self._api.run(path), self._store)
+
+    def runs(self, path: str, filters: Optional[dict] = None, per_page: int = 50):
+        return [
+            RecordingRun(run, self._store)
+            for run in self._api.runs(path, filters=filters, per_page=per_page)
+        ]
+
+
+# beaker
+
+
+def _experiment_namespace(recorded: Dict[str, Any]) -> types.SimpleNamespace:
+    jobs = [
+        types.SimpleNamespace(
+            result=types.SimpleNamespace(beaker=result_id),
+            execution=types.SimpleNamespace(
+                result=types.SimpleNamespace(beaker=result_id)
+            ),
+        )
+        for result_id in recorded["job_results"]
+    ]
+    return types.SimpleNamespace(id=recorded["id"], name=recorded["name"], jobs=jobs)
+
+
+def _get_job_result(job) -> Optional[str]:
+    for attrs in (("result", "beaker"), ("execution", "result", "beaker")):
+        value = job
+        for attr in attrs:
+            value = getattr(value, attr, None)
+        if value is not None:
+            return value
+    return None
+
+
+class ReplayExperimentClient:
+    def __init__(self, store: FixtureStore):
+        self._store = store
+
+    def get(self, experiment: str) -> types.SimpleNamespace:
+        recorded = self._store.read_json("beaker", "experiments", f"{experiment}.json")
+        return _experiment_namespace(recorded)
+
+    def results(self, experiment: str) -> types.SimpleNamespace:
+        recorded = self._store.read_json("beaker", "experiments", f"{experiment}.json")
+        return types.SimpleNamespace(id=recorded["results"])
+
+    def logs(self, experiment: str, quiet: bool = False, **_) -> Iterator[bytes]:
+        yield from _pages(self._store.read_bytes("beaker", "logs", f"{experiment}.log"))
+
+
+class ReplayDatasetClient:
+    def __init__(self, store: FixtureStore):
+        self._store = store
+
+    def file_info(self, dataset: str, file: str) -> types.SimpleNamespace:
+        recorded = self._store.read_json("beaker", "file_info", dataset, f"{file}.json")
+        return types.SimpleNamespace(path=file, size=recorded["size"])
+
+    def stream_file(
+        self,
+        dataset: str,
+        file: str,
+        offset: int = 0,
+        length: int = -1,
+        quiet: bool = False,
+        **_,
+    ) -> Iterator[bytes]:
+        try:
+            size = self.file_info(dataset, file).size
+        except FixtureNotFoundError:
+            size = None
+        yield from _pages(
+            self._store.read_range(
+                "beaker",
+                "datasets",
+                dataset,
+                file,
+                offset=offset,
+                length=length,
+                size=size,
+            )
+        )
+
+
+class ReplayBeaker:
+    """Stand-in for beaker.Beaker serving responses recorded by
+    RecordingBeaker."""
+
+    def __init__(self, store: FixtureStore):
+        self.experiment = ReplayExperimentClient(store)
+        self.dataset = ReplayDatasetClient(store)
+
+
+class RecordingExperimentClient:
+    def __init__(self, client, store: FixtureStore):
+        self._client = client
+        self._store = store
+        self._lock = threading.Lock()
+
+    def _update(self, experiment: str, **values: Any):
+        parts = ("beaker", "experiments", f"{experiment}.json")
+        with self._lock:
+            try:
+                recorded = self._store.read_json(*parts)
+            except FixtureNotFoundError:
+                recorded = {
+                    "id": None,
+                    "name": None,
+                    "job_results": [],
+                    "results": None,
+                }
+            recorded.update(values)
+            self._store.write_json(recorded, *parts)
+
+    def get(self, experiment: str):
+        result = self._client.get(experiment)
+        self._update(
+            experiment,
+            id=result.id,
+            name=result.name,
+            job_results=[_get_job_result(job) for job in result.jobs],
+        )
+        return result
+
+    def results(self, experiment: str):
+        result = self._client.results(experiment)
+        self._update(experiment, results=None if result is None else result.id)
+        return result
+
+    def logs(self, experiment: str, quiet: bool = False, **kwargs) -> Iterator[bytes]:
+        pages = []
+        try:
+            for page in self._client.logs(experiment, quiet=quiet, **kwargs):
+                pages.append(page)
+                yield page
+        finally:
+            # also when the reader stops early
+            self._store.write_bytes(
+                b"".join(pages), "beaker", "logs", f"{experiment}.log"
+            )
+
+
+class RecordingDatasetClient:
+    def __init__(self, client, store: FixtureStore):
+        self._client = client
+        self._store = store
+
+    def file_info(self, dataset: str, file: str):
+        info = self._client.file_info(dataset, file)
+        self._store.write_json(
+            {"size": info.size}, "beaker", "file_info", dataset, f"{file}.json"
+        )
+        return info
+
+    def stream_file(
+        self,
+        dataset: str,
+        file: str,
+        offset: int = 0,
+        length: int = -1,
+        quiet: bool = False,
+        **kwargs,
+    ) -> Iterator[bytes]:
+        position = offset
+        for chunk in self._client.stream_file(
+            dataset, file, offset=offset, length=length, quiet=quiet, **kwargs
+        ):
+            self._store.write_range(
+                chunk, position, "beaker", "datasets", dataset, file
+            )
+            position += len(chunk)
+            yield chunk
+        if length < 0 or position < offset + length:
+            # the stream ended at the end of the file
+            self._store.write_range(
+                b"", position, "beaker", "datasets", dataset, file, size=position
+            )
+
+
+class RecordingBeaker:
+    """Wrapper of beaker.Beaker which records the responses it returns."""
+
+    def __init__(self, client, store: FixtureStore):
+        self._client = client
+        self.experiment = RecordingExperimentClient(client.experiment, store)
+        self.dataset = RecordingDatasetClient(client.dataset, store)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
@@ -0,0 +1,480 @@
+"""Persistent local cache of files from beaker result datasets.
+
+Beaker datasets do not change once written, so a file is identified by its
+dataset ID and path and never needs to be fetched twice. Files are stored under
+a name derived from a hash of the two, written atomically so that concurrent
+kernels never see partial files, and evicted least recently used first once
+the cache grows beyond its size cap. The access time of a file is its
+modification time, which is updated on every hit, so that processes sharing a
+cache directory agree on the order of eviction without a shared index. Each
+process walks the cache directory once to count its size, then keeps a running
+total of the files it adds, and only walks it again to evict once the total
+passes the cap. Files added by other processes are counted at that walk.
+
+Files can also be read in place with byte-range requests through open_ranged,
+for reading a few variables or times of a large file. The file is split into
+fixed-size blocks which are fetched when first read and cached alongside whole
+files, so the HDF5 metadata locating each variable's chunks is only fetched
+once and later reads fetch just the chunks they need.
+
+Run this module as a script to serve a directory over HTTP with range request
+support, standing in for beaker when testing range reads:
+
+    python result_cache.py serve <directory> --port 8000
+"""
+
+import abc
+import argparse
+import dataclasses
+import hashlib
+import http.server
+import io
+import json
+import os
+import re
+import threading
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+from io_profile import count_transfer
+from replay import get_beaker_client
+
+BLOCK_SIZE = 2**20
+CACHE_DIR = os.environ.get(
+    "BEAKER_CACHE_DIR", os.path.join(Path.home(), ".cache", "ace2-paper", "beaker")
+)
+MAX_BYTES = int(float(os.environ.get("BEAKER_CACHE_MAX_GB", "50")) * 1e9)
+# fraction of the cap evictions free the cache down to, so that the cache is
+# not walked again for every file added once it is full
+EVICT_TO_FRACTION = 0.9
+
+
+def stream_beaker_file(dataset_id: str, path: str, f: BinaryIO):
+    """Write a file of a beaker dataset to f one chunk at a time."""
+    client = get_beaker_client()
+    for chunk in client.dataset.stream_file(dataset_id, path, quiet=True):
+        f.write(chunk)
+
+
+class RangeSource(abc.ABC):
+    """Somewhere byte ranges of dataset files can be read from."""
+
+    @abc.abstractmethod
+    def size(self, dataset_id: str, path: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    def read(self, dataset_id: str, path: str, offset: int, length: int) -> bytes:
+        ...
+
+
+class BeakerRangeSource(RangeSource):
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_beaker_client()
+        return self._client
+
+    def size(self, dataset_id: str, path: str) -> int:
+        return self.client.dataset.file_info(dataset_id, path).size
+
+    def read(self, dataset_id: str, path: str, offset: int, length: int) -> bytes:
+        # beaker-py only sends a Range header if offset > 0, and otherwise
+        # streams the whole file, so stop reading once length bytes arrive
+        chunks = self.client.dataset.stream_file(
+            dataset_id,
+            path,
+            offset=offset,
+            length=length,
+            quiet=True,
+            validate_checksum=False,
+            chunk_size=length,
+        )
+        data = bytearray()
+        try:
+            for chunk in chunks:
+                data += chunk
+                if len(data) >= length:
+                    break
+        finally:
+            chunks.close()
+        return bytes(data[:length])
+
+
+class HTTPRangeSource(RangeSource):
+    """Reads <base_url>/<dataset ID>/<path> with HTTP range requests, e.g. from
+    a server started by running this module."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def _url(self, dataset_id: str, path: str) -> str:
+        return f"{self.base_url}/{dataset_id}/{path}"
+
+    def size(self, dataset_id: str, path: str) -> int:
+        request = urllib.request.Request(self._url(dataset_id, path), method="HEAD")
+        with urllib.request.urlopen(request) as response:
+            return int(response.headers["Content-Length"])
+
+    def read(self, dataset_id: str, path: str, offset: int, length: int) -> bytes:
+        request = urllib.request.Request(
+            self._url(dataset_id, path),
+            headers={"Range": f"bytes={offset}-{offset + length - 1}"},
+        )
+        with urllib.request.urlopen(request) as response:
+            if response.status != 206:
+                raise IOError(
+                    f"Server does not support range requests: {response.status}"
+                )
+            return response.read()
+
+
+def format_bytes(n_bytes: float) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(n_bytes) < 1000:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1000
+    return f"{n_bytes:.1f} TB"
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_fetched: int = 0
+    bytes_served: int = 0
+    bytes_evicted: int = 0
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{format_bytes(self.bytes_fetched)} fetched, "
+            f"{format_bytes(self.bytes_served)} served from cache, "
+            f"{format_bytes(self.bytes_evicted)} evicted"
+        )
+
+
+class ResultFileCache:
+    """Local copies of beaker dataset files, keyed by (dataset ID, path).
+
+    Args:
+        directory: where cached files are stored, shared between processes.
+        max_bytes: size the cache is kept below by evicting least recently
+            used files. A single file larger than this is still cached until
+            the next file is fetched.
+        fetch: function writing the file with the given dataset ID and path to
+            a binary file object, streaming it from beaker by default.
+        range_source: where byte ranges are read from by open_ranged, beaker
+            by default.
+        block_size: size of the blocks read by open_ranged.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        max_bytes: int = MAX_BYTES,
+        fetch: Callable[[str, str, BinaryIO], None] = stream_beaker_file,
+        range_source: Optional[RangeSource] = None,
+        block_size: int = BLOCK_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.range_source = (
+            range_source if range_source is not None else BeakerRangeSource()
+        )
+        self.block_size = block_size
+        self.stats = CacheStats()
+        # files may be fetched from several threads at once
+        self._stats_lock = threading.Lock()
+        # bytes in the cache as of the last walk of it, plus those added since
+        self._total_bytes: Optional[int] = None
+        self._total_lock = threading.Lock()
+
+    def _count(
+        self,
+        hits: int = 0,
+        misses: int = 0,
+        bytes_fetched: int = 0,
+        bytes_served: int = 0,
+        bytes_evicted: int = 0,
+    ):
+        with self._stats_lock:
+            self.stats.hits += hits
+            self.stats.misses += misses
+            self.stats.bytes_fetched += bytes_fetched
+            self.stats.bytes_served += bytes_served
+            self.stats.bytes_evicted += bytes_evicted
+        count_transfer(
+            cache_hits=hits,
+            cache_misses=misses,
+            bytes_fetched=bytes_fetched,
+            bytes_served=bytes_served,
+        )
+
+    def _get_key(self, dataset_id: str, path: str) -> str:
+        return hashlib.sha256(f"{dataset_id}/{path}".encode()).hexdigest()
+
+    def _get_cached_path(self, dataset_id: str, path: str) -> Path:
+        key = self._get_key(dataset_id, path)
+        # keep the extension so that readers can infer the file format
+        return self.directory / key[:2] / f"{key}{Path(path).suffix}"
+
+    def get_path(self, dataset_id: str, path: str) -> Path:
+        """Return the local path of a file of a beaker dataset, fetching it if
+        it is not cached."""
+        cached_path = self._get_cached_path(dataset_id, path)
+        try:
+            size = cached_path.stat().st_size
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(cached_path)
+            self._count(hits=1, bytes_served=size)
+            return cached_path
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cached_path.with_name(f".{cached_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                self.fetch(dataset_id, path, f)
+            os.replace(tmp_path, cached_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        size = cached_path.stat().st_size
+        self._count(misses=1, bytes_fetched=size)
+        self._add_bytes(size, keep=cached_path)
+        return cached_path
+
+    def open_ranged(self, dataset_id: str, path: str) -> BinaryIO:
+        """Return a read-only file object for a file of a beaker dataset which
+        fetches only the blocks that are read.
+
+        If the whole file is cached, it is opened directly instead.
+        """
+        cached_path = self._get_cached_path(dataset_id, path)
+        if cached_path.exists():
+            return self.get_path(dataset_id, path).open("rb")  # type: ignore
+        key = self._get_key(dataset_id, path)
+        block_dir = self.directory / "blocks" / key[:2] / key
+        index_path = block_dir / "index.json"
+        try:
+            with open(index_path) as f:
+                size = json.load(f)["size"]
+        except FileNotFoundError:
+            size = self.range_source.size(dataset_id, path)
+            index = {"dataset_id": dataset_id, "path": path, "size": size}
+            _write_atomic(index_path, json.dumps(index).encode())
+        return RangedFile(  # type: ignore
+            lambda index: self._get_block(dataset_id, path, block_dir, size, index),
+            size,
+            self.block_size,
+        )
+
+    def _get_block(
+        self, dataset_id: str, path: str, block_dir: Path, size: int, index: int
+    ) -> bytes:
+        block_path = block_dir / f"{self.block_size}-{index}"
+        try:
+            with open(block_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(block_path)
+            self._count(hits=1, bytes_served=len(data))
+            return data
+        offset = index * self.block_size
+        data = self.range_source.read(
+            dataset_id, path, offset, min(self.block_size, size - offset)
+        )
+        _write_atomic(block_path, data)
+        self._count(misses=1, bytes_fetched=len(data))
+        self._add_bytes(len(data), keep=block_path)
+        return data
+
+    def _add_bytes(self, n_bytes: int, keep: Optional[Path] = None):
+        """Count a file added to the cache, evicting if it is over its cap or
+        its size has not been counted yet."""
+        with self._total_lock:
+            if self._total_bytes is not None:
+                self._total_bytes += n_bytes
+                if self._total_bytes <= self.max_bytes:
+                    return
+        self.evict(keep=keep)
+
+    def _list_files(self) -> List[Tuple[float, int, Path]]:
+        files = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                # in-progress fetches, and indexes which are kept
+                if filename.startswith(".") or filename == "index.json":
+                    continue
+                file_path = Path(dirpath, filename)
+                try:
+                    stat = file_path.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file_path))
+        return files
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._list_files())
+
+    def evict(self, keep: Optional[Path] = None):
+        """Delete least recently used files until the cache is below
+        EVICT_TO_FRACTION of its cap, walking the cache to recount its size.
+
+        Files which are open elsewhere, e.g. by lazily loaded datasets, stay
+        readable by those processes until they are closed.
+        """
+        files = sorted(self._list_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, file_path in files:
+            if total <= self.max_bytes * EVICT_TO_FRACTION:
+                break
+            if file_path == keep:
+                continue
+            try:
+                file_path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            self._count(bytes_evicted=size)
+        with self._total_lock:
+            self._total_bytes = total
+
+    def report(self) -> str:
+        return (
+            f"Beaker file cache at {self.directory}: {self.stats.report()}, "
+            f"{format_bytes(self.size())} of {format_bytes(self.max_bytes)} used"
+        )
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class RangedFile(io.RawIOBase):
+    """Read-only file made of fixed-size blocks which are fetched on demand.
+
+    Args:
+        get_block: returns the block with the given index.
+        size: size of the file.
+        block_size: size of every block but the last.
+    """
+
+    def __init__(self, get_block: Callable[[int], bytes], size: int, block_size: int):
+        self._get_block = get_block
+        self._size = size
+        self._block_size = block_size
+        self._position = 0
+        # the last block read, since readers often read a block piecewise
+        self._last_block: Tuple[int, bytes] = (-1, b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        return self._position
+
+    def _block(self, index: int) -> bytes:
+        if self._last_block[0] != index:
+            self._last_block = (index, self._get_block(index))
+        return self._last_block[1]
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        n_read = 0
+        while n_read < len(view) and self._position < self._size:
+            index, start = divmod(self._position, self._block_size)
+            block = self._block(index)[start : start + len(view) - n_read]
+            view[n_read : n_read + len(block)] = block
+            n_read += len(block)
+            self._position += len(block)
+        return n_read
+
+
+_DEFAULT_CACHE: Optional[ResultFileCache] = None
+
+
+def get_default_cache() -> ResultFileCache:
+    """Return the cache shared by the notebook utilities and plot scripts."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = ResultFileCache()
+    return _DEFAULT_CACHE
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files with support for single byte-range requests."""
+
+    def send_head(self):
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            return super().send_head()
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header.strip())
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        if start > end:
+            self.send_error(416)
+            return None
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+def serve(directory: str, port: int):
+    """Serve <directory>/<dataset ID>/<path> as HTTPRangeSource expects."""
+
+    def handler(*args, **kwargs):
+        return RangeRequestHandler(*args, directory=directory, **kwargs)
+
+    with http.server.ThreadingHTTPServer(("", port), handler) as server:
+        print(f"Serving {directory} with range requests at http://localhost:{port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("directory")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.directory, args.port)
@@ -0,0 +1,285 @@
+"""Index of the inference runs in wandb_ids.yaml by what they ran.
+
+Each beaker experiment name is parsed once into a RunKey of the model, dataset,
+duration, random seed (RS), initial condition (IC) and variant of the run, e.g.
+
+    shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC2
+    -> model="ace2-shield", dataset="shield-amip-1deg", duration="81yr",
+       rs=1, ic=2, variant="noCO2"
+
+and runs are selected by any of these fields, e.g.
+
+    registry = load_registry("wandb_ids.yaml")
+    registry.select(model="ace2-shield", duration="81yr", rs=2)
+    registry.ids_by_ic(model="ace2-era5", duration="10yr", rs=2, variant="ni")
+
+A name is split on dashes. Its first token giving a duration (e.g. "10yr",
+"15day") is the duration, tokens such as "RS2" or "rs2" and "IC10" give the
+seed and initial condition, the tokens before the duration give the model and
+dataset through MODELS, and the remaining tokens after it are the variant.
+Fields a name does not give are None, or "" for the variant, so rs=None
+selects runs whose names give no seed.
+
+The parsed registry is cached in process, and on disk as JSON keyed by the
+path, size and modification time of the YAML file, so that importing
+constants stays fast as the list of runs grows.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import yaml
+
+REGISTRY_CACHE_DIR = os.environ.get(
+    "RUN_REGISTRY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ace2-paper", "run-registry"),
+)
+# (model, dataset, variant prefix) of the tokens of a name before its duration,
+# with its seed and initial condition tokens removed
+MODELS: Dict[str, Tuple[str, Optional[str], str]] = {
+    "era5-co2": ("ace2-era5", "era5", ""),
+    "era5-truth": ("era5-truth", "era5", ""),
+    "era5-ace2-inference-perturbed": ("ace2-era5", "era5", "perturbed"),
+    "shield-amip-1deg-ace2-inference": ("ace2-shield", "shield-amip-1deg", ""),
+    "shield-amip-1deg-ace2-inference-perturbed": (
+        "ace2-shield",
+        "shield-amip-1deg",
+        "perturbed",
+    ),
+    "shield-amip-1deg-ace-climsst-inference": (
+        "ace-climsst",
+        "shield-amip-1deg",
+        "",
+    ),
+    "shield-amip-1deg-reference-inference": (
+        "shield-reference",
+        "shield-amip-1deg",
+        "",
+    ),
+    "shield-amip-vs-era5": ("shield-amip-vs-era5", "era5", ""),
+    "shield-amip-no-constraints": (
+        "ace2-shield-no-constraints",
+        "shield-amip-1deg",
+        "",
+    ),
+    "shield-amip-dry-air": ("ace2-shield-dry-air", "shield-amip-1deg", ""),
+    "shield-amip-dry-air-and-moisture": (
+        "ace2-shield-dry-air-and-moisture",
+        "shield-amip-1deg",
+        "",
+    ),
+}
+_DURATION_PATTERN = re.compile(r"^\d+(yr|day)$")
+_RS_PATTERN = re.compile(r"^rs(\d+)$", re.IGNORECASE)
+_IC_PATTERN = re.compile(r"^IC(\d+)$")
+# bump when the parsing changes, to invalidate cached registries
+_PARSER_VERSION = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class RunKey:
+    """What an inference run ran, parsed from its beaker experiment name.
+
+    Attributes:
+        model: model which ran inference, e.g. "ace2-shield", or the tokens of
+            the name before its duration if they are not in MODELS.
+        dataset: dataset forcing and evaluating the run, if known.
+        duration: length of the run, e.g. "81yr".
+        rs: random seed of the trained model.
+        ic: index of the initial condition.
+        variant: remaining tokens of the name, e.g. "monthly" or "noCO2".
+    """
+
+    model: str
+    dataset: Optional[str] = None
+    duration: Optional[str] = None
+    rs: Optional[int] = None
+    ic: Optional[int] = None
+    variant: str = ""
+
+
+FIELDS = tuple(field.name for field in dataclasses.fields(RunKey))
+
+
+@dataclasses.dataclass(frozen=True)
+class Run:
+    name: str
+    key: RunKey
+    wandb_id: Optional[str]
+
+
+def parse_run_name(name: str) -> RunKey:
+    """Return the RunKey of a beaker experiment name."""
+    before: List[str] = []
+    after: List[str] = []
+    duration = None
+    rs = None
+    ic = None
+    for token in name.split("-"):
+        rs_match = _RS_PATTERN.match(token)
+        ic_match = _IC_PATTERN.match(token)
+        if rs_match is not None and rs is None:
+            rs = int(rs_match.group(1))
+        elif ic_match is not None and ic is None:
+            ic = int(ic_match.group(1))
+        elif duration is None and _DURATION_PATTERN.match(token):
+            duration = token
+        elif duration is None:
+            before.append(token)
+        else:
+            after.append(token)
+    prefix = "-".join(before)
+    model, dataset, variant_prefix = MODELS.get(prefix, (prefix, None, ""))
+    variant = "-".join(([variant_prefix] if variant_prefix else []) + after)
+    return RunKey(model, dataset, duration, rs, ic, variant)
+
+
+class RunRegistry:
+    """Runs indexed by each field of their RunKey."""
+
+    def __init__(self, runs: Iterable[Run]):
+        self.runs = list(runs)
+        self._by_name = {run.name: run for run in self.runs}
+        self._index: Dict[str, Dict[Any, List[int]]] = {field: {} for field in FIELDS}
+        by_key: Dict[RunKey, str] = {}
+        for i, run in enumerate(self.runs):
+            if run.key in by_key:
+                raise ValueError(
+                    f"Runs {by_key[run.key]} and {run.name} have the same key "
+                    f"{run.key}, add their prefix to MODELS"
+                )
+            by_key[run.key] = run.name
+            for field in FIELDS:
+                self._index[field].setdefault(getattr(run.key, field), []).append(i)
+
+    @classmethod
+    def from_wandb_ids(cls, wandb_ids: Mapping[str, Optional[str]]) -> "RunRegistry":
+        return cls(
+            Run(name, parse_run_name(name), wandb_id)
+            for name, wandb_id in wandb_ids.items()
+        )
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __getitem__(self, name: str) -> Optional[str]:
+        """Return the wandb ID of the run with the given experiment name."""
+        return self._by_name[name].wandb_id
+
+    def select(self, **criteria: Any) -> List[Run]:
+        """Return the runs whose keys have all the given field values, ordered
+        by seed and initial condition."""
+        unknown = set(criteria) - set(FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown run fields {sorted(unknown)}, expected {FIELDS}")
+        if len(criteria) == 0:
+            selected = range(len(self.runs))
+        else:
+            matches = sorted(
+                (
+                    self._index[field].get(value, [])
+                    for field, value in criteria.items()
+                ),
+                key=len,
+            )
+            selected = set(matches[0]).intersection(*matches[1:])
+        runs = [self.runs[i] for i in selected]
+        return sorted(
+            runs,
+            key=lambda run: (
+                -1 if run.key.rs is None else run.key.rs,
+                -1 if run.key.ic is None else run.key.ic,
+                run.name,
+            ),
+        )
+
+    def ids_by_ic(self, **criteria: Any) -> Dict[str, Optional[str]]:
+        """Return the wandb IDs of the selected runs by initial condition, e.g.
+        {"IC0": ..., "IC1": ...}.
+
+        Raises:
+            ValueError: if the selected runs do not each have a different
+                initial condition, e.g. because the criteria leave out the
+                variant of runs which have several.
+        """
+        runs = self.select(**criteria)
+        ids: Dict[str, Optional[str]] = {}
+        for run in runs:
+            label = f"IC{run.key.ic}"
+            if run.key.ic is None or label in ids:
+                raise ValueError(
+                    f"Runs selected by {criteria} are not one per initial "
+                    f"condition: {[run.name for run in runs]}"
+                )
+            ids[label] = run.wandb_id
+        return ids
+
+
+def _get_cache_path(path: str, cache_dir: str) -> str:
+    stat = os.stat(path)
+    key = json.dumps(
+        [os.path.abspath(path), stat.st_size, stat.st_mtime_ns, _PARSER_VERSION]
+    )
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{digest}.json")
+
+
+def _read_cached(cache_path: str) -> Optional[RunRegistry]:
+    try:
+        with open(cache_path) as f:
+            rows = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return RunRegistry(
+        Run(name, RunKey(*key), wandb_id) for name, wandb_id, key in rows
+    )
+
+
+def _write_cached(cache_path: str, registry: RunRegistry):
+    rows = [
+        [run.name, run.wandb_id, list(dataclasses.astuple(run.key))]
+        for run in registry.runs
+    ]
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(rows, f)
+    os.replace(tmp_path, cache_path)
+
+
+_LOADED: Dict[str, RunRegistry] = {}
+
+
+def load_registry(
+    path: str = "./wandb_ids.yaml", cache_dir: Optional[str] = REGISTRY_CACHE_DIR
+) -> RunRegistry:
+    """Return the registry of the runs in a YAML file mapping beaker experiment
+    names to wandb IDs, parsing the file only if it changed since it was last
+    loaded, in this process or any other with the same cache_dir.
+
+    Args:
+        path: YAML file written by get_wandb_ids.py.
+        cache_dir: directory of parsed registries, or None to not cache them
+            on disk.
+    """
+    cache_path = _get_cache_path(path, cache_dir or "")
+    registry = _LOADED.get(cache_path)
+    if registry is None and cache_dir is not None:
+        registry = _read_cached(cache_path)
+    if registry is None:
+        with open(path) as f:
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            wandb_ids = yaml.load(f, Loader=loader) or {}
+        registry = RunRegistry.from_wandb_ids(wandb_ids)
+        if cache_dir is not None:
+            _write_cached(cache_path, registry)
+    _LOADED[cache_path] = registry
+    return registry
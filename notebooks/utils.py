@@ -1,66 +1,172 @@
 import beaker
 import wandb
 import xarray as xr
-import io
+import codecs
+import hashlib
+import json
 import os
+import re
+import shutil
+import uuid
 import datetime
 import numpy as np
+import pandas as pd
 from matplotlib import pyplot as plt
-from typing import Optional, Sequence, List, Tuple
+from typing import Dict, Iterable, Mapping, Optional, Sequence, List, Tuple
+from io_profile import ContextThreadPoolExecutor, count_transfer, instrument, profile_io
+from replay import get_beaker_client, get_wandb_api
+from result_cache import ResultFileCache, get_default_cache
 
 FIGURE_DIR = './figures'
+# where beaker jobs write the results uploaded as their result dataset
+BEAKER_RESULT_PATH = '/output'
 DPI = 300
 FONTSIZE = 8
+HISTORY_CACHE_DIR = os.environ.get(
+    "WANDB_HISTORY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ace2-paper", "wandb-history"),
+)
+SUMMARY_CACHE_DIR = os.environ.get(
+    "WANDB_SUMMARY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ace2-paper", "wandb-summary"),
+)
+SUMMARY_CACHE_TTL = datetime.timedelta(days=1)
 
 
+@instrument
 def wandb_to_beaker_experiment(project: str, id: str, entity: str = "ai2cm") -> str:
     """Given a wandb run ID, return corresponding beaker experiment ID"""
-    api = wandb.Api()
+    api = get_wandb_api()
     run = api.run(f"{entity}/{project}/{id}")
     return run.config["environment"]["BEAKER_EXPERIMENT_ID"]
 
 
-def beaker_experiment_to_wandb(beaker_experiment: str) -> Optional[Tuple[str, str, str]]:
+WANDB_RUN_URL_PATTERN = re.compile(r"https://wandb\.ai/([^/\s]+)/([^/\s]+)/runs/(\w+)")
+
+
+def scan_log_for_wandb_run(pages: Iterable[bytes]) -> Optional[Tuple[str, str, str]]:
+    """Given pages of a job's logs, return the wandb entity, project, and run ID
+    from the first line linking to a wandb run, reading no further pages.
+
+    Lines split between pages are reassembled, and pages are decoded
+    incrementally so multi-byte characters split between pages are decoded
+    correctly. Invalid bytes are replaced rather than raising.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    partial_line = ""
+    try:
+        for page in pages:
+            lines = (partial_line + decoder.decode(page)).split("\n")
+            partial_line = lines.pop()
+            for line in lines:
+                run = _parse_wandb_run_line(line)
+                if run is not None:
+                    return run
+        return _parse_wandb_run_line(partial_line + decoder.decode(b"", final=True))
+    finally:
+        # stop streaming the remaining pages
+        close = getattr(pages, "close", None)
+        if close is not None:
+            close()
+
+
+def _parse_wandb_run_line(line: str) -> Optional[Tuple[str, str, str]]:
+    if "View run at" not in line:
+        return None
+    match = WANDB_RUN_URL_PATTERN.search(line)
+    if match is None:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+
+@instrument
+def beaker_experiment_to_wandb(
+    beaker_experiment: str, client: Optional[beaker.Beaker] = None
+) -> Optional[Tuple[str, str, str]]:
     """Given a beaker experiment ID or name, return corresponding wandb entity, project, and run ID.
-    
-    Warning: this function is not reliable, since the necessary line could be split between
-    pages. Will return None if can't get the ID.
+
+    Will return None if the experiment's logs do not link to a wandb run.
     """
-    client = beaker.Beaker.from_env()
-    for page in client.experiment.logs(beaker_experiment, quiet=True):
-        try:
-            page_str = page.decode("utf-8")
-        except UnicodeDecodeError:
-            return None
-        lines = page_str.split("\n")
-        for line in lines:
-            if "View run at https://wandb.ai" in line and "runs/" in line:
-                elements = line.split("/")
-                id_ = elements[-1]
-                project = elements[-3]
-                entity = elements[-4]
-                return entity, project, id_
-    return None
+    if client is None:
+        client = get_beaker_client()
+    return scan_log_for_wandb_run(client.experiment.logs(beaker_experiment, quiet=True))
 
 
+@instrument
+def beaker_experiments_to_wandb(
+    beaker_experiments: Sequence[str], max_workers: int = 16
+) -> Dict[str, Optional[Tuple[str, str, str]]]:
+    """Given beaker experiment IDs or names, return the wandb entity, project, and
+    run ID of each, reading the logs of up to max_workers experiments at once.
+    """
+    client = get_beaker_client()
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        runs = executor.map(
+            lambda name: beaker_experiment_to_wandb(name, client=client),
+            beaker_experiments,
+        )
+        return dict(zip(beaker_experiments, runs))
+
+
+@instrument
 def wandb_to_beaker_result(project: str, id: str, entity: str = "ai2cm") -> str:
     """Given a wandb run ID, return ID of corresponding beaker result dataset"""
     experiment_id = wandb_to_beaker_experiment(project, id, entity=entity)
-    client = beaker.Beaker.from_env()
+    client = get_beaker_client()
     result_dataset = client.experiment.results(experiment_id)
     return result_dataset.id
 
 
-def beaker_to_xarray(dataset_id: str, path: str) -> xr.Dataset:
+@instrument
+def wandb_to_beaker_result_dir(
+    project: str, id: str, entity: str = "ai2cm"
+) -> Tuple[str, str]:
+    """Given a wandb run ID, return ID of corresponding beaker result dataset and
+    the directory of the run's outputs within it, e.g. "" or "<name>/" for runs
+    which were one of several perturbations run by the same beaker job."""
+    api = get_wandb_api()
+    run = api.run(f"{entity}/{project}/{id}")
+    experiment_id = run.config["environment"]["BEAKER_EXPERIMENT_ID"]
+    experiment_dir = run.config.get("experiment_dir", BEAKER_RESULT_PATH)
+    directory = os.path.relpath(experiment_dir, BEAKER_RESULT_PATH)
+    client = get_beaker_client()
+    result_dataset = client.experiment.results(experiment_id)
+    return result_dataset.id, "" if directory == "." else f"{directory}/"
+
+
+@instrument
+def beaker_to_xarray(
+    dataset_id: str,
+    path: str,
+    lazy: bool = False,
+    chunks="auto",
+    cache: Optional[ResultFileCache] = None,
+) -> xr.Dataset:
     """Given a beaker dataset ID and path within dataset, return an xarray dataset.
 
-    Note: dataset must fit in memory. Requires h5netcdf backend.
+    The file is fetched through a persistent local cache, so it is only
+    downloaded once across kernel restarts.
+
+    Note: unless lazy, dataset must fit in memory. Requires h5netcdf backend.
+
+    Args:
+        dataset_id: beaker dataset ID
+        path: path of a netCDF file within the dataset
+        lazy: open the file with dask, so that only the variables and times
+            which are used are read into memory
+        chunks: dask chunks of the lazily opened dataset
+        cache: cache to fetch the file through, defaults to the shared cache
     """
-    client = beaker.Beaker.from_env()
-    file = client.dataset.get_file(dataset_id, path)
-    return xr.open_dataset(io.BytesIO(file), engine='h5netcdf').load()
+    if cache is None:
+        cache = get_default_cache()
+    local_path = cache.get_path(dataset_id, path)
+    if lazy:
+        return xr.open_dataset(local_path, engine='h5netcdf', chunks=chunks)
+    with xr.open_dataset(local_path, engine='h5netcdf') as ds:
+        return ds.load()
 
 
+@instrument
 def get_wandb_scalar_metrics(
     run: wandb.apis.public.runs.Run,
     metric_names: List[str]
@@ -81,27 +187,271 @@ def get_wandb_scalar_metrics(
     return metrics
 
 
+def _get_scalar_summary(run) -> Dict[str, float]:
+    return {
+        key: value
+        for key, value in run.summary_metrics.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+@instrument
+def get_wandb_summary_metrics(
+    ids: Sequence[str],
+    metric_names: Sequence[str],
+    project: str = "ace",
+    entity: str = "ai2cm",
+    api=None,
+    ttl: datetime.timedelta = SUMMARY_CACHE_TTL,
+    cache_dir: Optional[str] = SUMMARY_CACHE_DIR,
+    per_page: int = 100,
+) -> pd.DataFrame:
+    """Given wandb run IDs and scalar metric names, return a tidy dataframe with
+    a row for each run and metric which the run's summary has.
+
+    All runs not cached within the last ttl are fetched together, with one
+    filtered query per page of runs, rather than one request per run. The
+    scalar summary metrics of each fetched run are saved to cache_dir.
+
+    Args:
+        ids: wandb run IDs
+        metric_names: names of scalar summary metrics
+        project: wandb project name
+        entity: wandb entity name
+        api: wandb.Api or stand-in, defaults to get_wandb_api(), which
+            replays recorded runs when ACE2_PAPER_REPLAY=replay
+        ttl: maximum age of cached summaries
+        cache_dir: directory of cached summaries, or None to not cache them
+        per_page: runs fetched per request
+
+    Returns:
+        pandas.DataFrame with columns run_id, metric and value.
+    """
+    summaries: Dict[str, Dict[str, float]] = {}
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"{entity}-{project}.json")
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            cached = {}
+        oldest = (datetime.datetime.now(datetime.timezone.utc) - ttl).timestamp()
+        wanted = set(ids)
+        summaries = {
+            id: entry["summary_metrics"]
+            for id, entry in cached.items()
+            if id in wanted and entry["fetched_at"] >= oldest
+        }
+    missing = [id for id in dict.fromkeys(ids) if id not in summaries]
+    count_transfer(cache_hits=len(summaries), cache_misses=len(missing))
+    if len(missing) > 0:
+        if api is None:
+            api = get_wandb_api()
+        fetched = {}
+        for start in range(0, len(missing), per_page):
+            runs = api.runs(
+                f"{entity}/{project}",
+                filters={"name": {"$in": missing[start : start + per_page]}},
+                per_page=per_page,
+            )
+            for run in runs:
+                fetched[run.id] = _get_scalar_summary(run)
+        summaries.update(fetched)
+        if cache_path is not None:
+            _update_summary_cache(cache_path, fetched)
+    rows = [
+        (id, name, summaries[id][name])
+        for id in ids
+        if id in summaries
+        for name in metric_names
+        if name in summaries[id]
+    ]
+    return pd.DataFrame(rows, columns=["run_id", "metric", "value"])
+
+
+def _update_summary_cache(path: str, summaries: Dict[str, Dict[str, float]]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        cached = {}
+    fetched_at = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    for id, summary in summaries.items():
+        cached[id] = {"fetched_at": fetched_at, "summary_metrics": summary}
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cached, f)
+    os.replace(tmp_path, path)
+
+
+@instrument
 def get_beaker_dataset_variables(
     wandb_id: str, 
     ds_name: str,
     varnames: List[str],
     wandb_project: str="ace",
     wandb_entity: str="ai2cm",
+    lazy: bool=False,
+    cache: Optional[ResultFileCache]=None,
+    time: Optional[slice]=None,
+    ranged: bool=False,
 ):
     """Given a wandb run ID, a results dataset name, and variable names,
     return an xarray dataset of those variables.
+
+    By default the whole file is fetched through the cache, see
+    beaker_to_xarray. If ranged, the file is instead read with byte-range
+    requests, so only the chunks of the requested variables and times are
+    fetched, along with the file's metadata which is cached for later reads.
+    This is faster for long, wide files of which few variables are used.
+
+    Args:
+        wandb_id: wandb run ID of the inference run
+        ds_name: path of a netCDF file within its results dataset
+        varnames: variables to return, those not in the file are skipped
+        wandb_project: wandb project name
+        wandb_entity: wandb entity name
+        lazy: return variables backed by dask, read when computed
+        cache: cache to fetch through, defaults to the shared cache
+        time: slice of time indices to read, defaults to all times
+        ranged: read only the requested chunks of the file
     """
+    if cache is None:
+        cache = get_default_cache()
     beaker_result_id = wandb_to_beaker_result(wandb_project, wandb_id, wandb_entity)
-    diags = beaker_to_xarray(beaker_result_id, ds_name)
+    if ranged:
+        diags = xr.open_dataset(
+            cache.open_ranged(beaker_result_id, ds_name),
+            engine='h5netcdf',
+            chunks="auto" if lazy else None,
+        )
+    else:
+        diags = beaker_to_xarray(beaker_result_id, ds_name, lazy=True, cache=cache)
     valid_varnames = [name for name in varnames if name in diags.data_vars]
-    return diags[valid_varnames]
+    subset = diags[valid_varnames]
+    if time is not None and "time" in subset.dims:
+        subset = subset.isel(time=time)
+    if lazy:
+        return subset
+    subset = subset.load()
+    diags.close()
+    return subset
 
 
+def _scan_history_range(
+    run: wandb.apis.public.runs.Run,
+    metric_names: Sequence[str],
+    min_step: int,
+    max_step: int,
+    page_size: int,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Return the steps in [min_step, max_step) at which the metrics were
+    logged and the value of each metric at those steps."""
+    n_steps = max_step - min_step
+    columns = {name: np.full(n_steps, np.nan) for name in metric_names}
+    logged = np.zeros(n_steps, dtype=bool)
+    rows = run.scan_history(
+        keys=list(metric_names),
+        page_size=page_size,
+        min_step=min_step,
+        max_step=max_step,
+    )
+    for row in rows:
+        i = row["_step"] - min_step
+        logged[i] = True
+        for name in metric_names:
+            value = row.get(name)
+            if value is not None:
+                columns[name][i] = value
+    steps = np.arange(min_step, max_step)[logged]
+    return steps, {name: column[logged] for name, column in columns.items()}
+
+
+@instrument
+def export_wandb_history(
+    project: str,
+    id: str,
+    metric_names: Sequence[str],
+    entity: str = "ai2cm",
+    max_workers: int = 8,
+    steps_per_request: int = 10_000,
+    page_size: int = 1000,
+    cache_dir: Optional[str] = HISTORY_CACHE_DIR,
+) -> xr.Dataset:
+    """Given a wandb run ID and scalar metric names, return their full history as
+    an xarray dataset with a "_step" dimension.
+
+    Unlike run.history, every logged step is returned rather than a sample. The
+    history is scanned concurrently in ranges of steps_per_request steps and
+    written straight into one array per metric. The history of a finished run
+    is saved as Zarr in cache_dir, keyed by the run and metric names, and read
+    from there on later calls.
+
+    Args:
+        project: wandb project name
+        id: wandb run ID
+        metric_names: list of scalar metric names to fetch
+        entity: wandb entity name
+        max_workers: maximum number of step ranges scanned at once
+        steps_per_request: number of steps in each scanned range
+        page_size: rows per request when scanning a range
+        cache_dir: directory of saved histories, or None to not save them
+    """
+    metric_names = sorted(set(metric_names))
+    if cache_dir is not None:
+        key = hashlib.sha256(
+            "/".join([entity, project, id, *metric_names]).encode()
+        ).hexdigest()[:16]
+        cached_path = os.path.join(cache_dir, f"{entity}-{project}-{id}-{key}.zarr")
+        if os.path.exists(cached_path):
+            count_transfer(cache_hits=1)
+            return xr.open_zarr(cached_path).load()
+    count_transfer(cache_misses=1)
+    api = get_wandb_api()
+    run = api.run(f"{entity}/{project}/{id}")
+    n_steps = run.lastHistoryStep + 1
+    starts = range(0, n_steps, steps_per_request)
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(
+            executor.map(
+                lambda start: _scan_history_range(
+                    run,
+                    metric_names,
+                    start,
+                    min(start + steps_per_request, n_steps),
+                    page_size,
+                ),
+                starts,
+            )
+        )
+    # an empty range keeps concatenation valid for runs with no history
+    chunks.insert(0, (np.arange(0), {name: np.zeros(0) for name in metric_names}))
+    ds = xr.Dataset(
+        {
+            name: ("_step", np.concatenate([columns[name] for _, columns in chunks]))
+            for name in metric_names
+        },
+        coords={"_step": np.concatenate([steps for steps, _ in chunks])},
+    )
+    if cache_dir is not None and run.state == "finished":
+        # write to a temporary directory first so readers never see a partial store
+        tmp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+        ds.to_zarr(tmp_path)
+        try:
+            os.replace(tmp_path, cached_path)
+        except OSError:  # saved concurrently by another process
+            shutil.rmtree(tmp_path)
+    return ds
+
+
+@instrument
 def wandb_to_xarray(
     project: str,
     id: str,
     metric_names: Sequence[str],
-    samples: int,
+    samples: Optional[int],
     entity: str = "ai2cm",
     add_time_coord: bool = True,
 ) -> xr.Dataset:
@@ -111,14 +461,23 @@ def wandb_to_xarray(
         project: wandb project name
         id: wandb run ID
         metric_names: list of metric names to fetch
-        samples: number of steps to fetch
+        samples: number of steps to fetch, or None to fetch every step with
+            export_wandb_history, which is not limited to 10,000 steps
         entity: wandb entity name
         add_time_coord: add a time coordinate to the dataset
         
     Returns:
         xarray.Dataset of the desired metrics.
     """
-    api = wandb.Api()
+    if samples is None:
+        ds = export_wandb_history(project, id, metric_names, entity=entity)
+        if add_time_coord:
+            ds = ds.assign_coords(lead_time=ds["_step"] / 4).swap_dims(
+                {"_step": "lead_time"}
+            ).drop_vars("_step")
+            ds['lead_time'].attrs["units"] = "days since init"
+        return ds
+    api = get_wandb_api()
     run = api.run(f"{entity}/{project}/{id}")
     metrics = run.history(keys=metric_names, samples=samples)
     if add_time_coord:
@@ -131,6 +490,114 @@ def wandb_to_xarray(
     return ds
 
 
+@instrument
+def wandb_to_beaker_results(
+    project: str,
+    ids: Sequence[str],
+    entity: str = "ai2cm",
+    max_workers: int = 16,
+) -> Dict[str, str]:
+    """Given wandb run IDs, return the ID of the beaker result dataset of each.
+
+    The runs are fetched with a single wandb query, and their beaker experiments
+    are looked up concurrently.
+    """
+    api = get_wandb_api()
+    runs = api.runs(f"{entity}/{project}", filters={"name": {"$in": list(ids)}})
+    experiment_ids = {
+        run.id: run.config["environment"]["BEAKER_EXPERIMENT_ID"] for run in runs
+    }
+    missing = set(ids) - set(experiment_ids)
+    if missing:
+        raise ValueError(f"Runs {sorted(missing)} not found in {entity}/{project}")
+    client = get_beaker_client()
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda id: client.experiment.results(experiment_ids[id]).id, ids
+        )
+        return dict(zip(ids, results))
+
+
+def _flatten_run_ids(
+    run_ids: Mapping, n_levels: int, prefix: Tuple = ()
+) -> List[Tuple[Tuple, str]]:
+    flat = []
+    for key, value in run_ids.items():
+        labels = prefix + (key if isinstance(key, tuple) else (key,))
+        if isinstance(value, Mapping):
+            flat.extend(_flatten_run_ids(value, n_levels, labels))
+        elif len(labels) == n_levels:
+            flat.append((labels, value))
+        else:
+            raise ValueError(
+                f"Run ID {value} has {len(labels)} labels {labels}, expected {n_levels}"
+            )
+    return flat
+
+
+@instrument
+def load_ensemble(
+    run_ids: Mapping,
+    path: str,
+    variables: Optional[Sequence[str]] = None,
+    dims: Sequence[str] = ("run", "RS", "IC"),
+    wandb_project: str = "ace",
+    wandb_entity: str = "ai2cm",
+    chunks="auto",
+    max_workers: int = 16,
+    cache: Optional[ResultFileCache] = None,
+) -> xr.Dataset:
+    """Given wandb run IDs of an ensemble of inference runs, return one lazily
+    loaded dataset of a results file of every run, stacked along the given dims.
+
+    For example, run_ids={"ACE2-SHiELD": {"RS2": {"IC0": id0, "IC1": id1}}}
+    gives a dataset with run, RS and IC dimensions of length 1, 1 and 2.
+    Combinations missing from run_ids are filled with NaN.
+
+    Result datasets are resolved in bulk, then files are fetched through the
+    cache and opened with dask concurrently, so network, decoding and
+    stacking of different runs overlap.
+
+    Args:
+        run_ids: nested mapping from the label of each dim to a wandb run ID,
+            whose keys may also be tuples of the labels of several dims
+        path: path of a netCDF file within each results dataset
+        variables: variables to return, those not in a file are skipped.
+            Defaults to all variables.
+        dims: names of the dims the labels of run_ids index, outermost first
+        wandb_project: wandb project name
+        wandb_entity: wandb entity name
+        chunks: dask chunks of each file
+        max_workers: maximum number of runs resolved or fetched at once
+        cache: cache to fetch through, defaults to the shared cache
+    """
+    if cache is None:
+        cache = get_default_cache()
+    members = _flatten_run_ids(run_ids, len(dims))
+    result_ids = wandb_to_beaker_results(
+        wandb_project,
+        list({id: None for _, id in members}),
+        entity=wandb_entity,
+        max_workers=max_workers,
+    )
+
+    def open_member(id: str) -> xr.Dataset:
+        local_path = cache.get_path(result_ids[id], path)
+        ds = xr.open_dataset(local_path, engine='h5netcdf', chunks=chunks)
+        if variables is not None:
+            ds = ds[[name for name in variables if name in ds.data_vars]]
+        return ds
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        datasets = list(executor.map(open_member, [id for _, id in members]))
+    member_labels = {
+        dim: ("member", [labels[i] for labels, _ in members])
+        for i, dim in enumerate(dims)
+    }
+    stacked = xr.concat(datasets, dim="member").assign_coords(member_labels)
+    return stacked.set_index(member=list(dims)).unstack("member")
+
+
 def get_color_scheme(
     n_colors_base: int,
     i_color_repeat: Optional[int]=None,
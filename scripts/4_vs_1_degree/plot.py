@@ -1,5 +1,8 @@
+import collections
+import concurrent.futures
 import dataclasses
-from typing import Dict, List, Optional
+import sys
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
 import numpy as np
 import torch
 import yaml
@@ -7,7 +10,6 @@ import dacite
 import argparse
 from pathlib import Path
 from beaker import Beaker
-import subprocess
 import xarray as xr
 import logging
 from fme.core import metrics
@@ -15,11 +17,20 @@ import matplotlib.pyplot as plt
 from cartopy import crs as ccrs
 import matplotlib as mpl
 
+# the beaker file cache is shared with the notebooks
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "notebooks"))
+from replay import get_beaker_client
+from result_cache import ResultFileCache, get_default_cache
+
 TRANSFORM = ccrs.PlateCarree()
 PROJECTION = ccrs.Robinson(central_longitude=180)
 
 DATA_PATH = Path("./data")
 OUT_PATH = Path("./output")
+TIME_MEAN_FILENAME = "time_mean_diagnostics.nc"
+ENSO_COEFFICIENT_FILENAME = "enso_coefficient_diagnostics.nc"
+ANNUAL_FILENAME = "annual_diagnostics.nc"
+COARSEN_FACTOR = 4
 
 @dataclasses.dataclass
 class Run:
@@ -51,22 +62,113 @@ class Comparison:
 class Config:
     comparisons: List[Comparison]
 
+class LRUCache:
+    """
+    In-process cache of the most recently used values, computing values it does not
+    hold. Values are shared between callers, so they must not be modified in place.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values: "collections.OrderedDict[Hashable, Any]" = collections.OrderedDict()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        if key in self._values:
+            self._values.move_to_end(key)
+            self.hits += 1
+            return self._values[key]
+        value = compute()
+        self.misses += 1
+        self._values[key] = value
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+        return value
+
+    def report(self) -> str:
+        return (
+            f"In-process dataset cache: {self.hits} hits, {self.misses} misses, "
+            f"{len(self._values)} of {self.maxsize} entries used"
+        )
+
+
 class DatasetCache:
-    DATA_PATH = Path("./data")
+    """
+    Opens the result files of beaker experiments, and memoizes the opened datasets
+    and the products derived from them which are shared by the plot functions, so
+    that each file is read and decoded once per process.
+    """
 
-    def __init__(self, beaker: Beaker):
+    def __init__(
+        self,
+        beaker: Beaker,
+        file_cache: Optional[ResultFileCache] = None,
+        maxsize: int = 128,
+    ):
         self.beaker = beaker
+        self.file_cache = file_cache if file_cache is not None else get_default_cache()
+        self.memo = LRUCache(maxsize)
         self._result_dataset_names: Dict[str, str] = {}
     
     def open_beaker_dataset(self, job_name: str, path: str) -> xr.Dataset:
+        return self.memo.get(
+            ("open", job_name, path), lambda: self._open_beaker_dataset(job_name, path)
+        )
+
+    def _open_beaker_dataset(self, job_name: str, path: str) -> xr.Dataset:
         dataset = self._get_result_dataset_name(job_name)
-        fetched_path = self._get_fetched_path(dataset, path)
-        if not fetched_path.exists():
-            self._fetch_beaker_dataset(dataset, path)
-        return xr.open_dataset(fetched_path)
+        logging.info(f"Opening {path} of dataset {dataset}")
+        return xr.open_dataset(self.file_cache.get_path(dataset, path))
+
+    def open_ensemble(self, job_names: Sequence[str], path: str) -> xr.Dataset:
+        """
+        Return the datasets of the given experiments concatenated along a "run" dimension.
+        """
+        return self.memo.get(
+            ("ensemble", tuple(job_names), path),
+            lambda: xr.concat(
+                [self.open_beaker_dataset(job_name, path) for job_name in job_names],
+                dim="run",
+            ),
+        )
+
+    def open_pred_and_target(self, job_names: Sequence[str], path: str) -> xr.Dataset:
+        """
+        Return convert_to_pred_and_target of the ensemble of the given experiments.
+        """
+        return self.memo.get(
+            ("pred_and_target", tuple(job_names), path),
+            lambda: convert_to_pred_and_target(self.open_ensemble(job_names, path)),
+        )
 
-    def _get_fetched_path(self, dataset: str, path: str) -> Path:
-        return self.DATA_PATH / dataset / path
+    def open_coarsened(
+        self, job_names: Sequence[str], path: str, pred_and_target: bool = False
+    ) -> xr.Dataset:
+        """
+        Return the ensemble of the given experiments, or its convert_to_pred_and_target,
+        area-weighted coarsened by COARSEN_FACTOR.
+        """
+        def compute():
+            if pred_and_target:
+                ds = self.open_pred_and_target(job_names, path)
+            else:
+                ds = self.open_ensemble(job_names, path)
+            area = self.get_area(ds.lat, ds.lon)
+            return (
+                (ds * area).coarsen(lat=COARSEN_FACTOR, lon=COARSEN_FACTOR).mean()
+                / area.coarsen(lat=COARSEN_FACTOR, lon=COARSEN_FACTOR).mean()
+            )
+
+        return self.memo.get(
+            ("coarsened", tuple(job_names), path, pred_and_target), compute
+        )
+
+    def get_area(self, lat: xr.DataArray, lon: xr.DataArray) -> xr.DataArray:
+        return self.memo.get(
+            ("area", lat.values.tobytes(), lon.values.tobytes()),
+            lambda: get_area(lat, lon),
+        )
     
     def _get_result_dataset_name(self, experiment_name: str):
         if experiment_name not in self._result_dataset_names:
@@ -74,21 +176,49 @@ class DatasetCache:
             self._result_dataset_names[experiment_name] = experiment.jobs[-1].result.beaker
         return self._result_dataset_names[experiment_name]
 
-    def _fetch_beaker_dataset(self, dataset: str, path: str) -> xr.Dataset:
-        logging.info(f"Fetching dataset {dataset} to {path}")
-        subprocess.run(
-            [
-                "beaker",
-                "dataset",
-                "fetch",
-                dataset,
-                "--prefix",
-                path,
-                "--output",
-                self.DATA_PATH / dataset,
-            ],
-            check=True,
-        )
+    def prefetch(self, files: Sequence[Tuple[str, str]], max_workers: int = 8):
+        """
+        Resolve the result datasets of the experiments of the given (job name, path)
+        pairs and fetch their files into the file cache, up to max_workers at a time.
+
+        Files are fetched to temporary names and renamed once complete, so a file
+        which failed to fetch is fetched again when it is opened.
+        """
+        files = list(dict.fromkeys(files))
+        job_names = list(dict.fromkeys(job_name for job_name, _ in files))
+        logging.info(f"Prefetching {len(files)} files of {len(job_names)} experiments")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            datasets = dict(
+                zip(job_names, executor.map(self._get_result_dataset_name, job_names))
+            )
+            futures = [
+                executor.submit(self.file_cache.get_path, datasets[job_name], path)
+                for job_name, path in files
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        logging.info(self.file_cache.report())
+
+
+def get_input_files(config: Config) -> List[Tuple[str, str]]:
+    """
+    Return the (job name, path) of every file opened by the plot functions.
+    """
+    files = []
+    for comparison in config.comparisons:
+        ensemble_job_names = [
+            run.job_name for run in comparison.res_4deg.runs + comparison.res_1deg.runs
+        ]
+        for job_name in ensemble_job_names + comparison.c24_reference_runs:
+            files.append((job_name, TIME_MEAN_FILENAME))
+            files.append((job_name, ENSO_COEFFICIENT_FILENAME))
+        reference_job_names = [
+            comparison.res_4deg.reference_run.job_name,
+            comparison.res_1deg.reference_run.job_name,
+        ]
+        for job_name in ensemble_job_names + reference_job_names:
+            files.append((job_name, ANNUAL_FILENAME))
+    return files
 
 def get_area(lat: xr.DataArray, lon: xr.DataArray) -> xr.DataArray:
     area = xr.DataArray(
@@ -115,25 +245,6 @@ def convert_to_pred_and_target(ds: xr.Dataset) -> xr.Dataset:
 
 
 def plot_time_means(config: Config, dataset_cache: DatasetCache):
-    time_means = {}
-    for comparison in config.comparisons:
-        res_4deg = comparison.res_4deg
-        res_1deg = comparison.res_1deg
-        for run in res_4deg.runs:
-            inference_time_mean = dataset_cache.open_beaker_dataset(
-                run.job_name, "time_mean_diagnostics.nc"
-            )
-            time_means[run.job_name] = inference_time_mean
-        for run in res_1deg.runs:
-            inference_time_mean = dataset_cache.open_beaker_dataset(
-                run.job_name, "time_mean_diagnostics.nc"
-            )
-            time_means[run.job_name] = inference_time_mean
-        for job_name in comparison.c24_reference_runs:
-            inference_time_mean = dataset_cache.open_beaker_dataset(
-                job_name, "time_mean_diagnostics.nc"
-            )
-            time_means[job_name] = inference_time_mean
     if not OUT_PATH.exists():
         OUT_PATH.mkdir()
     
@@ -141,32 +252,23 @@ def plot_time_means(config: Config, dataset_cache: DatasetCache):
         comparison_out_path = OUT_PATH / comparison.name
         if not comparison_out_path.exists():
             comparison_out_path.mkdir()
-        ds_4deg = xr.concat(
-            [time_means[run.job_name] for run in comparison.res_4deg.runs],
-            dim="run",
-        )
-        ds_1deg = xr.concat(
-            [time_means[run.job_name] for run in comparison.res_1deg.runs],
-            dim="run",
-        )
+        job_names_4deg = [run.job_name for run in comparison.res_4deg.runs]
+        job_names_1deg = [run.job_name for run in comparison.res_1deg.runs]
         if len(comparison.c24_reference_runs) > 0:
-            ds_c24: Optional[xr.Dataset] = xr.concat(
-                [time_means[run] for run in comparison.c24_reference_runs],
-                dim="run",
+            ds_c24: Optional[xr.Dataset] = dataset_cache.open_pred_and_target(
+                comparison.c24_reference_runs, TIME_MEAN_FILENAME
             )
         else:
             ds_c24 = None
-        if ds_c24 is not None:
-            ds_c24 = convert_to_pred_and_target(ds_c24)
         if ds_c24 is not None:
             c24_columns = 1
         else:
             c24_columns = 0
-        ds_4deg = convert_to_pred_and_target(ds_4deg)
-        area_4deg = get_area(ds_4deg.lat, ds_4deg.lon)
-        ds_1deg = convert_to_pred_and_target(ds_1deg)
-        area_1deg = get_area(ds_1deg.lat, ds_1deg.lon)
-        ds_1deg_coarse = (ds_1deg * area_1deg).coarsen(lat=4, lon=4).mean() / (area_1deg).coarsen(lat=4, lon=4).mean()
+        ds_4deg = dataset_cache.open_pred_and_target(job_names_4deg, TIME_MEAN_FILENAME)
+        area_4deg = dataset_cache.get_area(ds_4deg.lat, ds_4deg.lon)
+        ds_1deg_coarse = dataset_cache.open_coarsened(
+            job_names_1deg, TIME_MEAN_FILENAME, pred_and_target=True
+        )
         biases = {}
         bias_limits = {}
         rmses = {}
@@ -357,26 +459,6 @@ def plot_time_means(config: Config, dataset_cache: DatasetCache):
 
 
 def plot_enso_coefficients(config: Config, dataset_cache: DatasetCache):
-    enso_coefficients = {}
-    for comparison in config.comparisons:
-        res_4deg = comparison.res_4deg
-        res_1deg = comparison.res_1deg
-        for run in res_4deg.runs:
-            ds_enso = dataset_cache.open_beaker_dataset(
-                run.job_name, "enso_coefficient_diagnostics.nc"
-            )
-            enso_coefficients[run.job_name] = ds_enso
-        for run in res_1deg.runs:
-            ds_enso = dataset_cache.open_beaker_dataset(
-                run.job_name, "enso_coefficient_diagnostics.nc"
-            )
-            enso_coefficients[run.job_name] = ds_enso
-        for job_name in comparison.c24_reference_runs:
-            ds_enso = dataset_cache.open_beaker_dataset(
-                job_name, "enso_coefficient_diagnostics.nc"
-            )
-            enso_coefficients[job_name] = ds_enso
-
     if not OUT_PATH.exists():
         OUT_PATH.mkdir()
     
@@ -385,21 +467,16 @@ def plot_enso_coefficients(config: Config, dataset_cache: DatasetCache):
         comparison_out_path = OUT_PATH / comparison.name
         if not comparison_out_path.exists():
             comparison_out_path.mkdir()
-        ds_4deg_runs = xr.concat(
-            [enso_coefficients[run.job_name] for run in comparison.res_4deg.runs],
-            dim="run",
+        job_names_4deg = [run.job_name for run in comparison.res_4deg.runs]
+        job_names_1deg = [run.job_name for run in comparison.res_1deg.runs]
+        ds_4deg_runs = dataset_cache.open_ensemble(
+            job_names_4deg, ENSO_COEFFICIENT_FILENAME
         )
         # ds_4deg = ds_4deg_runs.mean(dim="run")
-        ds_1deg_runs = xr.concat(
-            [enso_coefficients[run.job_name] for run in comparison.res_1deg.runs],
-            dim="run",
-        )
-        # ds_1deg = ds_1deg_runs.mean(dim="run")
 
         if len(comparison.c24_reference_runs) > 0:
-            ds_c24: Optional[xr.Dataset] = xr.concat(
-                [enso_coefficients[run] for run in comparison.c24_reference_runs],
-                dim="run",
+            ds_c24: Optional[xr.Dataset] = dataset_cache.open_ensemble(
+                comparison.c24_reference_runs, ENSO_COEFFICIENT_FILENAME
             )
         else:
             ds_c24 = None
@@ -407,9 +484,10 @@ def plot_enso_coefficients(config: Config, dataset_cache: DatasetCache):
             c24_columns = 1
         else:
             c24_columns = 0
-        area_1deg = get_area(ds_1deg_runs.lat, ds_1deg_runs.lon)
-        area_4deg = get_area(ds_4deg_runs.lat, ds_4deg_runs.lon)
-        ds_1deg_coarse_runs = (ds_1deg_runs * area_1deg).coarsen(lat=4, lon=4).mean() / (area_1deg).coarsen(lat=4, lon=4).mean()
+        area_4deg = dataset_cache.get_area(ds_4deg_runs.lat, ds_4deg_runs.lon)
+        ds_1deg_coarse_runs = dataset_cache.open_coarsened(
+            job_names_1deg, ENSO_COEFFICIENT_FILENAME
+        )
         for var in comparison.variables:
             data_4deg_runs = ds_4deg_runs[var.name].sel(source="prediction") * var.scale
             data_4deg_ref = ds_4deg_runs[var.name].sel(source="target") * var.scale
@@ -513,13 +591,13 @@ def plot_annual_means(config: Config, dataset_cache: DatasetCache):
         res_1deg = comparison.res_1deg
         for run in res_4deg.runs:
             ds_enso = dataset_cache.open_beaker_dataset(
-                run.job_name, "annual_diagnostics.nc"
+                run.job_name, ANNUAL_FILENAME
             )
             annual_means[run.job_name] = ds_enso
 
         for run in res_1deg.runs:
             ds_enso = dataset_cache.open_beaker_dataset(
-                run.job_name, "annual_diagnostics.nc"
+                run.job_name, ANNUAL_FILENAME
             )
             annual_means[run.job_name] = ds_enso
 
@@ -532,19 +610,17 @@ def plot_annual_means(config: Config, dataset_cache: DatasetCache):
         comparison_out_path = OUT_PATH / comparison.name
         if not comparison_out_path.exists():
             comparison_out_path.mkdir()
-        ds_mean_4deg = xr.concat(
-            [annual_means[run.job_name] for run in comparison.res_4deg.runs],
-            dim="run",
+        ds_mean_4deg = dataset_cache.open_ensemble(
+            [run.job_name for run in comparison.res_4deg.runs], ANNUAL_FILENAME
         ).mean(dim="run")
-        ds_mean_1deg = xr.concat(
-            [annual_means[run.job_name] for run in comparison.res_1deg.runs],
-            dim="run",
+        ds_mean_1deg = dataset_cache.open_ensemble(
+            [run.job_name for run in comparison.res_1deg.runs], ANNUAL_FILENAME
         ).mean(dim="run")
         ds_ref_4deg = dataset_cache.open_beaker_dataset(
-            res_4deg.reference_run.job_name, "annual_diagnostics.nc"
+            res_4deg.reference_run.job_name, ANNUAL_FILENAME
         )
         ds_ref_1deg = dataset_cache.open_beaker_dataset(
-            res_1deg.reference_run.job_name, "annual_diagnostics.nc"
+            res_1deg.reference_run.job_name, ANNUAL_FILENAME
         )
         for var in comparison.variables:
             var_4deg_ref_0 = ds_ref_4deg[var.name].sel(source="prediction") * var.scale
@@ -633,14 +709,29 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('config', type=str)
     parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument(
+        '--memo-size',
+        type=int,
+        default=128,
+        help='opened datasets and derived products kept in memory across plots',
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=8,
+        help='experiments resolved and files fetched at once before plotting',
+    )
     args = parser.parse_args()
     mpl.rcParams['figure.dpi'] = args.dpi
     with open(args.config, 'r') as f:
         config = yaml.safe_load(f)
     print(config)
     config = dacite.from_dict(Config, config, config=dacite.Config(strict=True))
-    dataset_cache = DatasetCache(Beaker.from_env())
+    dataset_cache = DatasetCache(get_beaker_client(), maxsize=args.memo_size)
+    dataset_cache.prefetch(get_input_files(config), max_workers=args.max_workers)
 
     plot_time_means(config, dataset_cache)
     plot_enso_coefficients(config, dataset_cache)
     plot_annual_means(config, dataset_cache)
+    logging.info(dataset_cache.file_cache.report())
+    logging.info(dataset_cache.memo.report())
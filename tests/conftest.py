@@ -0,0 +1,35 @@
+import os
+import tempfile
+from typing import Any, Dict, List
+
+import pytest
+import yaml
+
+from ace2_launch import Experiment, JobConfig, LaunchScript
+
+# keep the registries parsed by the tests out of the user's cache
+os.environ.setdefault(
+    "RUN_REGISTRY_CACHE_DIR", tempfile.mkdtemp(prefix="run-registry-")
+)
+
+
+@pytest.fixture
+def make_script(tmp_path):
+    """Return a function making a launcher script in a temporary directory from
+    a base config, its experiments and any JobConfig attributes."""
+
+    def make(
+        base_config: Dict[str, Any], experiments: List[Experiment], **job_kwargs
+    ) -> LaunchScript:
+        with open(tmp_path / "base-config.yaml", "w") as f:
+            yaml.safe_dump(base_config, f)
+        job = JobConfig(
+            image_name="image",
+            description="test",
+            module="fme.ace.evaluator",
+            config_type=None,
+            **job_kwargs,
+        )
+        return LaunchScript(tmp_path / "run.py", job, experiments)
+
+    return make
@@ -0,0 +1,137 @@
+import pytest
+
+from ace2_launch import Experiment, cli
+from ace2_launch.batching import (
+    BatchMember,
+    batch_initial_conditions,
+    batch_perturbations,
+    get_batch_name,
+    load_batch_members,
+    save_batch,
+)
+
+BASE_CONFIG = {
+    "n_forward_steps": 100,
+    "loader": {"start_indices": {"times": ["2001-01-01T00:00:00"]}},
+}
+
+
+def ic_overlay(time: str, **overlay):
+    return {"loader": {"start_indices": {"times": [time]}}, **overlay}
+
+
+def get_ic_experiments(n_ics: int):
+    return [
+        Experiment(f"run-IC{i}", ic_overlay(f"200{i}-01-01T00:00:00"))
+        for i in range(n_ics)
+    ]
+
+
+def test_get_batch_name():
+    assert get_batch_name(["run-IC0", "run-IC1", "run-IC2"]) == "run-IC0_1_2"
+    assert get_batch_name(["a-IC0-ni", "a-IC1-ni"]) == "a-IC0_1-ni"
+
+
+def test_batch_initial_conditions(make_script):
+    script = make_script(
+        BASE_CONFIG,
+        [
+            Experiment("run-IC0", ic_overlay("2001-01-01T00:00:00")),
+            Experiment("run-IC1", ic_overlay("2002-01-01T00:00:00")),
+            Experiment(
+                "other-IC0", ic_overlay("2001-01-01T00:00:00", n_forward_steps=5)
+            ),
+            Experiment("run-IC2", ic_overlay("2003-01-01T00:00:00")),
+        ],
+    )
+    experiments, batches = batch_initial_conditions(script, script.select())
+    assert [e.name for e in experiments] == ["run-IC0_1_2", "other-IC0"]
+    (batch,) = batches
+    assert batch.members == [
+        BatchMember("run-IC0", "2001-01-01T00:00:00", 0),
+        BatchMember("run-IC1", "2002-01-01T00:00:00", 1),
+        BatchMember("run-IC2", "2003-01-01T00:00:00", 2),
+    ]
+    assert batch.experiment.overlay["loader"]["start_indices"]["times"] == [
+        "2001-01-01T00:00:00",
+        "2002-01-01T00:00:00",
+        "2003-01-01T00:00:00",
+    ]
+
+
+def test_batch_initial_conditions_max_batch_size(make_script):
+    script = make_script(BASE_CONFIG, get_ic_experiments(3))
+    experiments, batches = batch_initial_conditions(
+        script, script.select(), max_batch_size=2
+    )
+    assert [e.name for e in experiments] == ["run-IC0_1", "run-IC2"]
+    assert len(batches) == 1
+
+
+def test_batch_initial_conditions_skips_runs_with_wandb_id(make_script):
+    script = make_script(
+        BASE_CONFIG,
+        [
+            Experiment("run-IC0", ic_overlay("2001-01-01T00:00:00"), wandb_id="abc"),
+            Experiment("run-IC1", ic_overlay("2002-01-01T00:00:00")),
+        ],
+    )
+    experiments, batches = batch_initial_conditions(script, script.select())
+    assert [e.name for e in experiments] == ["run-IC0", "run-IC1"]
+    assert batches == []
+
+
+def test_batch_perturbations(make_script):
+    base_config = {"n_forward_steps": 100, "forcing_loader": {"num_data_workers": 1}}
+    script = make_script(
+        base_config,
+        [
+            Experiment(
+                f"run-{amplitude}K-IC0",
+                {"forcing_loader": {"perturbations": {"amplitude": amplitude}}},
+            )
+            for amplitude in (0, 2)
+        ]
+        + [Experiment("run-IC0", {})],
+    )
+    experiments = batch_perturbations(script, script.select())
+    assert [e.name for e in experiments] == ["run-0_2K-IC0", "run-IC0"]
+    members = experiments[0].perturbation_members
+    assert [(m.name, m.perturbations) for m in members] == [
+        ("run-0K-IC0", {"amplitude": 0}),
+        ("run-2K-IC0", {"amplitude": 2}),
+    ]
+
+
+def test_save_and_load_batch_members(make_script, tmp_path):
+    script = make_script(BASE_CONFIG, get_ic_experiments(2))
+    _, (batch,) = batch_initial_conditions(script, script.select())
+    save_batch(batch, tmp_path / "batches")
+    assert load_batch_members(batch.name, tmp_path / "batches") == batch.members
+    assert load_batch_members("unknown", tmp_path / "batches") is None
+
+
+@pytest.mark.parametrize(
+    "selected, split_expected",
+    [(["run-IC1", "run-IC0"], True), (["run-IC1"], True), (["other"], False)],
+)
+def test_split_uses_saved_members(
+    make_script, tmp_path, monkeypatch, selected, split_expected
+):
+    monkeypatch.setenv("ACE2_LAUNCH_CACHE_DIR", str(tmp_path / "cache"))
+    script = make_script(BASE_CONFIG, get_ic_experiments(2))
+    _, (batch,) = batch_initial_conditions(script, script.select())
+    save_batch(batch)
+    (tmp_path / "results" / batch.name).mkdir(parents=True)
+    (tmp_path / "results" / "not-a-batch").mkdir()
+    split = {}
+
+    def split_batch_results(results_dir, members, output_dir):
+        split[results_dir.name] = members
+        return {}
+
+    monkeypatch.setattr(cli, "split_batch_results", split_batch_results)
+    # not batched as they were at submission, which split must not depend on
+    experiments = [Experiment(name, {}) for name in selected]
+    cli.split_batches(experiments, str(tmp_path / "results"), str(tmp_path / "out"))
+    assert split == ({batch.name: batch.members} if split_expected else {})
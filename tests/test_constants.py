@@ -0,0 +1,81 @@
+"""Checks that the constants select the same runs from wandb_ids.yaml as the
+name prefixes which selected them before the run registry."""
+
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+NOTEBOOKS_DIR = Path(__file__).resolve().parents[1] / "notebooks"
+
+# name prefixes which selected the runs of each constant by IC before the
+# registry
+LEGACY_PREFIXES = {
+    "ERA5_BEST_INFERENCE_10YR_WANDB_RUN_IDS": "era5-co2-10yr-RS2-IC",
+    "ERA5_BEST_INFERENCE_81YR_WANDB_RUN_IDS": "era5-co2-81yr-RS2-IC",
+    "ERA5_BEST_INFERENCE_1YR_WANDB_RUN_IDS": "era5-co2-1yr-2020-RS2-IC",
+    "SHiELD_AMIP_1DEG_BEST_INFERENCE_10YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-10yr-IC"
+    ),
+    "SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS0_10YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-10yr-RS0-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS0_81YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-RS0-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS1_10YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-10yr-RS1-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS1_81YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-RS1-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS3_10YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-10yr-RS3-IC"
+    ),
+    "SHiELD_AMIP_1DEG_RS3_81YR_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-RS3-IC"
+    ),
+    "CLIMSST_DEG_10YR_WANDB_RUN_IDS": "shield-amip-1deg-ace-climsst-inference-10yr-IC",
+    "CLIMSST_DEG_81YR_WANDB_RUN_IDS": "shield-amip-1deg-ace-climsst-inference-81yr-IC",
+    "SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_FIXEDCO2_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-fixedCO2-IC"
+    ),
+    "SHiELD_AMIP_1DEG_BEST_INFERENCE_81YR_NOCO2_WANDB_RUN_IDS": (
+        "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC"
+    ),
+}
+
+
+def get_runs_subset_legacy(all_runs, name_key):
+    """Select runs by name prefix as before the registry, where later names
+    in sorted order replace earlier names of the same IC."""
+    return {
+        f"IC{k.split(name_key)[1][:1]}": v
+        for k, v in all_runs.items()
+        if k.startswith(name_key)
+    }
+
+
+@pytest.fixture(scope="module")
+def wandb_ids():
+    with open(NOTEBOOKS_DIR / "wandb_ids.yaml") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.fixture(scope="module")
+def constants():
+    # constants reads ./wandb_ids.yaml when imported, as in the notebooks
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(NOTEBOOKS_DIR)
+        sys.modules.pop("constants", None)
+        yield importlib.import_module("constants")
+
+
+@pytest.mark.parametrize("name, prefix", LEGACY_PREFIXES.items())
+def test_constant_selects_legacy_runs(constants, wandb_ids, name, prefix):
+    assert getattr(constants, name) == get_runs_subset_legacy(wandb_ids, prefix)
@@ -0,0 +1,114 @@
+import pytest
+
+from ace2_launch.estimate import RunLedger, RunRecord, estimate_cost
+from ace2_launch.planning import (
+    MAX_FORWARD_STEPS_IN_MEMORY,
+    STEPS_PER_YEAR,
+    estimate_output_bytes,
+    parse_bytes,
+    parse_grid,
+    plan_memory,
+)
+
+NO_OUTPUT = {"save_prediction_files": False, "save_monthly_files": False}
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [("50GiB", 50 * 2**30), ("100GB", 100 * 10**9), ("1.5 kB", 1500), ("7", 7)],
+)
+def test_parse_bytes(size, expected):
+    assert parse_bytes(size) == expected
+
+
+def test_parse_bytes_rejects_unknown_unit():
+    with pytest.raises(ValueError):
+        parse_bytes("5 parsecs")
+
+
+def test_parse_grid():
+    assert parse_grid("1deg") == (180, 360)
+    assert parse_grid("10x20") == (10, 20)
+    with pytest.raises(ValueError):
+        parse_grid("2deg")
+
+
+def test_estimate_output_bytes():
+    data_writer = {"names": ["a", "b"], "time_coarsen": {"coarsen_factor": 4}}
+    # 10 coarsened times and 1 month of 2 variables for 3 samples
+    assert estimate_output_bytes(data_writer, 40, 3, 100, 60) == (10 + 1) * 3 * 2 * 100
+
+
+def test_plan_memory_splits_into_whole_years():
+    config = {"n_forward_steps": 10 * STEPS_PER_YEAR, "data_writer": NO_OUTPUT}
+    plan = plan_memory(
+        "run", config, (10, 10), "50GiB", segments=10, max_segment_years=30
+    )
+    # at least 4 segments of at most 30 years, which divide 100 years evenly
+    assert plan.n_segments == 4
+    assert plan.steps_per_segment == 25 * STEPS_PER_YEAR
+    assert plan.forward_steps_in_memory == MAX_FORWARD_STEPS_IN_MEMORY
+    assert plan.overlay == {
+        "forward_steps_in_memory": MAX_FORWARD_STEPS_IN_MEMORY,
+        "n_forward_steps": 25 * STEPS_PER_YEAR,
+    }
+
+
+def test_plan_memory_splits_output_into_whole_steps():
+    config = {
+        "n_forward_steps": 1000,
+        "data_writer": {"names": ["a"], "save_monthly_files": False},
+    }
+    # 400 kB of predictions on a 10x10 grid, at most 150 kB per segment
+    plan = plan_memory(
+        "run", config, (10, 10), "50GiB", segments=1, max_segment_output="150kB"
+    )
+    assert (plan.n_segments, plan.steps_per_segment) == (4, 250)
+    assert plan.output_bytes_per_segment == 100_000
+    assert plan.warnings == []
+
+
+def test_plan_memory_warns_if_unsegmented_output_is_too_large():
+    config = {"n_forward_steps": 1000, "data_writer": {"names": ["a"]}}
+    plan = plan_memory("run", config, (10, 10), "50GiB", max_segment_output="1kB")
+    assert plan.n_segments is None
+    assert plan.overlay == {"forward_steps_in_memory": MAX_FORWARD_STEPS_IN_MEMORY}
+    assert len(plan.warnings) == 1
+
+
+def test_plan_memory_fits_steps_in_memory():
+    times = [f"2001-01-{day:02d}T00:00:00" for day in range(1, 21)]
+    config = {
+        "n_forward_steps": 1000,
+        "loader": {"start_indices": {"times": times}, "num_data_workers": 1},
+        "data_writer": NO_OUTPUT,
+    }
+    plan = plan_memory("run", config, (180, 360), "50GiB")
+    assert plan.n_samples == 20
+    assert 1 <= plan.forward_steps_in_memory < MAX_FORWARD_STEPS_IN_MEMORY
+    assert plan.host_bytes <= parse_bytes("50GiB")
+    assert plan.gpu_bytes <= parse_bytes("80GiB")
+
+
+def test_estimate_cost():
+    config = {
+        "n_forward_steps": 1800,
+        "loader": {"start_indices": {"times": ["a", "b"]}},
+        "data_writer": NO_OUTPUT,
+    }
+    estimate = estimate_cost("run", config, (10, 10), 2.0, segments=3, gpu_count=4)
+    assert (estimate.n_samples, estimate.n_steps) == (2, 5400)
+    assert estimate.wall_hours == pytest.approx(2 * 5400 / 2.0 / 3600)
+    assert estimate.gpu_hours == pytest.approx(4 * estimate.wall_hours)
+    assert estimate.output_bytes == 0
+
+
+def test_run_ledger_throughput(tmp_path):
+    ledger = RunLedger(tmp_path / "runs.jsonl")
+    assert ledger.get_throughput(180 * 360) == (1.7, 0)
+    # scaled from the 1 degree default by grid points
+    assert ledger.get_throughput(90 * 180) == (pytest.approx(4 * 1.7), 0)
+    for wall_hours in (1.0, 2.0, 4.0):
+        ledger.add(RunRecord("run", 100, 1, 3600, wall_hours))
+    ledger.add(RunRecord("other-grid", 200, 1, 3600, 100.0))
+    assert ledger.get_throughput(100) == (0.5, 3)
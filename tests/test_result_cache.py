@@ -0,0 +1,184 @@
+import functools
+import http.server
+import io
+import os
+import threading
+
+import pytest
+
+from result_cache import (
+    BeakerRangeSource,
+    HTTPRangeSource,
+    RangedFile,
+    RangeRequestHandler,
+    RangeSource,
+    ResultFileCache,
+)
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+class MemoryRangeSource(RangeSource):
+    def __init__(self, files):
+        self.files = files
+        self.reads = []
+
+    def size(self, dataset_id, path):
+        return len(self.files[dataset_id, path])
+
+    def read(self, dataset_id, path, offset, length):
+        self.reads.append((offset, length))
+        return self.files[dataset_id, path][offset : offset + length]
+
+
+def get_ranged_file(data: bytes, block_size: int):
+    blocks = []
+
+    def get_block(index):
+        blocks.append(index)
+        return data[index * block_size : (index + 1) * block_size]
+
+    return RangedFile(get_block, len(data), block_size), blocks
+
+
+@pytest.mark.parametrize(
+    "offset, length", [(0, 10), (0, 1000), (95, 10), (250, 5000), (10230, 100)]
+)
+def test_ranged_file_read(offset, length):
+    f, _ = get_ranged_file(DATA, 100)
+    f.seek(offset)
+    assert f.read(length) == DATA[offset : offset + length]
+    assert f.tell() == min(offset + length, len(DATA))
+
+
+def test_ranged_file_seek_and_read_past_end():
+    f, blocks = get_ranged_file(DATA, 100)
+    assert f.seek(-5, io.SEEK_END) == len(DATA) - 5
+    assert f.read() == DATA[-5:]
+    assert f.read(10) == b""
+    f.seek(10)
+    assert f.seek(20, io.SEEK_CUR) == 30
+    assert f.read(10) == DATA[30:40]
+    with pytest.raises(ValueError):
+        f.seek(0, 3)
+    # the partial last block, then the first one
+    assert blocks == [102, 0]
+
+
+def test_ranged_file_reuses_last_block():
+    f, blocks = get_ranged_file(DATA, 100)
+    for _ in range(10):
+        f.read(10)
+    assert blocks == [0]
+    assert io.BufferedReader(f).read() == DATA[100:]
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatasetClient:
+    def __init__(self):
+        self.streams = []
+
+    def stream_file(self, dataset_id, path, offset=0, length=-1, **kwargs):
+        # like beaker-py, ignore the range when the offset is 0
+        data = DATA if offset == 0 else DATA[offset : offset + length]
+        chunk_size = kwargs.get("chunk_size", 1000)
+        stream = FakeStream(
+            data[i : i + chunk_size] for i in range(0, len(data), chunk_size)
+        )
+        self.streams.append(stream)
+        return stream
+
+
+class FakeBeakerClient:
+    def __init__(self):
+        self.dataset = FakeDatasetClient()
+
+
+@pytest.mark.parametrize("offset, length", [(0, 100), (0, len(DATA)), (4000, 100)])
+def test_beaker_range_source_read(offset, length):
+    source = BeakerRangeSource()
+    source._client = FakeBeakerClient()
+    assert source.read("ds", "file.nc", offset, length) == DATA[offset:][:length]
+    (stream,) = source._client.dataset.streams
+    assert stream.closed
+
+
+def test_open_ranged_caches_blocks(tmp_path):
+    source = MemoryRangeSource({("ds", "file.nc"): DATA})
+    cache = ResultFileCache(tmp_path, range_source=source, block_size=1000)
+    with cache.open_ranged("ds", "file.nc") as f:
+        f.seek(1500)
+        assert f.read(1000) == DATA[1500:2500]
+    assert source.reads == [(1000, 1000), (2000, 1000)]
+    with cache.open_ranged("ds", "file.nc") as f:
+        f.seek(9500)
+        assert f.read() == DATA[9500:]
+        f.seek(1900)
+        assert f.read(200) == DATA[1900:2100]
+    assert source.reads[2:] == [(9000, 1000), (10000, 240)]
+    assert (cache.stats.hits, cache.stats.misses) == (2, 4)
+
+
+def test_open_ranged_opens_cached_file(tmp_path):
+    def fetch(dataset_id, path, f):
+        f.write(DATA)
+
+    source = MemoryRangeSource({})
+    cache = ResultFileCache(tmp_path, fetch=fetch, range_source=source)
+    cache.get_path("ds", "file.nc")
+    with cache.open_ranged("ds", "file.nc") as f:
+        assert f.read() == DATA
+    assert source.reads == []
+
+
+def test_eviction_keeps_cache_under_cap(tmp_path, monkeypatch):
+    def fetch(dataset_id, path, f):
+        f.write(DATA[:100])
+
+    cache = ResultFileCache(tmp_path, max_bytes=10_000, fetch=fetch)
+    walks = []
+    list_files = cache._list_files
+    monkeypatch.setattr(
+        cache, "_list_files", lambda: walks.append(None) or list_files()
+    )
+    for i in range(200):
+        path = cache.get_path("ds", f"{i}.nc")
+        # files are evicted least recently used first, but never the new one
+        os.utime(path, (i, i))
+        assert path.exists()
+        assert cache._total_bytes <= 10_000
+    # once at the first insert, then each time the cap is passed, which
+    # evicting below the cap leaves room for ten files before
+    assert len(walks) == 11
+    assert cache.size() <= 10_000
+    assert cache.stats.bytes_evicted == 20_000 - cache.size()
+
+
+def test_http_range_source(tmp_path):
+    (tmp_path / "ds").mkdir()
+    (tmp_path / "ds" / "file.nc").write_bytes(DATA)
+    handler = functools.partial(RangeRequestHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        source = HTTPRangeSource(f"http://localhost:{server.server_address[1]}/")
+        assert source.size("ds", "file.nc") == len(DATA)
+        assert source.read("ds", "file.nc", 0, 100) == DATA[:100]
+        assert source.read("ds", "file.nc", 10200, 100) == DATA[10200:]
+    finally:
+        server.shutdown()
+        server.server_close()
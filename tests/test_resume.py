@@ -0,0 +1,70 @@
+import pytest
+
+from ace2_launch import Experiment
+from ace2_launch.resume import LocalResultStore, get_completed_segments, plan_resume
+
+
+def write_result(store_dir, result_id, n_segments):
+    for i in range(n_segments):
+        segment_dir = store_dir / result_id / f"segment_{i:04d}"
+        segment_dir.mkdir(parents=True)
+        (segment_dir / "restart.nc").touch()
+
+
+def test_get_completed_segments_counts_consecutive_restarts():
+    paths = [
+        "segment_0000/restart.nc",
+        "segment_0001/restart.nc",
+        "segment_0001/autoregressive_predictions.nc",
+        "segment_0003/restart.nc",
+        "segment_0002/monthly_mean_predictions.nc",
+    ]
+    assert get_completed_segments(paths) == 2
+    assert get_completed_segments(["segment_0001/restart.nc"]) == 0
+
+
+def test_plan_resume_uses_most_complete_result(make_script, tmp_path):
+    script = make_script({"n_forward_steps": 10}, [], segments=5)
+    store = LocalResultStore(tmp_path / "results")
+    write_result(tmp_path / "results", "run/job0", 1)
+    write_result(tmp_path / "results", "run-resume-segment_0001/job0", 3)
+    write_result(tmp_path / "results", "run-other/job0", 4)
+    plan = plan_resume(script, Experiment("run", {}), store)
+    assert (plan.n_segments, plan.n_completed) == (5, 3)
+    assert plan.result_id == "run-resume-segment_0001/job0"
+    continuation = plan.get_continuation()
+    assert continuation.name == "run-resume-segment_0003"
+    assert continuation.wandb_name == "run"
+    assert continuation.resume.result_dataset_id == plan.result_id
+    assert continuation.resume.segment_dirs == [
+        "segment_0000",
+        "segment_0001",
+        "segment_0002",
+    ]
+
+
+def test_plan_resume_of_complete_run(make_script, tmp_path):
+    script = make_script({"n_forward_steps": 10}, [], segments=2)
+    write_result(tmp_path / "results", "run/job0", 2)
+    plan = plan_resume(
+        script, Experiment("run", {}), LocalResultStore(tmp_path / "results")
+    )
+    assert plan.is_complete
+    with pytest.raises(ValueError):
+        plan.get_continuation()
+
+
+def test_plan_resume_without_results(make_script, tmp_path):
+    script = make_script({"n_forward_steps": 10}, [], segments=2)
+    plan = plan_resume(
+        script, Experiment("run", {}), LocalResultStore(tmp_path / "results")
+    )
+    assert plan.n_completed == 0
+    with pytest.raises(ValueError):
+        plan.get_continuation()
+
+
+def test_plan_resume_requires_segments(make_script, tmp_path):
+    script = make_script({"n_forward_steps": 10}, [])
+    with pytest.raises(ValueError):
+        plan_resume(script, Experiment("run", {}), LocalResultStore(tmp_path))
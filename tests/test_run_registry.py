@@ -0,0 +1,77 @@
+import pytest
+import yaml
+
+from run_registry import RunKey, RunRegistry, load_registry, parse_run_name
+
+WANDB_IDS = {
+    "shield-amip-1deg-ace2-inference-81yr-RS2-IC1": "b",
+    "shield-amip-1deg-ace2-inference-81yr-RS2-IC0": "a",
+    "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC0": "c",
+    "shield-amip-1deg-ace2-inference-10yr-RS2-IC0": "d",
+    "era5-co2-10yr-RS2-IC0-ni": "e",
+    "era5-co2-10yr-RS2-IC0-monthly-output": None,
+}
+
+
+@pytest.mark.parametrize(
+    "name, key",
+    [
+        (
+            "shield-amip-1deg-ace2-inference-81yr-noCO2-RS1-IC2",
+            RunKey("ace2-shield", "shield-amip-1deg", "81yr", 1, 2, "noCO2"),
+        ),
+        (
+            "era5-co2-10yr-RS2-IC0-monthly-output",
+            RunKey("ace2-era5", "era5", "10yr", 2, 0, "monthly-output"),
+        ),
+        (
+            "era5-ace2-inference-perturbed-30yr-ms2-0p0-IC0",
+            RunKey("ace2-era5", "era5", "30yr", None, 0, "perturbed-ms2-0p0"),
+        ),
+        ("unknown-model-5day", RunKey("unknown-model", None, "5day")),
+    ],
+)
+def test_parse_run_name(name, key):
+    assert parse_run_name(name) == key
+
+
+def test_select_orders_by_seed_and_ic():
+    registry = RunRegistry.from_wandb_ids(WANDB_IDS)
+    runs = registry.select(model="ace2-shield", duration="81yr")
+    assert [run.wandb_id for run in runs] == ["c", "a", "b"]
+    assert registry.select(model="ace2-shield", duration="81yr", rs=2, variant="") == (
+        runs[1:]
+    )
+
+
+def test_select_rejects_unknown_fields():
+    with pytest.raises(TypeError):
+        RunRegistry.from_wandb_ids(WANDB_IDS).select(seed=2)
+
+
+def test_ids_by_ic():
+    registry = RunRegistry.from_wandb_ids(WANDB_IDS)
+    assert registry.ids_by_ic(model="ace2-era5", duration="10yr", variant="ni") == {
+        "IC0": "e"
+    }
+    # leaving out the variant selects two runs of IC0
+    with pytest.raises(ValueError):
+        registry.ids_by_ic(model="ace2-era5", duration="10yr")
+
+
+def test_runs_with_the_same_key_are_rejected():
+    with pytest.raises(ValueError):
+        RunRegistry.from_wandb_ids(
+            {"era5-co2-10yr-RS2-IC0": "a", "era5-co2-10yr-rs2-IC0": "b"}
+        )
+
+
+def test_load_registry_caches_until_the_file_changes(tmp_path):
+    path = tmp_path / "wandb_ids.yaml"
+    path.write_text(yaml.safe_dump(WANDB_IDS))
+    registry = load_registry(str(path), cache_dir=str(tmp_path / "cache"))
+    assert registry["era5-co2-10yr-RS2-IC0-ni"] == "e"
+    assert load_registry(str(path), cache_dir=str(tmp_path / "cache")) is registry
+    path.write_text(yaml.safe_dump({**WANDB_IDS, "era5-co2-10yr-RS2-IC0-ni": "f"}))
+    registry = load_registry(str(path), cache_dir=str(tmp_path / "cache"))
+    assert registry["era5-co2-10yr-RS2-IC0-ni"] == "f"
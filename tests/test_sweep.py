@@ -0,0 +1,52 @@
+from ace2_launch import Experiment
+from ace2_launch.sweep import (
+    DEFAULT_BATCH_SIZES,
+    get_config_points,
+    get_sweep_experiments,
+    get_sweep_points,
+)
+
+BASE_CONFIG = {"n_forward_steps": 100, "loader": {"num_data_workers": 1}}
+
+
+def test_batch_sizes_collapse_without_start_times():
+    points = get_sweep_points((4, 8), (10,), DEFAULT_BATCH_SIZES)
+    assert [point.label for point in get_config_points(BASE_CONFIG, points)] == [
+        "w4-m10-b1",
+        "w8-m10-b1",
+    ]
+
+
+def test_default_sweep_of_config_without_start_times(make_script):
+    script = make_script(BASE_CONFIG, [Experiment("run", {})])
+    benchmarks = get_sweep_experiments(
+        script, Experiment("run", {}), get_sweep_points((4,), (10, 40)), 50
+    )
+    assert [benchmark.name for benchmark, _ in benchmarks] == [
+        "run-sweep-w4-m10-b1",
+        "run-sweep-w4-m40-b1",
+    ]
+    configs = [benchmark.overlay for benchmark, _ in benchmarks]
+    assert [config["n_forward_steps"] for config in configs] == [50, 80]
+    assert [config["loader"]["num_data_workers"] for config in configs] == [4, 4]
+
+
+def test_sweep_batches_start_times(make_script):
+    config = {
+        **BASE_CONFIG,
+        "loader": {"start_indices": {"times": ["2001-01-01T00:00:00"]}},
+    }
+    script = make_script(config, [Experiment("run", {})])
+    benchmarks = get_sweep_experiments(
+        script, Experiment("run", {}), get_sweep_points((4,), (10,), (1, 2))
+    )
+    assert [
+        benchmark.overlay["loader"]["start_indices"]["times"]
+        for benchmark, _ in benchmarks
+    ] == [
+        ["2001-01-01T00:00:00"],
+        ["2001-01-01T00:00:00", "2001-01-02T00:00:00"],
+    ]
+    assert {benchmark.wandb_run_group for benchmark, _ in benchmarks} == {
+        "run-sweep"
+    }